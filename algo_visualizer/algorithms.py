@@ -1,268 +1,635 @@
 # algorithms.py
 
 import time
-import sys
+import random
+
+# 關鍵影格間隔的下限；間隔取 n 時，快照的成本 (n 個數值) 平均分攤到每一步只多一個數值
+KEYFRAME_MIN_INTERVAL = 64
+
+def default_keyframe_interval(n):
+    return max(KEYFRAME_MIN_INTERVAL, n)
+
+# 設定步驟數、時間上限或取消旗標時，每隔這麼多步檢查一次
+LIMIT_CHECK_INTERVAL = 4096
+
+
+class BudgetExceeded(Exception):
+    """排序超過步驟數 (reason 為 'steps') 或時間 (reason 為 'timeout') 上限、或被取消 (reason 為 'cancelled') 而中止"""
+
+    def __init__(self, reason, steps):
+        super().__init__(reason, steps)
+        self.reason = reason
+        self.steps = steps
+
+
+# 輔助類別：記錄動畫步驟
+class StepRecorder:
+    """
+    以差量 (delta) 格式產生排序動畫步驟，並保存排序過程的計數。
+
+    前端以回傳的 original_data 作為初始陣列，之後每一步只帶上
+    自上一步以來的寫入 (writes: [[索引, 新值], ...]) 與各種標示，
+    不再重複整個陣列，因此記憶體與回傳大小只隨步驟數成長。
+
+    每 keyframe_interval 步 (第 0、K、2K... 步) 另外附上完整陣列快照 (array: [...])，
+    成為關鍵影格；跳到任一步時只需從前一個關鍵影格套用最多 K - 1 步的差量。
+    """
+
+    def __init__(self, arr, keyframe_interval=None):
+        self.arr = arr
+        self.comparisons = 0
+        self.swaps = 0
+        self.exe_time = 0
+        self.keyframe_interval = keyframe_interval or default_keyframe_interval(len(arr))
+        self.keyframes = []  # 帶有完整快照的步驟編號
+        self.step_count = 0
+        self.raw_steps = 0  # 演算法產生的步驟數 (包含 BudgetRecorder 捨棄的步驟)
+        self.max_steps = None
+        self.deadline = None
+        self.cancel = None
+        self._next_check = float('inf')
+        self._writes = []  # 尚未附加到步驟上的寫入
+
+    def limit(self, max_steps=None, timeout=None, cancel=None):
+        """
+        設定步驟數與時間 (秒) 上限及取消旗標 (cancel() 回傳 True 時中止)，
+        超過或被取消時 step() 會丟出 BudgetExceeded，中止失控或不再需要的排序。
+        為了不拖慢每一步，只每 LIMIT_CHECK_INTERVAL 步檢查一次時間與取消旗標。
+        """
+        self.max_steps = max_steps
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.cancel = cancel
+        self._next_check = self.raw_steps if max_steps or timeout or cancel else float('inf')
+
+    def _check_limits(self):
+        if self.max_steps and self.raw_steps > self.max_steps:
+            raise BudgetExceeded('steps', self.raw_steps)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded('timeout', self.raw_steps)
+        if self.cancel is not None and self.cancel():
+            raise BudgetExceeded('cancelled', self.raw_steps)
+        self._next_check = self.raw_steps + LIMIT_CHECK_INTERVAL
+        if self.max_steps:
+            self._next_check = min(self._next_check, self.max_steps + 1)
+
+    def write(self, k, value):
+        """寫入 arr[k] 並記錄差量"""
+        self.arr[k] = value
+        self._writes.append([k, value])
+
+    def swap(self, i, j):
+        """交換 arr[i] 與 arr[j] 並記錄差量"""
+        arr = self.arr
+        arr[i], arr[j] = arr[j], arr[i]
+        if i != j:
+            self._writes.append([i, arr[i]])
+            self._writes.append([j, arr[j]])
+
+    def step(self, compared=None, swapped=None, sorted_indices=None, pivot=None, active=None):
+        """建立一個動畫步驟，並附上自上一步以來的寫入"""
+        self.raw_steps += 1
+        if self.raw_steps >= self._next_check:
+            self._check_limits()
+        return self._build_step(compared, swapped, sorted_indices, pivot, active)
+
+    def _build_step(self, compared=None, swapped=None, sorted_indices=None, pivot=None, active=None):
+        step = {}
+        if self._writes:
+            step['writes'] = self._writes   # 這一步之前發生的寫入
+            self._writes = []
+        if compared is not None:
+            step['compared'] = compared     # 標示被比較的索引 (例如 [j, j+1])
+        if swapped is not None:
+            step['swapped'] = swapped       # 標示被交換的索引 (例如 [j, j+1])
+        if sorted_indices is not None:
+            step['sorted_indices'] = sorted_indices # 標示已排序完成的索引
+        if pivot is not None:
+            step['pivot'] = pivot           # 標示快速排序的基準點索引
+        if active is not None:
+            step['active'] = active         # 標示當前活躍的索引 (例如插入排序的插入位置)
+        if self.step_count % self.keyframe_interval == 0:
+            step['array'] = list(self.arr)  # 關鍵影格：套用這一步的寫入後的完整陣列
+            self.keyframes.append(self.step_count)
+        self.step_count += 1
+        return step
+
+    def finish(self):
+        """排序結束時呼叫；回傳尚未送出的最後一步 (沒有則為 None)"""
+        return None
+
+
+class MetricsRecorder(StepRecorder):
+    """
+    只計數、不記錄步驟的 recorder (metrics only 模式)。
+
+    搭配各演算法的計數版本 (METRICS_SORTS，例如 bubble_sort_metrics) 使用：
+    演算法與比較、交換的計數都和步驟產生器相同，但不建立步驟、不保留寫入差量，
+    也不經過產生器，量到的時間反映演算法本身而非動畫紀錄的成本。
+    limit() 的檢查以比較加交換次數代替步驟數，在 add() 中進行。
+    """
+
+    def add(self, comparisons, swaps):
+        """累加一段排序 (一輪、一次分割或合併) 的比較與交換次數"""
+        self.comparisons += comparisons
+        self.swaps += swaps
+        self.raw_steps += comparisons + swaps
+        if self.raw_steps >= self._next_check:
+            self._check_limits()
+
+
+class BudgetRecorder(StepRecorder):
+    """
+    有影格預算 (max_frames) 的 recorder：排序進行中就捨棄或合併步驟，
+    步驟數、記憶體與回傳大小都受預算限制，而不是隨演算法的步驟數成長。
+
+    原始步驟每 stride 個分成一個區段，每個區段最多保留一步：
+    區段內第一個有交換、或已排序區間與上一個保留步驟不同 (進入新的一輪) 的步驟；
+    都沒有時保留區段的最後一步。因此被捨棄的大多是單純的比較。
+    被捨棄步驟的寫入會合併 (同一索引只留最後的值) 到下一個保留的步驟。
+
+    stride 依 expected_steps (預估的原始步驟數) 決定；預估偏低、保留的步驟用完預算時
+    stride 加倍、剩餘預算減半，總影格數不超過 max_frames 的兩倍左右。
+    """
+
+    def __init__(self, arr, max_frames, expected_steps=None, keyframe_interval=None):
+        super().__init__(arr, keyframe_interval)
+        self.max_frames = max_frames
+        self.stride = max(1, -(-(expected_steps or 0) // max_frames))
+        self.dropped = 0
+        self._pending = {}  # 被捨棄步驟的寫入：索引 -> 最後寫入的值
+        self._window_start = 0
+        self._window_kept = False
+        self._last_sorted = None
+        self._last_dropped = None
+        self._budget = max_frames
+        self._budget_used = 0
+
+    def write(self, k, value):
+        self.arr[k] = value
+        self._pending[k] = value
+
+    def swap(self, i, j):
+        arr = self.arr
+        arr[i], arr[j] = arr[j], arr[i]
+        if i != j:
+            self._pending[i] = arr[i]
+            self._pending[j] = arr[j]
+
+    def step(self, compared=None, swapped=None, sorted_indices=None, pivot=None, active=None):
+        c = self.raw_steps
+        self.raw_steps += 1
+        if self.raw_steps >= self._next_check:
+            self._check_limits()
+        if c - self._window_start >= self.stride:
+            self._window_start = c
+            self._window_kept = False
+
+        keep = False
+        if not self._window_kept:
+            keep = (swapped is not None
+                    or c - self._window_start == self.stride - 1
+                    or (sorted_indices is not None and sorted_indices is not self._last_sorted
+                        and sorted_indices != self._last_sorted))
+        if not keep:
+            self.dropped += 1
+            self._last_dropped = (compared, swapped, sorted_indices, pivot, active)
+            return None
+
+        self._window_kept = True
+        self._last_dropped = None
+        if sorted_indices is not None:
+            self._last_sorted = sorted_indices
+        self._budget_used += 1
+        if self._budget_used >= self._budget:
+            # 預估的步驟數偏低，之後的區段加倍
+            self.stride *= 2
+            self._budget = max(1, self._budget // 2)
+            self._budget_used = 0
+        return self._emit(compared, swapped, sorted_indices, pivot, active)
+
+    def finish(self):
+        # 最後被捨棄的步驟帶有排序結束時的標示，連同尚未送出的寫入補送出去
+        if self._last_dropped is not None:
+            self.dropped -= 1
+            args, self._last_dropped = self._last_dropped, None
+            return self._emit(*args)
+        if self._pending:
+            return self._emit()
+        return None
+
+    def _emit(self, *args):
+        if self._pending:
+            self._writes = [[k, v] for k, v in self._pending.items()]
+            self._pending = {}
+        return self._build_step(*args)
+
+
+# 已排序與活躍索引以「區間列表」表示：[[lo, hi], ...]，兩端皆包含。
+# 連續區段只需一個區間，建立步驟與回傳大小都是 O(1)，不必每步展開成 O(n) 的列表。
+def _span(lo, hi):
+    """lo 到 hi (含) 的區間；空區間回傳 []"""
+    return [[lo, hi]] if lo <= hi else []
+
+def _points(*indices):
+    """把少數幾個零散索引轉成區間列表"""
+    return [[k, k] for k in indices]
+
+class SortedTracker:
+    """
+    追蹤快速排序中已確定位置的索引。
+
+    以 bytearray 做 O(1) 的成員判斷，並同時維護合併後的區間。
+    區間快照只在有新索引加入時重建，之後的步驟共用同一份不再修改的列表，
+    舊步驟不會被之後的標記改寫，也不必每一步重新計算。
+    """
+
+    def __init__(self, n):
+        self._marked = bytearray(n)
+        self._starts = {}  # 區間起點 -> 終點
+        self._ends = {}    # 區間終點 -> 起點
+        self._snapshot = []
+
+    def __contains__(self, k):
+        return bool(self._marked[k])
+
+    def add(self, k):
+        """標記 k 為已排序；已經標記過則回傳 False"""
+        if self._marked[k]:
+            return False
+        self._marked[k] = 1
+
+        # 與左右相鄰的區間合併
+        lo = hi = k
+        if k - 1 in self._ends:
+            lo = self._ends.pop(k - 1)
+        if k + 1 in self._starts:
+            hi = self._starts.pop(k + 1)
+            del self._ends[hi]
+        self._starts[lo] = hi
+        self._ends[hi] = lo
+
+        self._snapshot = None
+        return True
+
+    def add_range(self, lo, hi):
+        """標記 lo 到 hi (含) 為已排序"""
+        for k in range(lo, hi + 1):
+            self.add(k)
+
+    def intervals(self):
+        """目前已排序索引的區間列表快照 (呼叫端不可修改)"""
+        if self._snapshot is None:
+            self._snapshot = [[lo, self._starts[lo]] for lo in sorted(self._starts)]
+        return self._snapshot
 
-sys.setrecursionlimit(2000)
 
-# 輔助函式：記錄動畫步驟
-def record_step(arr, animation_steps, compared=None, swapped=None, sorted_indices=None, pivot=None, active=None):
-    step = {
-        'array': list(arr),   # 紀錄當前陣列狀態
-        'compared': compared, # 標示被比較的索引 (例如 [j, j+1])
-        'swapped': swapped,   # 標示被交換的索引 (例如 [j, j+1])
-        'sorted_indices': sorted_indices, # 標示已排序完成的索引
-        'pivot': pivot,       # 標示快速排序的基準點索引
-        'active': active      # 標示當前活躍的索引 (例如插入排序的插入位置)
-    }
-    animation_steps.append(step)
+# ==================================
+# -------------執行排序--------------
+# ==================================
+# 每個排序演算法都寫成「步驟產生器」：接收 StepRecorder，邊排序邊 yield 動畫步驟。
+# run_sort 一次收集所有步驟 (collect_steps 可改用呼叫端建立的 recorder)；iter_sort 則讓呼叫端 (例如串流回應) 逐步取用。
+# record=False 時改以 MetricsRecorder 執行同一演算法的計數版本 (METRICS_SORTS)，
+# 只回傳計數與時間，animation_steps 為空列表。
+# keyframe_interval 為關鍵影格的間隔，None 時依陣列大小決定 (見 default_keyframe_interval)。
+# 指定 max_frames 時改用 BudgetRecorder，步驟數受影格預算限制；expected_steps 為預估的原始步驟數。
+# 其餘關鍵字參數 (例如快速排序的 pivot) 直接交給步驟產生器或計數版本。
+def make_recorder(array, record=True, keyframe_interval=None, max_frames=None, expected_steps=None):
+    if not record:
+        return MetricsRecorder(list(array))
+    if max_frames:
+        return BudgetRecorder(list(array), max_frames, expected_steps, keyframe_interval)
+    return StepRecorder(list(array), keyframe_interval)
+
+
+def run_sort(step_func, array, record=True, keyframe_interval=None, max_frames=None, expected_steps=None, **options):
+    recorder = make_recorder(array, record, keyframe_interval, max_frames, expected_steps)
+    animation_steps = collect_steps(step_func, recorder, **options)
+    return recorder.arr, recorder.exe_time, recorder.comparisons, recorder.swaps, animation_steps
+
+
+def collect_steps(step_func, recorder, **options):
+    """以指定的 recorder 執行排序並收集所有動畫步驟，執行時間存入 recorder.exe_time"""
+    start_time = time.perf_counter()
+    if isinstance(recorder, MetricsRecorder):
+        # 只計數時改跑計數版本，不產生任何步驟
+        METRICS_SORTS[step_func](recorder, **options)
+        animation_steps = []
+    elif isinstance(recorder, BudgetRecorder):
+        # 被捨棄的步驟為 None
+        animation_steps = [step for step in step_func(recorder, **options) if step is not None]
+        last_step = recorder.finish()
+        if last_step is not None:
+            animation_steps.append(last_step)
+    else:
+        animation_steps = list(step_func(recorder, **options))
+    end_time = time.perf_counter()
+    recorder.exe_time = (end_time - start_time) * 1000000
+    return animation_steps
+
+
+# iter_sort 的結束標記；BudgetRecorder 捨棄的步驟為 None，不能拿 None 當結束
+_DONE = object()
+
+
+def iter_sort(step_func, recorder, **options):
+    """
+    逐步執行排序並產生動畫步驟。
+
+    執行時間只累計排序本身，不包含呼叫端處理每一步 (例如網路傳送) 的時間，
+    結束後可從 recorder 取得排序結果與計數。
+    """
+    steps = step_func(recorder, **options)
+    elapsed = 0.0
+    while True:
+        start_time = time.perf_counter()
+        step = next(steps, _DONE)
+        elapsed += time.perf_counter() - start_time
+        if step is _DONE:
+            break
+        if step is not None:  # BudgetRecorder 捨棄的步驟
+            yield step
+    last_step = recorder.finish()
+    if last_step is not None:
+        yield last_step
+    recorder.exe_time = elapsed * 1000000
 
 
 # ==================================
 # -------------氣泡排序--------------
 # ==================================
-def bubble_sort(array):
-    arr_copy = list(array)
-    n = len(arr_copy)
-    swaps = 0
-    comparisons = 0
-    animation_steps = []
-    
-    start_time = time.perf_counter()
+def bubble_sort(array, record=True):
+    return run_sort(bubble_sort_steps, array, record)
+
+def bubble_sort_steps(recorder):
+    arr = recorder.arr
+    n = len(arr)
     
     # 紀錄初始狀態
-    record_step(arr_copy, animation_steps)
+    yield recorder.step()
     
     for i in range(n - 1):
         swapped_in_pass = False
-        sorted_indices_in_pass = list(range(n - i, n)) # 紀錄已排序的尾部
+        sorted_indices_in_pass = _span(n - i, n - 1) # 紀錄已排序的尾部
         
         for j in range(0, n - i - 1):
-            comparisons += 1
+            recorder.comparisons += 1
             # 紀錄比較步驟
-            record_step(arr_copy, animation_steps, compared=[j, j+1], sorted_indices=sorted_indices_in_pass)
+            yield recorder.step(compared=[j, j+1], sorted_indices=sorted_indices_in_pass)
             
-            if arr_copy[j] > arr_copy[j + 1]:
-                arr_copy[j], arr_copy[j + 1] = arr_copy[j + 1], arr_copy[j]
-                swaps += 1
+            if arr[j] > arr[j + 1]:
+                recorder.swap(j, j + 1)
+                recorder.swaps += 1
                 swapped_in_pass = True
                 # 紀錄交換步驟
-                record_step(arr_copy, animation_steps, swapped=[j, j+1], sorted_indices=sorted_indices_in_pass)
+                yield recorder.step(swapped=[j, j+1], sorted_indices=sorted_indices_in_pass)
         
         # 每完成一輪，最右邊的元素就確定了
-        sorted_indices_in_pass = list(range(n - i - 1, n)) # 更新已排序的尾部
-        record_step(arr_copy, animation_steps, sorted_indices=sorted_indices_in_pass) # 標記本輪已排序
+        sorted_indices_in_pass = _span(n - i - 1, n - 1) # 更新已排序的尾部
+        yield recorder.step(sorted_indices=sorted_indices_in_pass) # 標記本輪已排序
         
         if not swapped_in_pass:
             break
             
     # 標記所有元素為已排序
-    record_step(arr_copy, animation_steps, sorted_indices=list(range(n)))
-    
-    end_time = time.perf_counter()
-    exe_time = (end_time - start_time) * 1000000
-    
-    return arr_copy, exe_time, comparisons, swaps, animation_steps
+    yield recorder.step(sorted_indices=_span(0, n - 1))
 
 # ==================================
 # -------------插入排序--------------
 # ==================================
-def insertion_sort(array):
-    arr_copy = list(array)
-    length = len(arr_copy)
-    swaps = 0 # 這裡的交換次數可能與移動次數不同，看你如何定義
-    comparisons = 0
-    animation_steps = []
+def insertion_sort(array, record=True):
+    return run_sort(insertion_sort_steps, array, record)
 
-    start_time = time.perf_counter()
+def insertion_sort_steps(recorder):
+    # 這裡的交換次數 (recorder.swaps) 計數為移動次數
+    arr = recorder.arr
+    length = len(arr)
 
-    record_step(arr_copy, animation_steps, active=[0]) # 初始第一個元素視為已排序
+    yield recorder.step(active=_points(0)) # 初始第一個元素視為已排序
 
     for i in range(1, length):
-        key = arr_copy[i]
+        key = arr[i]
         j = i - 1
         
         # 紀錄當前要插入的元素
-        record_step(arr_copy, animation_steps, active=[i], sorted_indices=list(range(i)))
+        yield recorder.step(active=_points(i), sorted_indices=_span(0, i - 1))
 
-        while j >= 0 and key < arr_copy[j]:
-            comparisons += 1
+        while j >= 0 and key < arr[j]:
+            recorder.comparisons += 1
             # 紀錄比較和移動
-            record_step(arr_copy, animation_steps, compared=[j, i], active=[j, i], sorted_indices=list(range(i)))
+            yield recorder.step(compared=[j, i], active=_points(j, i), sorted_indices=_span(0, i - 1))
             
-            arr_copy[j + 1] = arr_copy[j]
-            swaps += 1 # 這裡計數為移動
+            recorder.write(j + 1, arr[j])
+            recorder.swaps += 1 # 這裡計數為移動
             j -= 1
-            record_step(arr_copy, animation_steps, active=[j+1], sorted_indices=list(range(i))) # 紀錄移動後的狀態
+            yield recorder.step(active=_points(j + 1), sorted_indices=_span(0, i - 1)) # 紀錄移動後的狀態
 
-        arr_copy[j + 1] = key
+        recorder.write(j + 1, key)
         # 紀錄插入位置
-        record_step(arr_copy, animation_steps, active=[j+1], sorted_indices=list(range(i+1)))
+        yield recorder.step(active=_points(j + 1), sorted_indices=_span(0, i))
 
 
-    record_step(arr_copy, animation_steps, sorted_indices=list(range(length))) # 標記所有元素為已排序
-    
-    end_time = time.perf_counter()
-    exe_time = (end_time - start_time) * 1000000
-
-    return arr_copy,  exe_time, comparisons, swaps, animation_steps
+    yield recorder.step(sorted_indices=_span(0, length - 1)) # 標記所有元素為已排序
 
 
 # ==================================
 # -------------快速排序--------------
 # ==================================
-# 快速排序由於是遞迴，需要修改輔助函式來傳遞 animation_steps
-def quick_sort(array):
-    arr_copy = list(array)
-    comparisons = [0] # 用列表傳遞，以便在遞迴中修改
-    swaps = [0]
-    animation_steps = []
+# 以明確的堆疊取代遞迴，處理順序與遞迴版本相同 (先左半邊再右半邊)，
+# 因此動畫步驟與計數不變，也不會因為輸入太大或已排序而遇到 RecursionError。
+#
+# 基準點策略 (pivot)：
+#   'last'      取區間最後一個元素 (預設，與原本相同)
+#   'median3'   取頭、中、尾三者的中位數
+#   'random'    隨機挑選
+#   'introsort' 使用 median3，遞迴深度超過 2*log2(n) 時改用堆積排序處理該區間
+PIVOT_STRATEGIES = ('last', 'median3', 'random', 'introsort')
+
+def quick_sort(array, record=True, pivot='last'):
+    return run_sort(quick_sort_steps, array, record, pivot=pivot)
+
+def quick_sort_steps(recorder, pivot='last'):
+    if pivot not in PIVOT_STRATEGIES:
+        raise ValueError(f"無效的基準點策略: {pivot}")
+
+    arr = recorder.arr
+    n = len(arr)
+    sorted_indices = SortedTracker(n)
+    # introsort 的深度上限，超過就表示分割嚴重不平均
+    depth_limit = 2 * n.bit_length() if pivot == 'introsort' else None
     
-    start_time = time.perf_counter()
-    
-    record_step(arr_copy, animation_steps) # 紀錄初始狀態
+    yield recorder.step() # 紀錄初始狀態
     
-    _quick_sort_recursive_with_steps(arr_copy, 0, len(arr_copy) - 1, comparisons, swaps, animation_steps)
+    stack = [(0, n - 1, 0)]
+    while stack:
+        low, high, depth = stack.pop()
+
+        if low < high:
+            if depth_limit is not None and depth > depth_limit:
+                yield from _heap_sort_range_with_steps(arr, low, high, recorder, sorted_indices)
+                continue
+
+            pi = yield from _partition_with_steps(arr, low, high, recorder, sorted_indices, pivot)
+            # 後放入的先處理：先放右半邊，再放左半邊；空區間不會產生任何步驟，直接略過
+            if pi + 1 <= high:
+                stack.append((pi + 1, high, depth + 1))
+            if low <= pi - 1:
+                stack.append((low, pi - 1, depth + 1))
+        elif low == high:
+            # 單一元素，視為已排序
+            if sorted_indices.add(low):
+                yield recorder.step(sorted_indices=sorted_indices.intervals())
     
     # 標記所有元素為已排序
-    record_step(arr_copy, animation_steps, sorted_indices=list(range(len(arr_copy))))
-    
-    end_time = time.perf_counter()
-    exe_time = (end_time - start_time) * 1000000
-    
-    return arr_copy,  exe_time, comparisons[0], swaps[0], animation_steps
-
-def _quick_sort_recursive_with_steps(arr, low, high, comparisons, swaps, animation_steps, sorted_indices=None):
-    if sorted_indices is None:
-        sorted_indices = []
-
-    if low < high:
-        pi = _partition_with_steps(arr, low, high, comparisons, swaps, animation_steps, sorted_indices)
-        _quick_sort_recursive_with_steps(arr, low, pi - 1, comparisons, swaps, animation_steps, sorted_indices)
-        _quick_sort_recursive_with_steps(arr, pi + 1, high, comparisons, swaps, animation_steps, sorted_indices)
-    else:
-        # 單一元素或空區間，視為已排序
-        if low == high and low not in sorted_indices:
-            sorted_indices.append(low)
-            record_step(arr, animation_steps, sorted_indices=sorted_indices)
-
+    yield recorder.step(sorted_indices=_span(0, n - 1))
+
+
+def _choose_pivot(arr, low, high, recorder, pivot):
+    """依策略回傳基準點的索引"""
+    if pivot == 'random':
+        return random.randint(low, high)
+    if pivot in ('median3', 'introsort'):
+        mid = (low + high) // 2
+        a, b, c = arr[low], arr[mid], arr[high]
+        recorder.comparisons += 3 # 三數取中以 3 次比較計
+        if a <= b <= c or c <= b <= a:
+            return mid
+        if b <= a <= c or c <= a <= b:
+            return low
+    return high
+
+
+def _partition_with_steps(arr, low, high, recorder, sorted_indices, pivot='last'):
+    pivot_idx = _choose_pivot(arr, low, high, recorder, pivot)
+    if pivot_idx != high:
+        # 把選到的基準點換到區間尾端，之後照一般的 Lomuto 分割進行
+        recorder.swap(pivot_idx, high)
+        recorder.swaps += 1
+        yield recorder.step(swapped=[pivot_idx, high], pivot=high, sorted_indices=sorted_indices.intervals())
 
-def _partition_with_steps(arr, low, high, comparisons, swaps, animation_steps, sorted_indices):
     pivot_val = arr[high]
     i = low - 1
     
     # 紀錄基準點
-    record_step(arr, animation_steps, pivot=high, active=list(range(low, high + 1)), sorted_indices=sorted_indices)
+    yield recorder.step(pivot=high, active=_span(low, high), sorted_indices=sorted_indices.intervals())
 
     for j in range(low, high):
-        comparisons[0] += 1
+        recorder.comparisons += 1
         # 紀錄比較
-        record_step(arr, animation_steps, compared=[j, high], active=[i + 1, j], pivot=high, sorted_indices=sorted_indices)
+        yield recorder.step(compared=[j, high], active=_points(i + 1, j), pivot=high, sorted_indices=sorted_indices.intervals())
         
         if arr[j] <= pivot_val:
             i += 1
-            arr[i], arr[j] = arr[j], arr[i]
-            swaps[0] += 1
+            recorder.swap(i, j)
+            recorder.swaps += 1
             # 紀錄交換
-            record_step(arr, animation_steps, swapped=[i, j], active=[i + 1, j], pivot=high, sorted_indices=sorted_indices)
+            yield recorder.step(swapped=[i, j], active=_points(i + 1, j), pivot=high, sorted_indices=sorted_indices.intervals())
     
-    arr[i + 1], arr[high] = arr[high], arr[i + 1]
-    swaps[0] += 1
+    recorder.swap(i + 1, high)
+    recorder.swaps += 1
     
     # 基準點歸位
-    record_step(arr, animation_steps, swapped=[i + 1, high], pivot=i+1, sorted_indices=sorted_indices)
+    yield recorder.step(swapped=[i + 1, high], pivot=i+1, sorted_indices=sorted_indices.intervals())
     
     # 基準點現在已在最終位置
-    if (i + 1) not in sorted_indices:
-        sorted_indices.append(i + 1)
-        record_step(arr, animation_steps, sorted_indices=sorted_indices)
+    if sorted_indices.add(i + 1):
+        yield recorder.step(sorted_indices=sorted_indices.intervals())
 
 
     return i + 1
 
+
+def _heap_sort_range_with_steps(arr, low, high, recorder, sorted_indices):
+    """introsort 的退路：以堆積排序處理 arr[low..high]，完成後整段標記為已排序"""
+    size = high - low + 1
+    snapshot = sorted_indices.intervals()
+
+    for i in range(size // 2 - 1, -1, -1):
+        yield from _heapify_with_steps(arr, size, i, recorder, snapshot, base=low)
+
+    for end in range(size - 1, 0, -1):
+        recorder.swap(low + end, low)
+        recorder.swaps += 1
+        yield recorder.step(swapped=[low + end, low], sorted_indices=snapshot)
+        yield from _heapify_with_steps(arr, end, 0, recorder, snapshot, base=low)
+
+    sorted_indices.add_range(low, high)
+    yield recorder.step(sorted_indices=sorted_indices.intervals())
+
 # ==================================
 # -------------選擇排序--------------
 # ==================================
-def selection_sort(array):
-    arr_copy = list(array)
-    n = len(arr_copy)
-    swaps = 0
-    comparisons = 0
-    animation_steps = []
+def selection_sort(array, record=True):
+    return run_sort(selection_sort_steps, array, record)
 
-    start_time = time.perf_counter()
-    record_step(arr_copy, animation_steps) # 紀錄初始狀態
+def selection_sort_steps(recorder):
+    arr = recorder.arr
+    n = len(arr)
+
+    yield recorder.step() # 紀錄初始狀態
 
     for i in range(n - 1):
         min_idx = i
         # 紀錄當前回合的起始元素為活躍
-        record_step(arr_copy, animation_steps, active=[i], sorted_indices=list(range(i)))
+        yield recorder.step(active=_points(i), sorted_indices=_span(0, i - 1))
 
         for j in range(i + 1, n):
-            comparisons += 1
+            recorder.comparisons += 1
             # 紀錄比較步驟
-            record_step(arr_copy, animation_steps, compared=[min_idx, j], active=[i], sorted_indices=list(range(i)))
+            yield recorder.step(compared=[min_idx, j], active=_points(i), sorted_indices=_span(0, i - 1))
             
-            if arr_copy[j] < arr_copy[min_idx]:
+            if arr[j] < arr[min_idx]:
                 min_idx = j
                 # 紀錄新的最小元素 (可選擇是否要特別標記)
-                record_step(arr_copy, animation_steps, active=[i, min_idx], sorted_indices=list(range(i)))
+                yield recorder.step(active=_points(i, min_idx), sorted_indices=_span(0, i - 1))
         
         if min_idx != i:
-            arr_copy[i], arr_copy[min_idx] = arr_copy[min_idx], arr_copy[i]
-            swaps += 1
+            recorder.swap(i, min_idx)
+            recorder.swaps += 1
             # 紀錄交換步驟
-            record_step(arr_copy, animation_steps, swapped=[i, min_idx], sorted_indices=list(range(i)))
+            yield recorder.step(swapped=[i, min_idx], sorted_indices=_span(0, i - 1))
         
         # 紀錄當前元素已排序
-        record_step(arr_copy, animation_steps, sorted_indices=list(range(i + 1)))
+        yield recorder.step(sorted_indices=_span(0, i))
 
     # 標記所有元素為已排序
-    record_step(arr_copy, animation_steps, sorted_indices=list(range(n)))
-    
-    end_time = time.perf_counter()
-    exe_time = (end_time - start_time) * 1000000
-
-    return arr_copy,  exe_time, comparisons, swaps, animation_steps
+    yield recorder.step(sorted_indices=_span(0, n - 1))
 
 
 # ==================================
 # -------------合併排序--------------
 # ==================================
-def merge_sort(array):
-    arr_copy = list(array)
-    comparisons = [0]
-    swaps = [0] # 合併排序通常不算"交換"，而是移動，這裡計數移動次數
-    animation_steps = []
-
-    start_time = time.perf_counter()
-    record_step(arr_copy, animation_steps) # 紀錄初始狀態
+def merge_sort(array, record=True):
+    return run_sort(merge_sort_steps, array, record)
 
-    _merge_sort_recursive_with_steps(arr_copy, 0, len(arr_copy) - 1, comparisons, swaps, animation_steps)
-    
-    # 合併排序後，最終的 arr_copy 已經是排序好的，所以可以直接標記
-    record_step(arr_copy, animation_steps, sorted_indices=list(range(len(arr_copy))))
-
-    end_time = time.perf_counter()
-    exe_time = (end_time - start_time) * 1000000
+def merge_sort_steps(recorder):
+    # 合併排序通常不算"交換"，而是移動，recorder.swaps 計數移動次數
+    arr = recorder.arr
 
-    return arr_copy,  exe_time, comparisons[0], swaps[0], animation_steps
+    yield recorder.step() # 紀錄初始狀態
 
+    # 以明確的堆疊模擬遞迴：每個區間先分割 (進入時紀錄活躍區間)，
+    # 左右兩半都處理完後才合併，步驟順序與遞迴版本相同
+    stack = [(0, len(arr) - 1, False)]
+    while stack:
+        start_idx, end_idx, merging = stack.pop()
+        if start_idx >= end_idx:
+            continue
 
-def _merge_sort_recursive_with_steps(arr, start_idx, end_idx, comparisons, swaps, animation_steps):
-    if start_idx < end_idx:
         mid_idx = (start_idx + end_idx) // 2
-        
-        # 紀錄遞迴分割的活躍區間
-        record_step(arr, animation_steps, active=list(range(start_idx, end_idx + 1)))
-
-        _merge_sort_recursive_with_steps(arr, start_idx, mid_idx, comparisons, swaps, animation_steps)
-        _merge_sort_recursive_with_steps(arr, mid_idx + 1, end_idx, comparisons, swaps, animation_steps)
-        
-        _merge_with_steps(arr, start_idx, mid_idx, end_idx, comparisons, swaps, animation_steps)
+        if merging:
+            yield from _merge_with_steps(arr, start_idx, mid_idx, end_idx, recorder)
+        else:
+            # 紀錄分割的活躍區間
+            yield recorder.step(active=_span(start_idx, end_idx))
+            stack.append((start_idx, end_idx, True))
+            stack.append((mid_idx + 1, end_idx, False))
+            stack.append((start_idx, mid_idx, False))
+    
+    # 合併排序後，最終的 arr 已經是排序好的，所以可以直接標記
+    yield recorder.step(sorted_indices=_span(0, len(arr) - 1))
 
 
-def _merge_with_steps(arr, start_idx, mid_idx, end_idx, comparisons, swaps, animation_steps):
+def _merge_with_steps(arr, start_idx, mid_idx, end_idx, recorder):
     left_half = arr[start_idx : mid_idx + 1]
     right_half = arr[mid_idx + 1 : end_idx + 1]
 
@@ -271,107 +638,299 @@ def _merge_with_steps(arr, start_idx, mid_idx, end_idx, comparisons, swaps, anim
     k = start_idx  # index for merged_array (original arr)
 
     # 紀錄合併操作的活躍區間
-    record_step(arr, animation_steps, active=list(range(start_idx, end_idx + 1)))
+    yield recorder.step(active=_span(start_idx, end_idx))
 
     while i < len(left_half) and j < len(right_half):
-        comparisons[0] += 1
+        recorder.comparisons += 1
         
         # 紀錄比較兩個子陣列的元素
-        record_step(arr, animation_steps, compared=[start_idx + i, mid_idx + 1 + j], active=list(range(start_idx, end_idx + 1)))
+        yield recorder.step(compared=[start_idx + i, mid_idx + 1 + j], active=_span(start_idx, end_idx))
 
         if left_half[i] <= right_half[j]:
-            arr[k] = left_half[i]
+            recorder.write(k, left_half[i])
             i += 1
         else:
-            arr[k] = right_half[j]
+            recorder.write(k, right_half[j])
             j += 1
-        swaps[0] += 1 # 這裡計數為移動操作
+        recorder.swaps += 1 # 這裡計數為移動操作
         k += 1
         # 紀錄合併後的狀態
-        record_step(arr, animation_steps, active=list(range(start_idx, k)), sorted_indices=list(range(start_idx,k)))
+        yield recorder.step(active=_span(start_idx, k - 1), sorted_indices=_span(start_idx, k - 1))
 
 
     while i < len(left_half):
-        arr[k] = left_half[i]
-        swaps[0] += 1
+        recorder.write(k, left_half[i])
+        recorder.swaps += 1
         i += 1
         k += 1
-        record_step(arr, animation_steps, active=list(range(start_idx, k)), sorted_indices=list(range(start_idx,k)))
+        yield recorder.step(active=_span(start_idx, k - 1), sorted_indices=_span(start_idx, k - 1))
 
 
     while j < len(right_half):
-        arr[k] = right_half[j]
-        swaps[0] += 1
+        recorder.write(k, right_half[j])
+        recorder.swaps += 1
         j += 1
         k += 1
-        record_step(arr, animation_steps, active=list(range(start_idx, k)), sorted_indices=list(range(start_idx,k)))
+        yield recorder.step(active=_span(start_idx, k - 1), sorted_indices=_span(start_idx, k - 1))
 
     # 標記合併完成的區間為已排序
-    record_step(arr, animation_steps, sorted_indices=list(range(start_idx, end_idx + 1)))
+    yield recorder.step(sorted_indices=_span(start_idx, end_idx))
 
 
 # ==================================
 # -------------堆積排序--------------
 # ==================================
-def heap_sort(array):
-    arr_copy = list(array)
-    n = len(arr_copy)
-    comparisons = [0]
-    swaps = [0]
-    animation_steps = []
+def heap_sort(array, record=True):
+    return run_sort(heap_sort_steps, array, record)
 
-    start_time = time.perf_counter()
-    record_step(arr_copy, animation_steps) # 紀錄初始狀態
+def heap_sort_steps(recorder):
+    arr = recorder.arr
+    n = len(arr)
+
+    yield recorder.step() # 紀錄初始狀態
 
     # 建立最大堆積
     for i in range(n // 2 - 1, -1, -1):
-        _heapify_with_steps(arr_copy, n, i, comparisons, swaps, animation_steps)
-        record_step(arr_copy, animation_steps, active=[i]) # 標記當前處理的根節點
+        yield from _heapify_with_steps(arr, n, i, recorder)
+        yield recorder.step(active=_points(i)) # 標記當前處理的根節點
 
     # 一個個將元素從堆積中取出
     for i in range(n - 1, 0, -1):
-        arr_copy[i], arr_copy[0] = arr_copy[0], arr_copy[i]
-        swaps[0] += 1
+        recorder.swap(i, 0)
+        recorder.swaps += 1
         # 紀錄交換堆頂元素和最後一個元素
-        record_step(arr_copy, animation_steps, swapped=[i, 0], sorted_indices=list(range(i+1, n)))
+        yield recorder.step(swapped=[i, 0], sorted_indices=_span(i + 1, n - 1))
         
-        _heapify_with_steps(arr_copy, i, 0, comparisons, swaps, animation_steps, sorted_indices=list(range(i+1, n)))
+        yield from _heapify_with_steps(arr, i, 0, recorder, sorted_indices=_span(i + 1, n - 1))
         
         # 標記當前元素已排序
-        record_step(arr_copy, animation_steps, sorted_indices=list(range(i, n)))
-
-
-    record_step(arr_copy, animation_steps, sorted_indices=list(range(n))) # 標記所有元素為已排序
+        yield recorder.step(sorted_indices=_span(i, n - 1))
 
-    end_time = time.perf_counter()
-    exe_time = (end_time - start_time) * 1000000
 
-    return arr_copy, exe_time, comparisons[0], swaps[0], animation_steps
+    yield recorder.step(sorted_indices=_span(0, n - 1)) # 標記所有元素為已排序
 
-def _heapify_with_steps(arr, n, i, comparisons, swaps, animation_steps, sorted_indices=None):
+def _heapify_with_steps(arr, n, i, recorder, sorted_indices=None, base=0):
+    # 以迴圈往下篩選 (sift down)，取代原本的尾端遞迴
+    # base 為堆積在 arr 中的起始位置，堆積內的索引 i 對應到 arr[base + i]
     if sorted_indices is None:
         sorted_indices = []
 
-    largest = i
-    left = 2 * i + 1
-    right = 2 * i + 2
-    
-    # 紀錄比較父節點與左右子節點
-    record_step(arr, animation_steps, compared=[i], active=[left, right] if left < n or right < n else None, sorted_indices=sorted_indices)
+    while True:
+        largest = i
+        left = 2 * i + 1
+        right = 2 * i + 2
+        
+        # 紀錄比較父節點與左右子節點
+        yield recorder.step(compared=[base + i], active=_points(base + left, base + right) if left < n or right < n else None, sorted_indices=sorted_indices)
 
-    if left < n:
-        comparisons[0] += 1
-        if arr[left] > arr[largest]:
-            largest = left
-    
-    if right < n:
-        comparisons[0] += 1
-        if arr[right] > arr[largest]:
-            largest = right
-    
-    if largest != i:
-        arr[i], arr[largest] = arr[largest], arr[i]
-        swaps[0] += 1
+        if left < n:
+            recorder.comparisons += 1
+            if arr[base + left] > arr[base + largest]:
+                largest = left
+        
+        if right < n:
+            recorder.comparisons += 1
+            if arr[base + right] > arr[base + largest]:
+                largest = right
+        
+        if largest == i:
+            break
+
+        recorder.swap(base + i, base + largest)
+        recorder.swaps += 1
         # 紀錄交換
-        record_step(arr, animation_steps, swapped=[i, largest], sorted_indices=sorted_indices)
-        _heapify_with_steps(arr, n, largest, comparisons, swaps, animation_steps, sorted_indices)
\ No newline at end of file
+        yield recorder.step(swapped=[base + i, base + largest], sorted_indices=sorted_indices)
+        i = largest
+
+
+# 演算法名稱對應的步驟產生器 (供 app.py 與量測工具使用)
+SORT_ALGORITHMS = {
+    'bubble': bubble_sort_steps,
+    'insertion': insertion_sort_steps,
+    'selection': selection_sort_steps,
+    'quick': quick_sort_steps,
+    'merge': merge_sort_steps,
+    'heap': heap_sort_steps,
+}
+
+
+# ==================================
+# ------------只計數的排序------------
+# ==================================
+# metrics only 模式執行的版本：與上面的步驟產生器是同一個演算法，比較與交換的計數完全相同，
+# 但直接操作陣列、以區域變數計數，不產生步驟也不經過產生器，因此 n 可以到 10^6。
+# 每處理完一段 (一輪、一次分割或合併) 才以 recorder.add() 回報計數。
+def bubble_sort_metrics(recorder):
+    arr = recorder.arr
+    n = len(arr)
+    for i in range(n - 1):
+        swaps = 0
+        for j in range(n - i - 1):
+            if arr[j] > arr[j + 1]:
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+                swaps += 1
+        recorder.add(n - i - 1, swaps)
+        if not swaps:
+            break
+
+
+def insertion_sort_metrics(recorder):
+    # 與 insertion_sort_steps 相同，比較次數只計入造成移動的比較
+    arr = recorder.arr
+    for i in range(1, len(arr)):
+        key = arr[i]
+        j = i - 1
+        while j >= 0 and key < arr[j]:
+            arr[j + 1] = arr[j]
+            j -= 1
+        arr[j + 1] = key
+        moves = i - 1 - j
+        recorder.add(moves, moves)
+
+
+def selection_sort_metrics(recorder):
+    arr = recorder.arr
+    n = len(arr)
+    for i in range(n - 1):
+        min_idx = i
+        for j in range(i + 1, n):
+            if arr[j] < arr[min_idx]:
+                min_idx = j
+        swaps = 0
+        if min_idx != i:
+            arr[i], arr[min_idx] = arr[min_idx], arr[i]
+            swaps = 1
+        recorder.add(n - i - 1, swaps)
+
+
+def quick_sort_metrics(recorder, pivot='last'):
+    # 區間的處理順序、基準點的選法與 introsort 的退路都與 quick_sort_steps 相同
+    if pivot not in PIVOT_STRATEGIES:
+        raise ValueError(f"無效的基準點策略: {pivot}")
+
+    arr = recorder.arr
+    n = len(arr)
+    depth_limit = 2 * n.bit_length() if pivot == 'introsort' else None
+    stack = [(0, n - 1, 0)]
+    while stack:
+        low, high, depth = stack.pop()
+        if low >= high:
+            continue
+        if depth_limit is not None and depth > depth_limit:
+            _heap_sort_range_metrics(arr, low, high, recorder)
+            continue
+
+        swaps = 0
+        pivot_idx = _choose_pivot(arr, low, high, recorder, pivot)
+        if pivot_idx != high:
+            arr[pivot_idx], arr[high] = arr[high], arr[pivot_idx]
+            swaps = 1
+        pivot_val = arr[high]
+        i = low - 1
+        for j in range(low, high):
+            if arr[j] <= pivot_val:
+                i += 1
+                arr[i], arr[j] = arr[j], arr[i]
+        arr[i + 1], arr[high] = arr[high], arr[i + 1]
+        recorder.add(high - low, swaps + i - low + 2)
+        stack.append((i + 2, high, depth + 1))
+        stack.append((low, i, depth + 1))
+
+
+def _heap_sort_range_metrics(arr, low, high, recorder):
+    """introsort 的退路：以堆積排序處理 arr[low..high]"""
+    size = high - low + 1
+    for i in range(size // 2 - 1, -1, -1):
+        recorder.add(*_sift_down(arr, size, i, base=low))
+    for end in range(size - 1, 0, -1):
+        arr[low + end], arr[low] = arr[low], arr[low + end]
+        comparisons, swaps = _sift_down(arr, end, 0, base=low)
+        recorder.add(comparisons, swaps + 1)
+
+
+def merge_sort_metrics(recorder):
+    # 與 merge_sort_steps 相同的分割方式，以堆疊依「左半、右半、合併」的順序處理各區間
+    arr = recorder.arr
+    stack = [(0, len(arr) - 1, False)]
+    while stack:
+        start_idx, end_idx, merging = stack.pop()
+        if start_idx >= end_idx:
+            continue
+        mid_idx = (start_idx + end_idx) // 2
+        if not merging:
+            stack.append((start_idx, end_idx, True))
+            stack.append((mid_idx + 1, end_idx, False))
+            stack.append((start_idx, mid_idx, False))
+            continue
+
+        left_half = arr[start_idx : mid_idx + 1]
+        right_half = arr[mid_idx + 1 : end_idx + 1]
+        n_left = len(left_half)
+        n_right = len(right_half)
+        i = j = 0
+        k = start_idx
+        while i < n_left and j < n_right:
+            if left_half[i] <= right_half[j]:
+                arr[k] = left_half[i]
+                i += 1
+            else:
+                arr[k] = right_half[j]
+                j += 1
+            k += 1
+        # 每次比較寫入一個元素；其中一半用完後，另一半剩下的元素直接搬回
+        comparisons = k - start_idx
+        arr[k : end_idx + 1] = left_half[i:] if i < n_left else right_half[j:]
+        recorder.add(comparisons, end_idx - start_idx + 1)
+
+
+def heap_sort_metrics(recorder):
+    arr = recorder.arr
+    n = len(arr)
+    for i in range(n // 2 - 1, -1, -1):
+        recorder.add(*_sift_down(arr, n, i))
+    for i in range(n - 1, 0, -1):
+        arr[i], arr[0] = arr[0], arr[i]
+        comparisons, swaps = _sift_down(arr, i, 0)
+        recorder.add(comparisons, swaps + 1)
+
+
+def _sift_down(arr, n, i, base=0):
+    """
+    堆積的往下篩選，回傳 (比較次數, 交換次數)；計數與 _heapify_with_steps 相同。
+    下沉的元素先取出，較大的子節點逐層上移，最後才放回，每次「交換」只寫入一次。
+    base 為堆積在 arr 中的起始位置。
+    """
+    comparisons = swaps = 0
+    value = arr[base + i]
+    while True:
+        left = 2 * i + 1
+        if left >= n:
+            break
+        right = left + 1
+        largest, largest_val = i, value
+        if arr[base + left] > largest_val:
+            largest, largest_val = left, arr[base + left]
+        if right < n:
+            comparisons += 2
+            if arr[base + right] > largest_val:
+                largest, largest_val = right, arr[base + right]
+        else:
+            comparisons += 1
+        if largest == i:
+            break
+        arr[base + i] = largest_val
+        swaps += 1
+        i = largest
+    arr[base + i] = value
+    return comparisons, swaps
+
+
+# 步驟產生器對應的計數版本
+METRICS_SORTS = {
+    bubble_sort_steps: bubble_sort_metrics,
+    insertion_sort_steps: insertion_sort_metrics,
+    selection_sort_steps: selection_sort_metrics,
+    quick_sort_steps: quick_sort_metrics,
+    merge_sort_steps: merge_sort_metrics,
+    heap_sort_steps: heap_sort_metrics,
+}
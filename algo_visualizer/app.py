@@ -1,126 +1,81 @@
-from flask import Flask, render_template, request, jsonify
-from algorithms import bubble_sort, insertion_sort, selection_sort, quick_sort, merge_sort, heap_sort
-from clustering import perform_clustering, perform_classification
-import pandas as pd
-import io
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, url_for
+from algorithms import iter_sort, default_keyframe_interval, BudgetExceeded, PIVOT_STRATEGIES, SORT_ALGORITHMS
+from complexity import ALGORITHM_COMPLEXITY, measure_complexity, get_complexity_type, max_input_size
+from cache import ResponseCache, GzipAccumulator, make_key
+from response_encoding import (BINARY_STEPS_MIMETYPE, can_pack_binary, encoded_response, gzip_body_response,
+                               json_response, wants_binary_steps)
+import workers
+from workers import Overloaded, start_race, cancel_race
+from jobs import JobStore
+from clustering import (AUTO_K_MAX, AUTO_K_MIN, CLASSIFIERS, CLUSTERING_ENGINES, CV_FOLDS, CV_MAX_FOLDS,
+                        KNN_MAX_NEIGHBORS)
+from scatter import LOD_MODES
+from datasets import (SUPPORTED_EXTENSIONS, DatasetRegistry, append_rows, discard_upload, ingest,
+                      unsupported_format_message)
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from werkzeug.exceptions import RequestEntityTooLarge
+import gzip
+import json
+import os
+import time
 
 # 建立一個 Flask 應用程式實例
 app = Flask(__name__)
+app.config.setdefault('SORT_CACHE_MAX_BYTES', 64 * 1024 * 1024) # 排序結果快取的總大小上限 (壓縮後)
+app.config.setdefault('SORT_CACHE_TTL', 600)                    # 排序結果快取的存活秒數
+app.config.setdefault('RACE_TIMEOUT', 10.0)                     # /race 每個演算法的期限 (秒)
+app.config.setdefault('RACE_MAX_FRAMES', 5000)                  # /race 每個演算法預設的影格預算
+app.config.setdefault('WORKER_PROCESSES', None)                 # 執行排序與分析的行程數，None 為 CPU 核心數
+app.config.setdefault('WORKER_QUEUE_LIMIT', 8)                  # 行程都在忙時，最多再排隊幾個工作，超過回應 429
+app.config.setdefault('WORKER_JOB_PARALLELISM', None)           # 每個分析工作內部平行使用的行程數上限，None 為不設上限 (只用閒置的行程)
+app.config.setdefault('SORT_MAX_STEPS', 20000000)               # 排序的步驟上限 (metrics only 或有影格預算時)
+app.config.setdefault('SORT_MAX_RECORDED_STEPS', 2000000)       # 保留所有動畫步驟時的步驟上限
+app.config.setdefault('SORT_TIMEOUT', 30.0)                     # 單次排序的時間上限 (秒)
+app.config.setdefault('ANALYZE_TIMEOUT', 120.0)                 # 同步的 /analyze 等待結果的上限 (秒)
+app.config.setdefault('ANALYZE_RESULTS_MAX_BYTES', 64 * 1024 * 1024) # 分析結果的保存上限 (壓縮後)
+app.config.setdefault('ANALYZE_RESULTS_TTL', 3600)              # 分析結果的保存秒數
+app.config.setdefault('ANALYZE_MAX_JOBS', 256)                  # 保留的分析工作紀錄數
+app.config.setdefault('MAX_CLUSTERS', 50)                       # 分群的集群數量上限
+app.config.setdefault('DATASET_DIR', os.path.join(app.instance_path, 'datasets'))  # 上傳資料集的存放目錄
+app.config.setdefault('DATASET_MAX_BYTES', 1024 * 1024 * 1024)  # 資料集的總大小上限，超過時淘汰最久未使用的
+app.config.setdefault('MAX_CONTENT_LENGTH', 32 * 1024 * 1024)   # 請求本文大小上限，超過回應 413
+app.config.setdefault('DATASET_MAX_UPLOAD_BYTES', 512 * 1024 * 1024) # 上傳資料集的大小上限
+
+workers.configure(app.config['WORKER_PROCESSES'], app.config['WORKER_QUEUE_LIMIT'],
+                  app.config['WORKER_JOB_PARALLELISM'])
+
+# 相同的排序請求 (預設的隨機資料、重播) 直接回傳快取中已序列化並壓縮的回應
+sort_cache = ResponseCache(max_bytes=app.config['SORT_CACHE_MAX_BYTES'], ttl=app.config['SORT_CACHE_TTL'])
+
+# 分析工作與結果；分析結果通常較大，單一項目最多可佔保存上限的一半
+analysis_jobs = JobStore(ResponseCache(max_bytes=app.config['ANALYZE_RESULTS_MAX_BYTES'],
+                                       ttl=app.config['ANALYZE_RESULTS_TTL'],
+                                       max_entry_bytes=app.config['ANALYZE_RESULTS_MAX_BYTES'] // 2),
+                         max_jobs=app.config['ANALYZE_MAX_JOBS'])
+
+# 上傳過的資料集以欄為單位存放在磁碟上，之後的分析以 dataset_id 指定
+dataset_registry = DatasetRegistry(app.config['DATASET_DIR'], max_bytes=app.config['DATASET_MAX_BYTES'])
 
 # 定義一個路由，當使用者訪問根目錄 (/) 時，會執行這個函式
 @app.route('/')
 def index():
     return render_template('index.html')
 
-# 演算法複雜度資訊
-ALGORITHM_COMPLEXITY = {
-    'bubble': {
-        'time': {
-            'best': 'O(n)',
-            'average': 'O(n²)',
-            'worst': 'O(n²)'
-        },
-        'space': 'O(1)'
-    },
-    'insertion': {
-        'time': {
-            'best': 'O(n)',
-            'average': 'O(n²)',
-            'worst': 'O(n²)'
-        },
-        'space': 'O(1)'
-    },
-    'selection': {
-        'time': {
-            'best': 'O(n²)',
-            'average': 'O(n²)',
-            'worst': 'O(n²)'
-        },
-        'space': 'O(1)'
-    },
-    'quick': {
-        'time': {
-            'best': 'O(n log n)',
-            'average': 'O(n log n)',
-            'worst': 'O(n²)'
-        },
-        'space': 'O(log n) to O(n)'
-    },
-    'merge': {
-        'time': {
-            'best': 'O(n log n)',
-            'average': 'O(n log n)',
-            'worst': 'O(n log n)'
-        },
-        'space': 'O(n)'
-    },
-    'heap': {
-        'time': {
-            'best': 'O(n log n)',
-            'average': 'O(n log n)',
-            'worst': 'O(n log n)'
-        },
-        'space': 'O(1)'
-    }
-}
-
-
-def get_complexity_type(algorithm_name, count, n):
-    """根據操作次數判斷是最佳、平均或最差情況"""
-
-    # --- 氣泡排序 ---
-    if algorithm_name == 'bubble':
-        # 最佳: 陣列已排序，只需一輪掃描，比較的次數為 n-1
-        if count <= n - 1:
-            return '最佳'
-        # 最差: 陣列完全逆序，比較的次數約為 n^2/2
-        elif count >= n * (n - 1) / 2:
-            return '最差'
-        else:
-            return '平均'
-
-    # --- 插入排序 ---
-    elif algorithm_name == 'insertion':
-        # 最佳: 陣列已排序，每輪只需一次比較
-        if count <= n - 1:
-            return '最佳'
-        # 最差: 陣列完全逆序，每輪都需從頭比較到尾
-        elif count >= n * (n - 1) / 2:
-            return '最差'
-        else:
-            return '平均'
-
-    # --- 選擇排序 ---
-    elif algorithm_name == 'selection':
-        # 選擇排序的比較次數永遠是固定的，與輸入數據的順序無關
-        # 最差/平均/最佳情況的比較次數皆為 n * (n - 1) / 2
-        # 我們可以簡化邏輯，直接回傳'平均'，因為它沒有最佳或最差情況
-        return '平均'
-    
-    # --- 快速排序 ---
-    elif algorithm_name == 'quick':
-        # 最佳/平均: 每次分割都均勻，比較次數約為 n log n
-        # 我們會設定一個合理的閾值來判斷
-        if count <= n * (n + 1) / 2: # 最差情況的比較次數
-            # 由於快排的平均與最佳情況次數相近，這裡可以將其視為一類
-            return '平均/最佳'
-        else:
-            # 當比較次數超過一個合理範圍時，可能進入最差情況
-            return '最差'
-
-    # --- 合併排序 ---
-    elif algorithm_name == 'merge':
-        # 合併排序的比較次數在所有情況下都非常接近 n log n
-        # 與選擇排序類似，合併排序沒有明顯的最佳或最差情況
-        return '平均'
-    
-    # --- 堆積排序 ---
-    elif algorithm_name == 'heap':
-        # 堆積排序的比較次數在所有情況下都約為 n log n
-        # 因此，通常不區分最佳、平均、最差情況
-        return '平均'
-    
-    return '無法判斷'
+# 串流模式下，每累積這麼多個步驟就送出一次，避免每一行都觸發一次網路寫入
+STREAM_BATCH_SIZE = 256
+
+
+def overloaded_response():
+    """行程池與等待佇列都滿了：請用戶端稍後再試"""
+    response = jsonify({'error': '伺服器忙碌中，請稍後再試'})
+    response.status_code = 429
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+def budget_exceeded_response(e):
+    reason = '時間' if e.reason == 'timeout' else '步驟數'
+    return jsonify({'error': f'排序超過{reason}上限而中止', 'reason': e.reason, 'steps': e.steps}), 413
 
 @app.route('/sort', methods=['POST'])
 def sort_data():
@@ -133,108 +88,590 @@ def sort_data():
         
         # 複製一份原始資料以供回傳
         original_numbers = list(numbers)
-        
-        # 使用字典來映射演算法名稱到對應的函式
-        algorithms_map = {
-            'bubble': bubble_sort,
-            'insertion': insertion_sort,
-            'selection': selection_sort,
-            'quick': quick_sort,
-            'merge': merge_sort,
-            'heap': heap_sort,
-        }
-
-        # 根據演算法名稱，從字典中獲取對應的函式
-        algorithm_func = algorithms_map.get(algorithm_name)
+
+        # 根據演算法名稱，從字典中獲取對應的步驟產生器
+        step_func = SORT_ALGORITHMS.get(algorithm_name)
 
         # 檢查函式是否存在
-        if not algorithm_func:
+        if not step_func:
             return jsonify({'error': '無效的演算法'}), 400
 
-        # 呼叫選定的函式
-        sorted_numbers, time_taken, comparisons, swaps, animation_steps = algorithm_func(numbers)
-        n = len(numbers)
-        time_complexity_type = get_complexity_type(algorithm_name, comparisons, n)
-
-        # 取得複雜度資訊
-        complexity_info = ALGORITHM_COMPLEXITY.get(algorithm_name, {}) # 仍然從後端獲取，確保一致性
-        space_complexity = complexity_info.get('space')
-
-        # 回傳排序結果、執行時間和複雜度資訊
-        return jsonify({
-            'original_data': original_numbers,
-            'sorted_data': sorted_numbers,
-            'time_taken': time_taken,
-            'time_complexity_type': time_complexity_type,
-            'space_complexity': space_complexity, 
-            'comparisons': comparisons,
-            'swaps': swaps,
-            'animation_steps': animation_steps 
-        })
+        # record 為 false 時只量測計數與時間 (metrics only)，不產生動畫步驟
+        record = data.get('record', True)
+        if not isinstance(record, bool):
+            return jsonify({'error': '無效的 record 參數，必須是 true 或 false'}), 400
+
+        # 演算法的額外選項，目前只有快速排序的基準點策略
+        options = {}
+        if algorithm_name == 'quick':
+            pivot = data.get('pivot', 'last')
+            if pivot not in PIVOT_STRATEGIES:
+                return jsonify({'error': '無效的基準點策略'}), 400
+            options['pivot'] = pivot
+
+        # 關鍵影格 (完整陣列快照) 的間隔，未指定時依輸入大小決定
+        keyframe_interval = data.get('keyframe_interval')
+        if keyframe_interval is not None:
+            if not isinstance(keyframe_interval, int) or isinstance(keyframe_interval, bool) or keyframe_interval < 1:
+                return jsonify({'error': '無效的關鍵影格間隔'}), 400
+        else:
+            keyframe_interval = default_keyframe_interval(len(original_numbers))
+
+        # 影格預算：步驟超過 max_frames 時，排序進行中就捨棄或合併單純比較的步驟
+        max_frames = data.get('max_frames')
+        if max_frames is not None:
+            if not isinstance(max_frames, int) or isinstance(max_frames, bool) or max_frames < 1:
+                return jsonify({'error': '無效的影格預算'}), 400
+
+        stream = bool(data.get('stream')) and record
+        # Accept: application/x-sort-steps 時以 int32 陣列的二進位格式回傳動畫步驟 (只支援整數輸入)
+        binary = record and not stream and wants_binary_steps() and can_pack_binary(original_numbers)
+        if stream:
+            mimetype = 'application/x-ndjson'
+        elif binary:
+            mimetype = BINARY_STEPS_MIMETYPE
+        else:
+            mimetype = 'application/json'
+
+        # 相同的演算法、輸入與選項會得到相同的回應，先查快取
+        cache_key = make_key(algorithm_name, original_numbers, options, record, keyframe_interval, max_frames, mimetype)
+        cached_body = sort_cache.get(cache_key)
+        if cached_body is not None:
+            return gzip_body_response(cached_body, mimetype)
+
+        # 依 ALGORITHM_COMPLEXITY 的平均情況估計操作次數，輸入超過上限時直接拒絕；
+        # 保留所有動畫步驟時記憶體也與步驟數成正比，上限更低
+        max_steps = app.config['SORT_MAX_RECORDED_STEPS'] if record and not max_frames else app.config['SORT_MAX_STEPS']
+        max_size = max_input_size(algorithm_name, max_steps)
+        if len(original_numbers) > max_size:
+            return jsonify({'error': f'輸入過大，{algorithm_name} 最多 {max_size} 筆', 'max_size': max_size}), 413
+
+        # 串流模式：邊排序邊以 NDJSON 送出動畫步驟 (在請求的執行緒中執行，但同樣佔用一個名額)
+        if stream:
+            try:
+                workers.acquire()
+            except Overloaded:
+                return overloaded_response()
+            try:
+                recorder = workers.prepare_recorder(algorithm_name, original_numbers, options, record,
+                                                    keyframe_interval, max_frames)
+                recorder.limit(max_steps, app.config['SORT_TIMEOUT'])
+                response = stream_sort_response(step_func, recorder, algorithm_name, original_numbers, options,
+                                                cache_key)
+                response.call_on_close(workers.release)
+            except Exception:
+                # 回應還沒建立完成，名額不會由 call_on_close 歸還
+                workers.release()
+                raise
+            return response
+
+        # 排序、量測與序列化都在工作行程中完成
+        try:
+            future = workers.submit(workers.sort_job, algorithm_name, original_numbers, options, record,
+                                    keyframe_interval, max_frames, binary, max_steps, app.config['SORT_TIMEOUT'])
+        except Overloaded:
+            return overloaded_response()
+        try:
+            body_gz = future.result()
+        except BudgetExceeded as e:
+            return budget_exceeded_response(e)
+
+        # 存入快取
+        sort_cache.put(cache_key, body_gz)
+        return gzip_body_response(body_gz, mimetype)
+    except RequestEntityTooLarge:
+        return jsonify({'error': '請求內容過大'}), 413
     except Exception as e:
         # 如果發生錯誤，回傳錯誤訊息
         return jsonify({'error': str(e)}), 400
-    
+
+
+def stream_sort_response(step_func, recorder, algorithm_name, original_numbers, options, cache_key):
+    """
+    以 NDJSON (每行一個 JSON) 串流回傳排序過程。
+
+    第一行為 {"event": "start", ...}，中間每行是一個動畫步驟，
+    最後一行為 {"event": "result", ...} 的統計結果；中途出錯時送出 {"event": "error", ...}。
+    串流的同時把本文壓縮累積起來，順利結束時存入快取；
+    用戶端接受 gzip 時直接送出壓縮後的片段。
+    """
+    accumulator = GzipAccumulator(sort_cache.max_entry_bytes)
+    compressed = 'gzip' in request.accept_encodings
+
+    def emit(text):
+        chunk = accumulator.add(text)
+        return chunk if compressed else text
+
+    def generate():
+        yield emit(json.dumps({'event': 'start', 'algorithm': algorithm_name, 'original_data': original_numbers,
+                               'keyframe_interval': recorder.keyframe_interval}) + '\n')
+        try:
+            batch = []
+            for step in iter_sort(step_func, recorder, **options):
+                batch.append(json.dumps(step, separators=(',', ':')))
+                if len(batch) >= STREAM_BATCH_SIZE:
+                    yield emit('\n'.join(batch) + '\n')
+                    batch = []
+            if batch:
+                yield emit('\n'.join(batch) + '\n')
+
+            complexity_fit = measure_complexity(algorithm_name, original_numbers, options)
+            yield emit(json.dumps({
+                'event': 'result',
+                'original_data': original_numbers,
+                'sorted_data': recorder.arr,
+                'time_taken': recorder.exe_time,
+                'time_complexity_type': get_complexity_type(algorithm_name, complexity_fit),
+                'time_complexity_fit': complexity_fit,
+                'space_complexity': ALGORITHM_COMPLEXITY.get(algorithm_name, {}).get('space'),
+                'comparisons': recorder.comparisons,
+                'swaps': recorder.swaps,
+                'keyframes': recorder.keyframes,
+                'dropped_steps': getattr(recorder, 'dropped', 0),
+            }) + '\n')
+        except Exception as e:
+            # 回應標頭已送出，只能在串流中回報錯誤；錯誤的回應不存入快取
+            if isinstance(e, BudgetExceeded):
+                error = {'event': 'error', 'error': '排序超過上限而中止', 'reason': e.reason, 'steps': e.steps}
+            else:
+                error = {'event': 'error', 'error': str(e)}
+            yield emit(json.dumps(error) + '\n')
+            if compressed:
+                yield accumulator.finish()
+            return
+
+        tail = accumulator.finish()
+        if compressed:
+            yield tail
+        body_gz = accumulator.result()
+        if body_gz is not None:
+            sort_cache.put(cache_key, body_gz)
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+@app.route('/sort/cache', methods=['GET'])
+def sort_cache_stats():
+    """回傳排序結果快取的命中與使用狀況"""
+    return jsonify(sort_cache.stats())
+
+
+@app.route('/workers', methods=['GET'])
+def worker_stats():
+    """回傳行程池的大小與目前使用中的名額"""
+    return jsonify(workers.stats())
+
+
+@app.route('/race', methods=['POST'])
+def race_sorts():
+    """
+    在行程池中以同一組輸入同時執行多種排序，回傳各演算法的計數、時間與動畫步驟。
+
+    請求欄位：numbers、algorithms (預設全部)、pivot、record、max_frames、timeout (秒)、stream。
+    stream 為 true 時以 NDJSON 回傳：{"event": "start", "race_id": ...}，
+    之後每完成一個演算法送出一行 {"event": "result", ...}，最後為 {"event": "done", ...}。
+    進行中的 race 可以 DELETE /race/<race_id> 取消。
+    """
+    data = request.get_json() or {}
+    numbers = list(data.get('numbers', []))
+    algorithms = data.get('algorithms', list(SORT_ALGORITHMS))
+    if not algorithms or any(name not in SORT_ALGORITHMS for name in algorithms):
+        return jsonify({'error': '無效的演算法'}), 400
+
+    options = {}
+    if 'quick' in algorithms:
+        pivot = data.get('pivot', 'last')
+        if pivot not in PIVOT_STRATEGIES:
+            return jsonify({'error': '無效的基準點策略'}), 400
+        options['quick'] = {'pivot': pivot}
+
+    record = data.get('record', True)
+    if not isinstance(record, bool):
+        return jsonify({'error': '無效的 record 參數，必須是 true 或 false'}), 400
+    max_frames = data.get('max_frames', app.config['RACE_MAX_FRAMES'])
+    if max_frames is not None and (not isinstance(max_frames, int) or isinstance(max_frames, bool) or max_frames < 1):
+        return jsonify({'error': '無效的影格預算'}), 400
+    try:
+        timeout = min(float(data.get('timeout', app.config['RACE_TIMEOUT'])), app.config['RACE_TIMEOUT'])
+    except (TypeError, ValueError):
+        return jsonify({'error': '無效的期限'}), 400
+
+    # 與 /sort 相同的步驟上限：保留所有步驟時較嚴格；每個工作執行中也以這個上限中止
+    max_steps = app.config['SORT_MAX_RECORDED_STEPS'] if record and not max_frames else app.config['SORT_MAX_STEPS']
+    too_large = [name for name in algorithms if len(numbers) > max_input_size(name, max_steps)]
+    if too_large:
+        return jsonify({'error': f"輸入過大：{', '.join(too_large)}"}), 413
+
+    started = time.perf_counter()
+    try:
+        race = start_race(algorithms, numbers, options, timeout, record, max_frames, max_steps)
+    except Overloaded:
+        return overloaded_response()
+
+    if data.get('stream'):
+        def generate():
+            yield json.dumps({'event': 'start', 'race_id': race.id, 'algorithms': algorithms,
+                              'original_data': numbers}) + '\n'
+            for result in race.results():
+                yield json.dumps({'event': 'result', **result}, separators=(',', ':')) + '\n'
+            yield json.dumps({'event': 'done', 'wall_time': (time.perf_counter() - started) * 1000000}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    results = list(race.results())
+    results.sort(key=lambda result: algorithms.index(result['algorithm']))
+    return json_response({
+        'race_id': race.id,
+        'original_data': numbers,
+        'results': results,
+        # 整個 race 的實際經過時間 (微秒)，約等於最慢的演算法
+        'wall_time': (time.perf_counter() - started) * 1000000,
+    })
+
+
+@app.route('/race/<race_id>', methods=['DELETE'])
+def cancel_race_route(race_id):
+    """取消進行中的 race"""
+    if not cancel_race(race_id):
+        return jsonify({'error': '找不到進行中的 race'}), 404
+    return jsonify({'race_id': race_id, 'cancelled': True})
+
+
+def read_upload(keep_upload=False):
+    """
+    把上傳的檔案存成暫存檔，回傳 (資料集編號, 暫存檔路徑, 檔名)。
+    資料集已經存放過時暫存檔路徑為 None，不必再解析 (keep_upload 為 True 時一律保留暫存檔)；
+    沒有上傳檔案時回傳 None。
+    """
+    # 上傳檔案會分段寫入磁碟，可以放寬請求大小的上限
+    request.max_content_length = app.config['DATASET_MAX_UPLOAD_BYTES']
+    file = request.files.get('file')
+    if not file:
+        return None
+    filename = file.filename.lower()
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise ValueError(unsupported_format_message())
+
+    dataset_id, upload_path = dataset_registry.save_upload(file.stream, filename)
+    if dataset_registry.exists(dataset_id) and not keep_upload:
+        discard_upload(upload_path)
+        return dataset_id, None, filename
+    dataset_registry.prune(keep=dataset_id)
+    return dataset_id, upload_path, filename
+
+
+def read_analysis_request():
+    """
+    讀取 /analyze 的檔案 (或既有的 dataset_id) 與參數，回傳 (快取鍵, analyze_job 的參數)。
+    參數不正確時丟出 ValueError；檔案內容的解析留給工作行程。
+    """
+    # 1. 從請求中獲取上傳的檔案 (或已上傳的資料集) 和演算法類型
+    upload = read_upload()
+    dataset_id = request.form.get('dataset_id')
+    analysis_type = request.form.get('type')
+
+    if upload:
+        dataset_id, upload_path, filename = upload
+    else:
+        upload_path = filename = None
+
+    if analysis_type not in ('clustering', 'classification'):
+        if upload_path:
+            discard_upload(upload_path)
+        raise ValueError('缺少檔案或演算法類型' if not analysis_type else '無效的分析類型')
+    if not upload:
+        if not dataset_id:
+            raise ValueError('缺少檔案或演算法類型')
+        if not dataset_registry.exists(dataset_id):
+            raise LookupError('找不到這個資料集，請重新上傳檔案')
+    try:
+        if analysis_type == 'classification':
+            options = read_classification_options(request.form)
+        else:
+            options = read_clustering_options(request.form)
+    except ValueError:
+        if upload_path:
+            discard_upload(upload_path)
+        raise
+
+    # 結果資料列的 LOD 模式：資料列很多時只回傳分層抽樣 ('sample') 或分箱密度 ('density')
+    lod = request.form.get('lod', 'auto')
+    if lod not in LOD_MODES:
+        if upload_path:
+            discard_upload(upload_path)
+        raise ValueError('無效的 LOD 模式')
+
+    # 以資料集編號 (內容雜湊值) 與參數作為鍵，相同的分析沿用既有的結果
+    key = make_key('analyze', dataset_id, analysis_type, options, lod)
+    return key, (dataset_registry.path(dataset_id), upload_path, filename, analysis_type, options, lod)
+
+
+def read_classification_options(form):
+    """
+    讀取並檢查分類的參數 (目標欄位與 perform_classification 的 classifier、n_neighbors、return_neighbors、
+    tune、cv_folds)。
+    """
+    # 從前端獲取目標欄位名稱，如果不存在則使用預設值 'target_class'
+    options = {'target_field': form.get('target_field', 'target_class')}
+    classifier = form.get('classifier', 'tree')
+    if classifier not in CLASSIFIERS:
+        raise ValueError('無效的分類器')
+    options['classifier'] = classifier
+    if classifier == 'knn':
+        try:
+            n_neighbors = int(form.get('n_neighbors', 5))
+        except ValueError:
+            raise ValueError('鄰居數量必須是數字')
+        if not 1 <= n_neighbors <= KNN_MAX_NEIGHBORS:
+            raise ValueError(f'鄰居數量必須介於 1 到 {KNN_MAX_NEIGHBORS}')
+        options['n_neighbors'] = n_neighbors
+        # 是否回傳每一列的鄰居 (前端點選資料點時標示)
+        options['return_neighbors'] = form.get('neighbors', 'false').lower() in ('1', 'true')
+    elif form.get('tune', 'false').lower() in ('1', 'true'):
+        # 決策樹以交叉驗證選擇參數
+        try:
+            cv_folds = int(form.get('cv_folds', CV_FOLDS))
+        except ValueError:
+            raise ValueError('交叉驗證的折數必須是數字')
+        if not 2 <= cv_folds <= CV_MAX_FOLDS:
+            raise ValueError(f'交叉驗證的折數必須介於 2 到 {CV_MAX_FOLDS}')
+        options['tune'] = True
+        options['cv_folds'] = cv_folds
+    return options
+
+
+def read_clustering_options(form):
+    """
+    讀取並檢查分群的參數 (perform_clustering 的 n_clusters、engine、max_iter、tol、k_max)。
+    cluster_count 為 'auto' 時自動選擇群集數。
+    """
+    max_clusters = app.config['MAX_CLUSTERS']
+    try:
+        cluster_count = form.get('cluster_count', '3')
+        n_clusters = 'auto' if cluster_count == 'auto' else int(cluster_count)
+        k_max = int(form.get('k_max', AUTO_K_MAX))
+        max_iter = int(form.get('max_iter', 300))
+        tol = float(form.get('tol', 1e-4))
+    except ValueError:
+        raise ValueError('分群參數必須是數字')
+    if n_clusters != 'auto' and not 1 <= n_clusters <= max_clusters:
+        raise ValueError(f'集群數量必須介於 1 到 {max_clusters}')
+    if not AUTO_K_MIN <= k_max <= max_clusters:
+        raise ValueError(f'自動選擇的最大群集數必須介於 {AUTO_K_MIN} 到 {max_clusters}')
+    if not 1 <= max_iter <= 10000 or not 0 <= tol < 1:
+        raise ValueError('無效的迭代次數或收斂門檻')
+    engine = form.get('engine', 'auto')
+    if engine not in CLUSTERING_ENGINES:
+        raise ValueError('無效的分群引擎')
+    options = {'n_clusters': n_clusters, 'engine': engine, 'max_iter': max_iter, 'tol': tol}
+    if n_clusters == 'auto':
+        options['k_max'] = k_max
+    return options
+
+
+def job_response(job, status_code=200):
+    """工作狀態；完成時把結果本文接在 result 欄位，不必重新解析與序列化"""
+    info = job.to_dict()
+    body_gz = analysis_jobs.result(job) if job.status == 'done' else None
+    if job.status == 'done' and body_gz is None:
+        # 結果已從保存區淘汰，請用戶端重新送出
+        info['status'] = 'expired'
+    body = app.json.dumps(info).encode('utf-8')
+    if body_gz is not None:
+        body = body[:-1] + b',"result":' + gzip.decompress(body_gz) + b'}'
+    response = encoded_response(body, 'application/json')
+    response.status_code = status_code
+    return response
+
+
+def submit_analysis_job(key, args):
+    """送出分析工作；沿用既有的工作或被拒絕時，這次上傳的暫存檔不會被使用，直接刪除"""
+    upload_path = args[1]
+    try:
+        job, created = analysis_jobs.submit(key, *args)
+    except Overloaded:
+        if upload_path:
+            discard_upload(upload_path)
+        raise
+    if upload_path and not created:
+        discard_upload(upload_path)
+    return job
+
+
 @app.route('/analyze', methods=['POST'])
 def analyze_data():
-    """處理分類與分群的請求"""
+    """處理分類與分群的請求 (同步等待結果)"""
     try:
-        # 1. 從請求中獲取上傳的檔案和演算法類型
-        file = request.files.get('file')
-        analysis_type = request.form.get('type')
-
-        if not file or not analysis_type:
-            return jsonify({'error': '缺少檔案或演算法類型'}), 400
-
-        # 2. 根據檔案副檔名讀取為 Pandas DataFrame
-        filename = file.filename.lower()
-        if filename.endswith(('.csv', '.txt')):
-            # 使用 utf-8 解碼，並用 io.StringIO 包裝
-            df = pd.read_csv(io.StringIO(file.stream.read().decode('utf-8')))
-        elif filename.endswith('.json'):
-            # 處理 JSON 檔案
-            df = pd.read_json(file.stream.read().decode('utf-8'))
-        else:
-            return jsonify({'error': '不支援的檔案格式，目前只支援 CSV、TXT 和 JSON 檔案'}), 400
-        
-        # 3. 根據不同的演算法類型執行對應的函式
-        if analysis_type == 'clustering':
-            
-            result_df = perform_clustering(df)
-          
-            # 將結果轉換為 JSON 格式
-            result_json = {
-                'analysis_type': 'clustering',
-                'results_table': result_df.to_dict('records')
-            }
-
-            return jsonify(result_json)
-            
-        elif analysis_type == 'classification':
-            # 從前端獲取目標欄位名稱，如果不存在則使用預設值 'target_class'
-            target_field = request.form.get('target_field', 'target_class')
-            
-            # 呼叫分類函式並傳入目標欄位
-            result_data = perform_classification(df, target_field)
-            
-            # 將結果轉換為 JSON 格式
-            result_json = {
-                'analysis_type': 'classification',
-                # 這裡直接傳回浮點數，由前端負責格式化，這樣更靈活
-                'accuracy': result_data['accuracy'], 
-                # 將前端 `results_table` 名稱改為 `results_table_data`，
-                # 與分群的回傳資料結構保持一致，方便前端處理
-                'results_table_data': result_data['results_table_data']
-            }
-            return jsonify(result_json)
+        key, args = read_analysis_request()
 
-        else:
-            return jsonify({'error': '無效的分析類型'}), 400
+        # 3. 在工作行程中執行分群或分類，不佔用處理請求的執行緒
+        try:
+            job = submit_analysis_job(key, args)
+        except Overloaded:
+            return overloaded_response()
+        if not job.wait(app.config['ANALYZE_TIMEOUT']):
+            # sklearn 的訓練無法中途停止，工作會繼續執行，之後可由 /analyze/jobs 取得結果
+            return jsonify({'error': '分析逾時，請縮小資料後再試', 'job_id': job.id}), 503
+        if job.status == 'error':
+            return jsonify({'error': job.error}), 400
+
+        body_gz = analysis_jobs.result(job)
+        if body_gz is None:
+            return jsonify({'error': '分析結果已過期，請重新送出'}), 503
+        return gzip_body_response(body_gz, 'application/json')
 
+    except RequestEntityTooLarge:
+        return jsonify({'error': '檔案過大'}), 413
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         # 捕獲更廣泛的錯誤並回傳，提供更詳細的訊息
         return jsonify({'error': f"分析過程發生錯誤: {e}"}), 400
 
+
+@app.route('/analyze/jobs', methods=['POST'])
+def submit_analysis():
+    """
+    送出非同步的分析工作，立即回傳工作編號 (202)。
+
+    參數與 /analyze 相同；以 GET /analyze/jobs/<job_id> 輪詢狀態與結果。
+    """
+    try:
+        key, args = read_analysis_request()
+        job = submit_analysis_job(key, args)
+    except Overloaded:
+        return overloaded_response()
+    except RequestEntityTooLarge:
+        return jsonify({'error': '檔案過大'}), 413
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    status_url = url_for('analysis_status', job_id=job.id)
+    response = job_response(job, 200 if job.status == 'done' else 202)
+    response.headers['Location'] = status_url
+    return response
+
+
+@app.route('/analyze/jobs/<job_id>', methods=['GET'])
+def analysis_status(job_id):
+    """回傳工作的狀態、目前階段與進度；完成時一併回傳結果"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '找不到這個分析工作'}), 404
+    return job_response(job)
+
+
+@app.route('/analyze/jobs', methods=['GET'])
+def analysis_job_stats():
+    """回傳分析工作數量與結果快取的使用狀況"""
+    return jsonify(analysis_jobs.stats())
+
+
+@app.route('/datasets', methods=['POST'])
+def upload_dataset():
+    """
+    上傳並解析檔案，回傳 dataset_id 與欄位資訊。
+
+    之後的 /analyze 與 /analyze/jobs 可以用 dataset_id 取代檔案；同樣的檔案不會再解析一次。
+    """
+    try:
+        upload = read_upload()
+        if upload is None:
+            return jsonify({'error': '缺少檔案'}), 400
+        dataset_id, upload_path, filename = upload
+        if upload_path is None:
+            return jsonify(dataset_registry.info(dataset_id))
+
+        try:
+            future = workers.submit(ingest, upload_path, filename, dataset_registry.path(dataset_id))
+        except Overloaded:
+            discard_upload(upload_path)
+            return overloaded_response()
+        future.result(timeout=app.config['ANALYZE_TIMEOUT'])
+        return jsonify(dataset_registry.info(dataset_id)), 201
+
+    except RequestEntityTooLarge:
+        return jsonify({'error': '檔案過大'}), 413
+    except FuturesTimeoutError:
+        return jsonify({'error': '檔案解析逾時，請縮小資料後再試'}), 503
+    except Exception as e:
+        return jsonify({'error': f"檔案解析發生錯誤: {e}"}), 400
+
+
+@app.route('/datasets/<dataset_id>/rows', methods=['POST'])
+def append_dataset_rows(dataset_id):
+    """
+    把上傳檔案中的資料列附加到資料集之後，回傳新的資料集 (201)。
+
+    原資料集保持不變；新資料集記錄 parent，分群時沿用原資料集的標準化參數與中心點，
+    只以附加的資料列增量更新。
+    """
+    try:
+        if not dataset_registry.exists(dataset_id):
+            return jsonify({'error': '找不到這個資料集'}), 404
+        upload = read_upload(keep_upload=True)
+        if upload is None:
+            return jsonify({'error': '缺少檔案'}), 400
+        upload_id, upload_path, filename = upload
+        child_id = dataset_registry.child_id(dataset_id, upload_id)
+        if dataset_registry.exists(child_id):
+            discard_upload(upload_path)
+            return jsonify(dataset_registry.info(child_id))
+
+        try:
+            future = workers.submit(append_rows, dataset_registry.path(dataset_id), upload_path, filename,
+                                    dataset_registry.path(child_id))
+        except Overloaded:
+            discard_upload(upload_path)
+            return overloaded_response()
+        future.result(timeout=app.config['ANALYZE_TIMEOUT'])
+        return jsonify(dataset_registry.info(child_id)), 201
+
+    except RequestEntityTooLarge:
+        return jsonify({'error': '檔案過大'}), 413
+    except FuturesTimeoutError:
+        return jsonify({'error': '檔案解析逾時，請縮小資料後再試'}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f"檔案解析發生錯誤: {e}"}), 400
+
+
+@app.route('/datasets', methods=['GET'])
+def list_datasets():
+    """回傳已存放的資料集"""
+    return jsonify(dataset_registry.list())
+
+
+@app.route('/datasets/<dataset_id>', methods=['GET'])
+def dataset_info(dataset_id):
+    try:
+        info = dataset_registry.info(dataset_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if info is None:
+        return jsonify({'error': '找不到這個資料集'}), 404
+    return jsonify(info)
+
+
+@app.route('/datasets/<dataset_id>', methods=['DELETE'])
+def delete_dataset(dataset_id):
+    try:
+        deleted = dataset_registry.delete(dataset_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not deleted:
+        return jsonify({'error': '找不到這個資料集'}), 404
+    return jsonify({'dataset_id': dataset_id, 'deleted': True})
+
 # 判斷是否為主程式執行，如果是就啟動伺服器
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,3 @@
+# benchmarks/__init__.py
+# 排序演算法的效能量測工具，執行方式 (於 algo_visualizer 目錄下)：
+#     python -m benchmarks.sort_benchmark --help
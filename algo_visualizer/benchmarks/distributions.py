@@ -0,0 +1,40 @@
+# benchmarks/distributions.py
+
+import random
+
+# 量測用的輸入資料分佈
+DISTRIBUTIONS = ('random', 'sorted', 'reversed', 'few_unique', 'nearly_sorted')
+
+
+def make_input(distribution, n, seed=42):
+    """
+    產生指定分佈、長度為 n 的整數陣列。
+
+    Args:
+        distribution (str): DISTRIBUTIONS 其中之一
+        n (int): 陣列長度
+        seed (int): 隨機種子，確保每次量測的輸入相同
+
+    Returns:
+        list[int]: 測試用陣列
+    """
+    rng = random.Random(seed)
+
+    if distribution == 'random':
+        return [rng.randint(0, n * 10) for _ in range(n)]
+    if distribution == 'sorted':
+        return list(range(n))
+    if distribution == 'reversed':
+        return list(range(n, 0, -1))
+    if distribution == 'few_unique':
+        # 只有 10 種不同的數值，大量重複
+        return [rng.randint(0, 9) for _ in range(n)]
+    if distribution == 'nearly_sorted':
+        # 已排序後隨機交換約 5% 的位置
+        arr = list(range(n))
+        for _ in range(max(1, n // 20) if n > 1 else 0):
+            i, j = rng.randrange(n), rng.randrange(n)
+            arr[i], arr[j] = arr[j], arr[i]
+        return arr
+
+    raise ValueError(f"未知的資料分佈: {distribution}")
@@ -0,0 +1,255 @@
+# benchmarks/sort_benchmark.py
+#
+# 比較六種排序演算法在不同輸入大小與分佈下的表現，並可與先前存下的基準比對，
+# 在動畫步驟紀錄變慢或計數改變時提早發現。
+#
+# 使用方式 (於 algo_visualizer 目錄下)：
+#     python -m benchmarks.sort_benchmark                         # 跑完整量測
+#     python -m benchmarks.sort_benchmark --sizes 10 100 1000     # 指定輸入大小
+#     python -m benchmarks.sort_benchmark --save-baseline base.json
+#     python -m benchmarks.sort_benchmark --baseline base.json    # 有退步時結束碼為 1
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+from algorithms import bubble_sort, insertion_sort, selection_sort, quick_sort, merge_sort, heap_sort
+from benchmarks.distributions import DISTRIBUTIONS, make_input
+
+SORTS = {
+    'bubble': bubble_sort,
+    'insertion': insertion_sort,
+    'selection': selection_sort,
+    'quick': quick_sort,
+    'merge': merge_sort,
+    'heap': heap_sort,
+}
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# CSV 欄位順序，也是每筆結果的欄位
+FIELDS = (
+    'algorithm', 'distribution', 'n',
+    'time_us', 'comparisons', 'swaps',
+    'record_time_us', 'steps', 'peak_memory_bytes', 'response_bytes',
+)
+
+
+def measure(algorithm, distribution, n, repeat=1, max_record_ops=2000000):
+    """
+    量測單一組合 (演算法、分佈、大小)。
+
+    time_us 取自 metrics only 模式 (不紀錄步驟) 的最短時間；
+    若比較加交換次數不超過 max_record_ops，另外以紀錄步驟的模式執行，
+    取得步驟數、紀錄步驟時的時間、尖峰記憶體 (tracemalloc) 與 /sort 回應的 JSON 大小。
+    超過上限時這些欄位為 None。
+    """
+    sort_func = SORTS[algorithm]
+    data = make_input(distribution, n)
+
+    times = []
+    for _ in range(repeat):
+        sorted_data, exe_time, comparisons, swaps, _ = sort_func(data, record=False)
+        times.append(exe_time)
+
+    result = dict.fromkeys(FIELDS)
+    result.update({
+        'algorithm': algorithm,
+        'distribution': distribution,
+        'n': n,
+        'time_us': min(times),
+        'comparisons': comparisons,
+        'swaps': swaps,
+    })
+
+    if comparisons + swaps > max_record_ops:
+        return result
+
+    # 紀錄步驟的時間 (不開 tracemalloc，以免影響計時)
+    _, record_time, _, _, animation_steps = sort_func(data)
+    result['record_time_us'] = record_time
+    result['steps'] = len(animation_steps)
+    del animation_steps
+
+    # 尖峰記憶體：包含產生步驟與序列化成回應
+    tracemalloc.start()
+    sorted_data, exe_time, comparisons, swaps, animation_steps = sort_func(data)
+    payload = json.dumps({
+        'original_data': data,
+        'sorted_data': sorted_data,
+        'time_taken': exe_time,
+        'comparisons': comparisons,
+        'swaps': swaps,
+        'animation_steps': animation_steps,
+    }, separators=(',', ':'))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result['peak_memory_bytes'] = peak
+    result['response_bytes'] = len(payload.encode('utf-8'))
+    return result
+
+
+def run_benchmarks(algorithms, distributions, sizes, repeat=1, max_record_ops=2000000, time_limit=10.0, log=None):
+    """
+    依序量測所有組合。
+
+    同一個演算法與分佈的組合中，若某個大小的 metrics only 時間超過 time_limit 秒，
+    就不再量測更大的輸入 (例如 O(n²) 排序在 10^5 筆時)。
+    """
+    results = []
+    for algorithm in algorithms:
+        for distribution in distributions:
+            for n in sorted(sizes):
+                result = measure(algorithm, distribution, n, repeat, max_record_ops)
+                results.append(result)
+                if log:
+                    log(format_row(result))
+                if result['time_us'] / 1000000 > time_limit:
+                    break
+    return results
+
+
+def growth_exponents(results):
+    """
+    以比較次數對 n 的 log-log 斜率估計成長階數 (約 1 為 n、約 2 為 n²，n log n 介於兩者)。
+
+    Returns:
+        dict: {演算法: {分佈: 斜率}}，只用 n >= 100 且比較次數大於 0 的結果
+    """
+    series = {}
+    for r in results:
+        if r['n'] >= 100 and r['comparisons'] > 0:
+            series.setdefault(r['algorithm'], {}).setdefault(r['distribution'], []).append(
+                (math.log(r['n']), math.log(r['comparisons'])))
+
+    exponents = {}
+    for algorithm, by_distribution in series.items():
+        for distribution, points in by_distribution.items():
+            if len(points) < 2:
+                continue
+            mean_x = sum(x for x, _ in points) / len(points)
+            mean_y = sum(y for _, y in points) / len(points)
+            sxx = sum((x - mean_x) ** 2 for x, _ in points)
+            sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+            exponents.setdefault(algorithm, {})[distribution] = round(sxy / sxx, 3)
+    return exponents
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25, min_time_us=1000):
+    """
+    與基準結果比對，回傳退步項目的說明列表。
+
+    - 比較、交換次數或步驟數有任何改變都視為退步 (預設輸入下這些計數是固定的)
+    - 時間 (time_us、record_time_us) 超過基準的 (1 + tolerance) 倍，且基準時間至少 min_time_us
+      才算退步，避免極短的量測因雜訊誤判
+    - 尖峰記憶體與回應大小超過基準的 (1 + tolerance) 倍
+    """
+    baseline_map = {(b['algorithm'], b['distribution'], b['n']): b for b in baseline}
+    regressions = []
+
+    for r in results:
+        key = (r['algorithm'], r['distribution'], r['n'])
+        b = baseline_map.get(key)
+        if b is None:
+            continue
+        label = '{}/{}/n={}'.format(*key)
+
+        for field in ('comparisons', 'swaps', 'steps'):
+            if r[field] is not None and b.get(field) is not None and r[field] != b[field]:
+                regressions.append(f"{label}: {field} {b[field]} -> {r[field]}")
+
+        for field in ('time_us', 'record_time_us'):
+            if r[field] is None or b.get(field) is None or b[field] < min_time_us:
+                continue
+            if r[field] > b[field] * (1 + tolerance):
+                regressions.append(f"{label}: {field} {b[field]:.0f} -> {r[field]:.0f} ({r[field] / b[field]:.2f}x)")
+
+        for field in ('peak_memory_bytes', 'response_bytes'):
+            if r[field] is None or not b.get(field):
+                continue
+            if r[field] > b[field] * (1 + tolerance):
+                regressions.append(f"{label}: {field} {b[field]} -> {r[field]} ({r[field] / b[field]:.2f}x)")
+
+    return regressions
+
+
+def write_results(results, output_dir):
+    """將結果寫成 results.json (含成長階數估計) 與 results.csv"""
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(os.path.join(output_dir, 'results.json'), 'w', encoding='utf-8') as f:
+        json.dump({'results': results, 'growth_exponents': growth_exponents(results)}, f, indent=2)
+
+    with open(os.path.join(output_dir, 'results.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data['results'] if isinstance(data, dict) else data
+
+
+def format_row(r):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else '-'
+
+    return (f"{r['algorithm']:<10}{r['distribution']:<14}{r['n']:>8}"
+            f"{fmt(r['time_us'], '>14.0f')}{r['comparisons']:>14}{r['swaps']:>12}"
+            f"{fmt(r['record_time_us'], '>14.0f')}{fmt(r['steps'], '>12')}"
+            f"{fmt(r['peak_memory_bytes'], '>14')}{fmt(r['response_bytes'], '>14')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='排序演算法效能量測')
+    parser.add_argument('--algorithms', nargs='+', choices=list(SORTS), default=list(SORTS))
+    parser.add_argument('--distributions', nargs='+', choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument('--repeat', type=int, default=1, help='metrics only 模式重複次數，取最短時間')
+    parser.add_argument('--max-record-ops', type=int, default=2000000,
+                        help='比較加交換次數超過此值時不量測步驟、記憶體與回應大小')
+    parser.add_argument('--time-limit', type=float, default=10.0,
+                        help='單次量測超過此秒數後，同組合不再量測更大的輸入')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='結果輸出目錄')
+    parser.add_argument('--save-baseline', metavar='PATH', help='將本次結果存為基準')
+    parser.add_argument('--baseline', metavar='PATH', help='與基準比對，有退步時結束碼為 1')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='時間與記憶體允許的退步比例')
+    args = parser.parse_args(argv)
+
+    print(f"{'algorithm':<10}{'distribution':<14}{'n':>8}{'time_us':>14}{'comparisons':>14}{'swaps':>12}"
+          f"{'record_us':>14}{'steps':>12}{'peak_mem':>14}{'response':>14}")
+    started = time.perf_counter()
+    results = run_benchmarks(args.algorithms, args.distributions, args.sizes,
+                             args.repeat, args.max_record_ops, args.time_limit, log=print)
+    print(f"\n共 {len(results)} 筆，耗時 {time.perf_counter() - started:.1f} 秒")
+
+    write_results(results, args.output)
+    print(f"結果已寫入 {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'results': results}, f, indent=2)
+        print(f"基準已存至 {args.save_baseline}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, load_results(args.baseline), args.tolerance)
+        if regressions:
+            print(f"\n發現 {len(regressions)} 項退步：")
+            for line in regressions:
+                print('  ' + line)
+            return 1
+        print('\n與基準相比沒有退步')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
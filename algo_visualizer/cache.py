@@ -0,0 +1,146 @@
+# cache.py
+#
+# /sort 的伺服器端結果快取。
+# 同一組輸入 (演算法、數字、選項) 的回應內容完全相同，
+# 因此直接存放已序列化、並以 gzip 壓縮的回應本文，命中時連排序與 JSON 序列化都可省略。
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+def make_key(*parts):
+    """
+    由任意可 JSON 序列化的內容產生快取鍵 (SHA-256)。
+
+    輸入陣列可能很大，只保存雜湊值，不保存陣列本身。
+    """
+    encoded = json.dumps(parts, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """
+    有大小上限與存活時間 (TTL) 的 LRU 快取，存放 gzip 壓縮後的回應本文。
+
+    Args:
+        max_bytes (int): 所有項目壓縮後大小的總上限，超過時淘汰最久未使用的項目
+        ttl (float): 每個項目的存活秒數
+        max_entry_bytes (int): 單一項目的大小上限，預設為 max_bytes 的四分之一
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=600, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._entries = OrderedDict()  # key -> (到期時間, 壓縮後本文)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """取得壓縮後的本文；不存在或已過期時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def __contains__(self, key):
+        """是否有未過期的項目 (不影響命中率統計與淘汰順序)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, key, body_gz):
+        """存入壓縮後的本文；超過單一項目上限時不快取，回傳是否有存入"""
+        size = len(body_gz)
+        if size > self.max_entry_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, body_gz)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        _, body_gz = self._entries.pop(key)
+        self.current_bytes -= len(body_gz)
+
+
+class GzipAccumulator:
+    """
+    一邊串流一邊壓縮回應本文，串流結束後可存入快取。
+
+    每一段都以 Z_SYNC_FLUSH 結尾，add() 回傳的壓縮片段可以直接送給接受 gzip 的用戶端，
+    瀏覽器收到就能解壓縮，不必等串流結束。
+    壓縮後大小超過 limit 時放棄累積 (result() 回傳 None)，避免為了快取而佔用過多記憶體。
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 為 gzip 格式
+        self._chunks = []
+        self._size = 0
+
+    def add(self, text):
+        """壓縮一段文字，回傳這一段的壓縮結果"""
+        return self._keep(self._compressor.compress(text.encode('utf-8')) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def finish(self):
+        """結束壓縮串流，回傳最後一段 (gzip 檔尾)"""
+        return self._keep(self._compressor.flush())
+
+    def result(self):
+        """完整的壓縮本文；需先呼叫 finish()，超過 limit 時回傳 None"""
+        return b''.join(self._chunks) if self._chunks is not None else None
+
+    def _keep(self, chunk):
+        if self._chunks is not None:
+            self._chunks.append(chunk)
+            self._size += len(chunk)
+            if self._size > self.limit:
+                self._chunks = None
+        return chunk
+
+
+def compress_json(payload):
+    """將回應內容序列化為精簡的 JSON 並以 gzip 壓縮"""
+    return gzip.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), compresslevel=6)
@@ -1,48 +1,564 @@
 import pandas as pd
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans, kmeans_plusplus
 from sklearn.tree import DecisionTreeClassifier
+from sklearn.neighbors import KDTree, BallTree
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split, KFold, StratifiedKFold, ParameterGrid
+from sklearn.metrics import accuracy_score, silhouette_score
+from joblib import Parallel, delayed
 import numpy as np
+import time
 
-def perform_clustering(df, n_clusters=3):
+# --- K-Means 引擎 ---
+# 'full': 在全部資料上執行 KMeans
+# 'minibatch': MiniBatchKMeans，每次只用一小批資料更新中心點
+# 'sample': 在隨機抽樣的資料上執行 KMeans
+# 'animated': 以 NumPy 實作的 Lloyd 演算法 (InstrumentedKMeans)，記錄每次迭代的中心點與群集變化，供前端播放動畫
+# 'auto': 資料列數不超過 AUTO_FULL_MAX_ROWS 時用 'full'，否則用 'minibatch'
+# 'minibatch' 與 'sample' 訓練完後，再以分段的向量化運算替全部資料指定群集
+CLUSTERING_ENGINES = ('auto', 'full', 'minibatch', 'sample', 'animated')
+AUTO_FULL_MAX_ROWS = 100000
+MINIBATCH_SIZE = 4096
+SAMPLE_SIZE = 50000
+# 指定群集時每次計算距離的列數，距離矩陣的大小為 ASSIGN_CHUNK_ROWS x 群集數
+ASSIGN_CHUNK_ROWS = 65536
+
+def assign_clusters(X, centers, chunk_rows=ASSIGN_CHUNK_ROWS):
+    """
+    把每一列指定給最近的中心點，回傳 (群集標籤, inertia)。
+
+    分段計算 |x|^2 - 2x·c + |c|^2，記憶體用量與資料列數無關。
+    """
+    centers = np.asarray(centers, dtype=X.dtype)
+    center_norms = (centers ** 2).sum(axis=1)
+    labels = np.empty(len(X), dtype=np.int32)
+    inertia = 0.0
+    for start in range(0, len(X), chunk_rows):
+        chunk = X[start:start + chunk_rows]
+        distances = center_norms - 2 * (chunk @ centers.T)
+        nearest = distances.argmin(axis=1)
+        labels[start:start + chunk_rows] = nearest
+        # 加回 |x|^2 才是實際的平方距離；浮點誤差可能產生極小的負值
+        closest = distances[np.arange(len(chunk)), nearest] + (chunk ** 2).sum(axis=1)
+        inertia += float(np.maximum(closest, 0).sum())
+    return labels, inertia
+
+class InstrumentedKMeans:
+    """
+    以 NumPy 實作的 K-Means (Lloyd 演算法)，記錄每次迭代的動畫影格。
+
+    距離以 assign_clusters 分段計算，中心點以 bincount 累加各群的總和，記憶體用量與資料列數無關。
+    每個影格只記錄中心點與這次改變群集的列 (第一個影格為全部資料列的起始群集)，
+    不為每一列建立資料，迭代次數多或資料列很多時影格仍然很小。
+    屬性的名稱與 sklearn 的 KMeans 相同 (cluster_centers_、labels_、inertia_、n_iter_)，另有 frames_。
+
+    Args:
+        n_clusters (int): 群集數
+        max_iter (int): 迭代次數上限
+        tol (float): 收斂門檻 (與 sklearn 相同，相對於各特徵變異數的平均)
+        init (np.ndarray): 起始中心點，省略時以 k-means++ 初始化
+    """
+
+    def __init__(self, n_clusters, max_iter=300, tol=1e-4, init=None, chunk_rows=ASSIGN_CHUNK_ROWS):
+        self.n_clusters = n_clusters
+        self.max_iter = max_iter
+        self.tol = tol
+        self.init = init
+        self.chunk_rows = chunk_rows
+
+    def fit(self, X):
+        """
+        訓練並記錄影格。frames_ 為 {'centers': 每個影格的中心點 (影格數 x 群集數 x 特徵數)、
+        'inertia'、'changed' (改變群集的列數)、'deltas' (改變群集的 (列位置, 新群集))}。
+        影格 t 的群集是把每一列指定給影格 t 的中心點的結果。
+        """
+        if self.init is None:
+            centers, _ = kmeans_plusplus(np.asarray(X), self.n_clusters, random_state=42)
+        else:
+            centers = np.asarray(self.init)
+        centers = centers.astype(np.float64)
+        tol = self.tol * float(np.mean(np.var(X, axis=0)))
+
+        frames = {'centers': [], 'inertia': [], 'changed': [], 'deltas': []}
+        labels = None
+        n_iter = 0
+        converged = False
+        for iteration in range(self.max_iter + 1):
+            new_labels, inertia = assign_clusters(X, centers, self.chunk_rows)
+            changed = np.arange(len(X)) if labels is None else np.flatnonzero(new_labels != labels)
+            labels = new_labels
+            frames['centers'].append(centers)
+            frames['inertia'].append(inertia)
+            frames['changed'].append(len(changed))
+            frames['deltas'].append((changed, labels[changed]))
+            # 群集不再改變 (中心點也不會再移動)、上一次更新的移動量低於門檻，或已達迭代次數上限
+            if converged or (iteration and not len(changed)) or iteration == self.max_iter:
+                break
+            centers, shift = self._update_centers(X, labels, centers)
+            n_iter += 1
+            converged = shift <= tol
+
+        self.cluster_centers_ = centers
+        self.labels_ = labels
+        self.inertia_ = inertia
+        self.n_iter_ = n_iter
+        frames['centers'] = np.asarray(frames['centers'])
+        self.frames_ = frames
+        return self
+
+    def _update_centers(self, X, labels, centers):
+        """每群的平均值為新的中心點 (沒有資料列的群集保留原中心點)，回傳 (新的中心點, 移動量的平方和)"""
+        k = len(centers)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.column_stack([np.bincount(labels, weights=X[:, j], minlength=k) for j in range(X.shape[1])])
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        return updated, float(((updated - centers) ** 2).sum())
+
+def fit_kmeans(X, n_clusters, engine, max_iter=300, tol=1e-4, init=None):
+    """
+    以指定的引擎 ('full'、'minibatch'、'sample' 或 'animated') 訓練 K-Means。
+
+    init 為起始中心點 (warm start)，省略時以 k-means++ 初始化。
+
+    Returns:
+        tuple: (訓練好的模型, 每一列的群集標籤, inertia)
+    """
+    if engine == 'animated':
+        kmeans = InstrumentedKMeans(n_clusters, max_iter=max_iter, tol=tol, init=init).fit(X)
+        return kmeans, kmeans.labels_, kmeans.inertia_
+
+    if init is None:
+        init_options = {'init': 'k-means++', 'n_init': 'auto'}
+    else:
+        init_options = {'init': np.asarray(init, dtype=X.dtype), 'n_init': 1}
+
+    if engine == 'full':
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, max_iter=max_iter, tol=tol, **init_options)
+        labels = kmeans.fit_predict(X)
+        return kmeans, labels, kmeans.inertia_
+
+    if engine == 'minibatch':
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, max_iter=max_iter, tol=tol,
+                                 batch_size=MINIBATCH_SIZE, compute_labels=False, **init_options)
+        kmeans.fit(X)
+    else:
+        rng = np.random.default_rng(42)
+        sample = X
+        if len(X) > SAMPLE_SIZE:
+            sample = X[np.sort(rng.choice(len(X), SAMPLE_SIZE, replace=False))]
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, max_iter=max_iter, tol=tol, **init_options)
+        kmeans.fit(sample)
+    labels, inertia = assign_clusters(X, kmeans.cluster_centers_)
+    return kmeans, labels, inertia
+
+# --- 以上一次的結果為起點 (warm start) ---
+# 由 sessions.ClusteringSession 保存上一次的中心點，改變 k 或附加資料列時不必從頭開始
+WARM_SEED_SAMPLE = 10000
+
+def grow_centers(X, centers, k):
+    """k 變大：保留原有的中心點，其餘以 k-means++ 的方式 (依與最近中心點的平方距離加權) 從抽樣中挑選"""
+    rng = np.random.default_rng(42)
+    sample = X
+    if len(X) > WARM_SEED_SAMPLE:
+        sample = X[np.sort(rng.choice(len(X), WARM_SEED_SAMPLE, replace=False))]
+    sample = np.asarray(sample, dtype=np.float64)
+    centers = [np.asarray(center, dtype=np.float64) for center in centers]
+    closest = ((sample[:, None, :] - np.asarray(centers)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+    while len(centers) < k:
+        total = closest.sum()
+        index = rng.choice(len(sample), p=closest / total) if total > 0 else rng.integers(len(sample))
+        centers.append(sample[index])
+        closest = np.minimum(closest, ((sample - sample[index]) ** 2).sum(axis=1))
+    return np.asarray(centers)
+
+def shrink_centers(centers, counts, k):
+    """k 變小：以各群列數為權重，把原有的中心點再分成 k 群"""
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init='auto')
+    kmeans.fit(centers, sample_weight=np.maximum(counts, 1))
+    return kmeans.cluster_centers_
+
+def partial_fit_centers(centers, counts, X_new):
+    """
+    以附加的資料列增量更新中心點，回傳 (新的中心點, 新的各群列數)。
+
+    新資料列先指定給最近的中心點，每群的中心點更新為 (舊中心點 x 舊列數 + 新資料列總和) / 新列數。
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    labels, _ = assign_clusters(np.asarray(X_new, dtype=np.float64), centers)
+    k = len(centers)
+    added = np.bincount(labels, minlength=k)
+    sums = np.column_stack([np.bincount(labels, weights=X_new[:, j], minlength=k) for j in range(X_new.shape[1])])
+    new_counts = counts + added
+    updated = (centers * counts[:, None] + sums) / np.maximum(new_counts, 1)[:, None]
+    return updated, new_counts
+
+# --- 自動選擇群集數 ---
+# 在 K_RANGE 的每個 k 上分別訓練，以 silhouette 分數最高者為結果 (同分時取較小的 k)。
+# silhouette 只在 SILHOUETTE_SAMPLE 列的抽樣上計算，成本與資料列數無關。
+AUTO_K_MIN = 2
+AUTO_K_MAX = 10
+SILHOUETTE_SAMPLE = 2000
+# 資料列數少於此值時依序評估，啟動工作行程的成本比訓練還高
+PARALLEL_MIN_ROWS = 20000
+
+def evaluate_k(X, k, engine, max_iter, tol, sample_index):
+    """訓練一個 k 並計算 inertia 與抽樣的 silhouette 分數 (由 joblib 平行呼叫)"""
+    start_time = time.perf_counter()
+    kmeans, labels, inertia = fit_kmeans(X, k, engine, max_iter, tol)
+    fit_time = time.perf_counter() - start_time
+    sample_labels = labels[sample_index]
+    if len(np.unique(sample_labels)) > 1:
+        silhouette = float(silhouette_score(X[sample_index], sample_labels))
+    else:
+        silhouette = -1.0
+    return {
+        'k': k,
+        'centers': kmeans.cluster_centers_,
+        'inertia': float(inertia),
+        'silhouette': silhouette,
+        'iterations': int(kmeans.n_iter_),
+        'fit_time': fit_time,
+    }
+
+def elbow_k(k_values, inertias):
+    """手肘法：inertia 曲線上離首尾連線最遠的點"""
+    if len(k_values) < 3:
+        return k_values[0]
+    x = np.asarray(k_values, dtype=float)
+    y = np.asarray(inertias, dtype=float)
+    # 兩軸各自縮放到 0~1，距離才不會被 inertia 的數值大小主導
+    x = (x - x[0]) / (x[-1] - x[0])
+    y = (y - y[-1]) / ((y[0] - y[-1]) or 1.0)
+    distances = np.abs(x + y - 1) / np.sqrt(2)
+    return int(k_values[int(distances.argmax())])
+
+def select_k(X, k_values, engine, max_iter=300, tol=1e-4, n_jobs=1):
+    """
+    平行評估每個 k，回傳 (各 k 的評估結果, 選出的結果)。
+
+    joblib 會把大型的 X 以記憶體映射分享給各個工作行程，標準化後的矩陣只有一份。
+    n_jobs 為固定的行程數；在行程池的工作中執行時不可用 -1，否則每個工作都會再啟動 CPU 核心數個行程。
+    """
+    rng = np.random.default_rng(42)
+    sample_index = np.arange(len(X))
+    if len(X) > SILHOUETTE_SAMPLE:
+        sample_index = np.sort(rng.choice(len(X), SILHOUETTE_SAMPLE, replace=False))
+    if len(X) < PARALLEL_MIN_ROWS:
+        n_jobs = 1
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_k)(X, k, engine, max_iter, tol, sample_index) for k in k_values)
+    best = max(results, key=lambda result: (result['silhouette'], -result['k']))
+    return results, best
+
+def perform_clustering(df, n_clusters=3, engine='auto', max_iter=300, tol=1e-4, k_max=AUTO_K_MAX, session=None,
+                       n_jobs=1, progress=None):
     """
     執行 K-Means 分群演算法
     
     Args:
         df (pd.DataFrame): 包含數值特徵的 DataFrame
-        n_clusters (int): 分群的數量
+        n_clusters (int): 分群的數量；'auto' 時在 AUTO_K_MIN 到 k_max 之間自動選擇
+        engine (str): CLUSTERING_ENGINES 之一
+        max_iter (int): 迭代次數上限 ('minibatch' 為走訪全部資料的次數上限)
+        tol (float): 收斂門檻
+        k_max (int): 自動選擇時的最大群集數
+        session (ClusteringSession): 資料集的分群工作階段，沿用標準化結果並以上一次的中心點為起點，可省略
+        n_jobs (int): 自動選擇群集數時平行評估的行程數 (在行程池中執行時由 workers.submit_parallel 決定)
+        progress (callable): 進入各階段時以階段名稱 ('scale'、'fit') 呼叫，可省略
 
     Returns:
-        pd.DataFrame: 原始資料加上 'cluster' 標籤
+        dict: 'results_df' 為原始資料加上 'cluster' 標籤，
+              以及實際使用的引擎、訓練時間 (秒)、inertia 與迭代次數；
+              自動選擇時另有 'k_selection' (各 k 的 inertia 與 silhouette 曲線)；
+              使用 session 時 'warm_start' 為起點的來源
+              ('same_k'、'grown'、'shrunk'、'appended'，沒有可用的起點時為 None)；
+              'animated' 引擎另有 'frames' (InstrumentedKMeans.frames_，中心點為原始資料的單位，
+              'columns' 為中心點各維度的欄位名稱)
     """
+    if engine not in CLUSTERING_ENGINES:
+        raise ValueError(f"無效的分群引擎 '{engine}'。")
+
     # 移除非數值欄位，只留下數值特徵進行分群
     # 這一步很重要，因為 K-Means 只能處理數值資料
     numeric_df = df.select_dtypes(include=['number'])
     
     if numeric_df.empty:
         raise ValueError("資料中沒有數值欄位可以進行分群。")
+    if engine == 'auto':
+        engine = 'full' if len(numeric_df) <= AUTO_FULL_MAX_ROWS else 'minibatch'
 
-    # 標準化資料
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
+    # 標準化資料；大型資料以 float32 計算，記憶體用量減半
+    if progress:
+        progress('scale')
+    appended = 0
+    if session is not None:
+        # 工作階段中的矩陣一律為 float32
+        scaled_data, appended = session.scaled_matrix(numeric_df)
+        mean, scale = session.scaling()
+    else:
+        scaler = StandardScaler()
+        if engine == 'full':
+            scaled_data = scaler.fit_transform(numeric_df)
+        else:
+            scaled_data = scaler.fit_transform(numeric_df.to_numpy(dtype=np.float32))
+        mean, scale = scaler.mean_, scaler.scale_
     
     # 執行 K-Means 分群
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init='auto')
-    df['cluster'] = kmeans.fit_predict(scaled_data)
+    if progress:
+        progress('fit')
+    start_time = time.perf_counter()
+    k_selection = warm_start = frames = None
+    if n_clusters == 'auto':
+        k_values = list(range(AUTO_K_MIN, max(AUTO_K_MIN, min(k_max, len(scaled_data) - 1)) + 1))
+        results, best = select_k(scaled_data, k_values, engine, max_iter, tol, n_jobs)
+        # 以選出的中心點替全部資料指定群集，不必重新訓練
+        labels, inertia = assign_clusters(scaled_data, best['centers'])
+        n_clusters, iterations = best['k'], best['iterations']
+        k_selection = {
+            'k_values': k_values,
+            'inertia': [result['inertia'] for result in results],
+            'silhouette': [result['silhouette'] for result in results],
+            'fit_times': [result['fit_time'] for result in results],
+            'elbow_k': elbow_k(k_values, [result['inertia'] for result in results]),
+            'chosen_k': n_clusters,
+            'silhouette_sample': int(min(len(scaled_data), SILHOUETTE_SAMPLE)),
+        }
+        centers = best['centers']
+        if engine == 'animated':
+            # 以選出的 k 再訓練一次 (起點與評估時相同) 以取得動畫影格
+            kmeans, labels, inertia = fit_kmeans(scaled_data, n_clusters, engine, max_iter, tol)
+            frames = kmeans.frames_
+    elif session is not None and engine != 'animated':
+        labels, inertia, iterations, centers, warm_start = warm_fit(
+            scaled_data, n_clusters, engine, max_iter, tol, session, appended)
+    else:
+        # 動畫一律從 k-means++ 的起點開始，才看得到中心點移動的過程
+        kmeans, labels, inertia = fit_kmeans(scaled_data, n_clusters, engine, max_iter, tol)
+        iterations, centers = kmeans.n_iter_, kmeans.cluster_centers_
+        frames = getattr(kmeans, 'frames_', None)
+    fit_time = time.perf_counter() - start_time
+    if session is not None:
+        session.save_fit(n_clusters, centers, labels)
+
+    df['cluster'] = labels
     
-    return df
+    result = {
+        'results_df': df,
+        'engine': engine,
+        'n_clusters': n_clusters,
+        'fit_time': fit_time,
+        'inertia': float(inertia),
+        'iterations': int(iterations),
+    }
+    if k_selection:
+        result['k_selection'] = k_selection
+    if session is not None:
+        result['warm_start'] = warm_start
+    if frames is not None:
+        # 中心點轉回原始資料的單位，前端可以直接畫在散佈圖上
+        frames['centers'] = frames['centers'] * np.asarray(scale) + np.asarray(mean)
+        frames['columns'] = [str(name) for name in numeric_df.columns]
+        result['frames'] = frames
+    return result
+
+def warm_fit(X, k, engine, max_iter, tol, session, appended):
+    """
+    以工作階段保存的中心點為起點訓練，回傳 (標籤, inertia, 迭代次數, 中心點, 起點的來源)。
+
+    附加資料列且父資料集有同樣 k 的結果時，只以新資料列增量更新中心點，不重新訓練。
+    """
+    if appended and session.parent is not None:
+        previous = session.parent.centers(k)
+        if previous is not None:
+            centers, _ = partial_fit_centers(*previous, X[-appended:])
+            labels, inertia = assign_clusters(X, centers)
+            return labels, inertia, 1, centers, 'appended'
+
+    nearest = session.nearest_centers(k) or (session.parent.nearest_centers(k) if session.parent else None)
+    if nearest is None:
+        init, warm_start = None, None
+    else:
+        previous_k, centers, counts = nearest
+        if previous_k == k:
+            init, warm_start = centers, 'same_k'
+        elif previous_k < k:
+            init, warm_start = grow_centers(X, centers, k), 'grown'
+        else:
+            init, warm_start = shrink_centers(centers, counts, k), 'shrunk'
+    kmeans, labels, inertia = fit_kmeans(X, k, engine, max_iter, tol, init=init)
+    return labels, inertia, kmeans.n_iter_, kmeans.cluster_centers_, warm_start
 
-def perform_classification(df, target_field_name):
+# --- K 鄰居分類 ---
+# 訓練集的特徵標準化後建立 KD-tree (維度較高時改用 ball-tree)，查詢成本約為 O(m log n)，
+# 不必計算每一列與每個訓練列的距離。查詢分成 KNN_QUERY_CHUNK 列一批，
+# 以執行緒平行處理 (樹的查詢不持有 GIL，各執行緒共用同一個索引)。
+CLASSIFIERS = ('tree', 'knn')
+KNN_MAX_NEIGHBORS = 50
+# 維度超過此值時 KD-tree 的剪枝效果變差，改用 ball-tree
+KD_TREE_MAX_DIMS = 15
+KNN_LEAF_SIZE = 20
+KNN_QUERY_CHUNK = 16384
+
+def build_neighbor_index(X):
+    """訓練集的空間索引：維度不超過 KD_TREE_MAX_DIMS 時用 KD-tree，否則用 ball-tree"""
+    tree_class = KDTree if X.shape[1] <= KD_TREE_MAX_DIMS else BallTree
+    return tree_class(X, leaf_size=KNN_LEAF_SIZE)
+
+def vote_neighbors(neighbor_labels):
+    """
+    多數決：每一列的鄰居標籤中出現最多次的類別。
+    同票時取編碼較小的類別 (與 KNeighborsClassifier 相同)；記憶體只需 O(列數 × k)。
+    """
+    counts = np.stack([(neighbor_labels == neighbor_labels[:, [j]]).sum(axis=1)
+                       for j in range(neighbor_labels.shape[1])], axis=1)
+    # 次數相同時，標籤較小者的鍵值較大
+    keys = counts.astype(np.int64) * (int(neighbor_labels.max()) + 1) - neighbor_labels
+    return neighbor_labels[np.arange(len(neighbor_labels)), keys.argmax(axis=1)]
+
+def query_chunk(index, X, k, y_train, keep_neighbors):
+    """一批資料列的 (預測編碼, 鄰居在訓練集中的位置)；不需要鄰居時後者為 None (由 joblib 平行呼叫)"""
+    neighbors = index.query(X, k=k, return_distance=False)
+    return vote_neighbors(y_train[neighbors]), neighbors if keep_neighbors else None
+
+def knn_predict(features, train_positions, y_train, n_neighbors, return_neighbors=False, index_store=None,
+                store_key=None, n_jobs=1):
+    """
+    以訓練集的空間索引預測每一列的類別。
+
+    Args:
+        features (np.ndarray): 全部資料列的特徵矩陣
+        train_positions (np.ndarray): 訓練集的列位置
+        y_train (np.ndarray): 訓練集的類別編碼
+        index_store (NeighborIndexStore): 保存索引的位置，有保存過時直接讀取，可省略
+        store_key (tuple): (目標欄位, 特徵欄位)，使用 index_store 時必填
+        n_jobs (int): 平行查詢的執行緒數 (固定的數目，不用 -1 以免超出工作的計算預算)
+
+    Returns:
+        tuple: (預測編碼, 鄰居的列位置 (未要求時為 None), 索引與查詢的資訊)
+    """
+    k = min(n_neighbors, len(train_positions))
+    start_time = time.perf_counter()
+    saved = index_store.load(*store_key) if index_store else None
+    if saved:
+        index, mean, scale = saved['index'], saved['mean'], saved['scale']
+    else:
+        train = features[train_positions]
+        mean = train.mean(axis=0)
+        scale = train.std(axis=0)
+        scale[scale == 0] = 1.0
+        index = build_neighbor_index((train - mean) / scale)
+        if index_store:
+            index_store.save(*store_key, index, mean, scale)
+    index_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    X = (features - mean) / scale
+    starts = range(0, len(X), KNN_QUERY_CHUNK)
+    if len(starts) == 1:
+        n_jobs = 1
+    chunks = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(query_chunk)(index, X[start:start + KNN_QUERY_CHUNK], k, y_train, return_neighbors)
+        for start in starts)
+    y_pred = np.concatenate([pred for pred, _ in chunks])
+    # 鄰居轉為原始資料中的列位置
+    neighbors = train_positions[np.vstack([nb for _, nb in chunks])] if return_neighbors else None
+    query_time = time.perf_counter() - start_time
+
+    return y_pred, neighbors, {
+        'n_neighbors': k,
+        'algorithm': 'kd_tree' if isinstance(index, KDTree) else 'ball_tree',
+        'index_cached': bool(saved),
+        'index_time': index_time,
+        'query_time': query_time,
+    }
+
+# --- 決策樹的交叉驗證調參 ---
+# 在訓練集上以 k-fold 交叉驗證評估 TREE_PARAM_GRID 的每一組參數，
+# (參數, fold) 的每個組合各是一個工作，由 joblib 平行分給多個行程；
+# 特徵矩陣只前處理一次，joblib 以記憶體映射分享給各個工作行程。
+TREE_PARAM_GRID = {
+    'max_depth': [None, 5, 10, 20],
+    'min_samples_leaf': [1, 5, 20],
+    'criterion': ['gini', 'entropy'],
+}
+CV_FOLDS = 5
+CV_MAX_FOLDS = 10
+# 訓練列數少於此值時依序評估。網格與 fold 的組合有上百個工作，每個工作都要完整訓練一棵樹，
+# 比 select_k 的門檻 (PARALLEL_MIN_ROWS) 低得多時啟動工作行程就已划算
+TUNE_PARALLEL_MIN_ROWS = 2000
+
+def evaluate_tree_fold(X, y, train_index, test_index, params):
+    """以一組參數在一個 fold 上訓練並計算準確率 (由 joblib 平行呼叫)"""
+    start_time = time.perf_counter()
+    clf = DecisionTreeClassifier(random_state=42, **params)
+    clf.fit(X[train_index], y[train_index])
+    fit_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    score = accuracy_score(y[test_index], clf.predict(X[test_index]))
+    return {'score': float(score), 'fit_time': fit_time, 'score_time': time.perf_counter() - start_time}
+
+def tune_tree(X, y, folds=CV_FOLDS, param_grid=TREE_PARAM_GRID, n_jobs=1):
+    """
+    以交叉驗證選擇決策樹的參數。
+
+    每個類別至少有 folds 列時使用分層的 k-fold，否則使用一般的 k-fold。
+    n_jobs 為固定的行程數，與 select_k 相同不可用 -1。
+
+    Returns:
+        tuple: (各組參數的結果 (平均、標準差與每個 fold 的分數與時間), 最佳的一組參數)
+    """
+    class_counts = np.bincount(y)
+    class_counts = class_counts[class_counts > 0]
+    if class_counts.min() >= folds:
+        splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    else:
+        splitter = KFold(n_splits=folds, shuffle=True, random_state=42)
+    splits = list(splitter.split(X, y))
+    candidates = list(ParameterGrid(param_grid))
+
+    if len(X) < TUNE_PARALLEL_MIN_ROWS:
+        n_jobs = 1
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_tree_fold)(X, y, train_index, test_index, params)
+        for params in candidates for train_index, test_index in splits)
+
+    results = []
+    for i, params in enumerate(candidates):
+        fold_scores = scores[i * folds:(i + 1) * folds]
+        values = np.array([fold['score'] for fold in fold_scores])
+        results.append({
+            'params': params,
+            'mean_score': float(values.mean()),
+            'std_score': float(values.std()),
+            'folds': fold_scores,
+        })
+    # 平均分數相同時取參數網格中較前面的一組
+    best = max(results, key=lambda result: result['mean_score'])
+    return results, best['params']
+
+def perform_classification(df, target_field_name, classifier='tree', n_neighbors=5, return_neighbors=False,
+                           index_store=None, tune=False, cv_folds=CV_FOLDS, n_jobs=1, progress=None):
     """
     執行決策樹分類演算法，並回傳訓練、測試與分析結果。
     Args:
         df (pd.DataFrame): 包含特徵和目標標籤的 DataFrame。
         target_field_name (str): 目標欄位的名稱。
+        classifier (str): CLASSIFIERS 之一 ('tree' 決策樹、'knn' K 鄰居)
+        n_neighbors (int): K 鄰居的 k
+        return_neighbors (bool): K 鄰居是否回傳每一列的鄰居 ('neighbors'，原始資料中的列位置)
+        index_store (NeighborIndexStore): K 鄰居索引的保存位置，同一個資料集只建立一次，可省略
+        tune (bool): 決策樹是否在訓練集上以 cv_folds 折交叉驗證選擇參數 (TREE_PARAM_GRID)
+        n_jobs (int): K 鄰居查詢的執行緒數與交叉驗證的行程數 (在行程池中執行時由 workers.submit_parallel 決定)
+        progress (callable): 進入各階段時以階段名稱 ('scale'、'fit') 呼叫，可省略
     Returns:
-        dict: 包含準確率、訓練集、測試集以及整體分類結果的字典。
+        dict: 包含準確率、整體分類結果 ('results_df'，原始資料加上 'is_train' 與 'predicted_class')、
+              預測類別分佈、使用的分類器與訓練時間 (秒)；K 鄰居另有 'knn' (索引與查詢的資訊)；
+              調參時另有 'cv' (各組參數每個 fold 的分數與時間、最佳參數)，預測使用最佳參數的模型。
     """
+    if classifier not in CLASSIFIERS:
+        raise ValueError(f"無效的分類器 '{classifier}'。")
+    if tune and classifier != 'tree':
+        raise ValueError('交叉驗證調參只支援決策樹。')
     # 檢查目標欄位是否存在
     if target_field_name not in df.columns:
         raise ValueError(f"指定的目標欄位 '{target_field_name}' 不存在於資料中。")
@@ -51,33 +567,30 @@ def perform_classification(df, target_field_name):
     y = df[target_field_name]
     X = df.drop(columns=[target_field_name])
 
+    if progress:
+        progress('scale')
+
     # --- 1. 目標標籤編碼 ---
-    # 檢查目標標籤是否為數值型，如果不是，則進行編碼
-    if y.dtype == 'object' or y.dtype == 'string':
-        y_encoded, y_labels = pd.factorize(y)
-    else:
-        y_encoded = y
-        y_labels = y.unique()
+    # 數值型與類別型目標一律編碼為 0..n-1，預測結果再以 y_labels.take 轉回原始標籤；
+    # 缺值視為一個獨立的類別
+    y_encoded, y_labels = pd.factorize(y, sort=pd.api.types.is_numeric_dtype(y), use_na_sentinel=False)
 
     # --- 2. 特徵資料預處理 ---
     # 區分數值型和類別型特徵
     numerical_features = X.select_dtypes(include=np.number).columns.tolist()
-    categorical_features = X.select_dtypes(include=['object', 'string']).columns.tolist()
-
-    X_processed = X.copy()
+    categorical_features = X.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
 
     if categorical_features:
         # 使用 One-Hot Encoding 處理類別型特徵
-        encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=False)
+        encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=False, dtype=np.float32)
         encoded_features = encoder.fit_transform(X[categorical_features])
 
         # 取得編碼後的新欄位名稱
         encoded_feature_names = encoder.get_feature_names_out(categorical_features)
         encoded_df = pd.DataFrame(encoded_features, columns=encoded_feature_names, index=X.index)
 
-        # 將編碼後的特徵與數值型特徵合併
-        # 這裡使用 pd.concat 並在 axis=1 上處理，可以確保索引對齊
-        X_processed = pd.concat([X[numerical_features].reset_index(drop=True), encoded_df.reset_index(drop=True)], axis=1)
+        # 將編碼後的特徵與數值型特徵合併 (兩者的索引都是原始 df 的索引)
+        X_processed = pd.concat([X[numerical_features], encoded_df], axis=1)
     else:
         X_processed = X[numerical_features]
 
@@ -85,39 +598,66 @@ def perform_classification(df, target_field_name):
     if X_processed.empty:
         raise ValueError("資料中沒有可用的數值或可編碼的類別特徵。")
 
+    # 決策樹內部以 float32 計算，直接轉為 float32 矩陣可省去訓練與預測時的轉換
+    features = X_processed.to_numpy(dtype=np.float32)
+
     # --- 3. 分割資料集 ---
-    X_train, X_test, y_train, y_test = train_test_split(X_processed, y_encoded, test_size=0.3, random_state=42)
+    # 以列位置分割 (與分割 DataFrame 的亂數順序相同)，不依賴 df 的索引
+    train_positions, test_positions = train_test_split(np.arange(len(df)), test_size=0.3, random_state=42)
 
-    # --- 4. 建立並訓練模型 ---
-    clf = DecisionTreeClassifier(random_state=42)
-    clf.fit(X_train, y_train)
+    # --- 4. 建立並訓練模型，訓練集與測試集一次預測完成 ---
+    if progress:
+        progress('fit')
+    start_time = time.perf_counter()
+    neighbors = knn_info = cv_info = None
+    if classifier == 'knn':
+        y_pred_encoded, neighbors, knn_info = knn_predict(
+            features, train_positions, y_encoded[train_positions], n_neighbors, return_neighbors,
+            index_store, (target_field_name, [str(name) for name in X_processed.columns]), n_jobs)
+    else:
+        params = {}
+        if tune:
+            cv_start_time = time.perf_counter()
+            candidates, params = tune_tree(features[train_positions], y_encoded[train_positions], cv_folds,
+                                           n_jobs=n_jobs)
+            cv_info = {
+                'folds': cv_folds,
+                'best_params': params,
+                'best_score': max(candidate['mean_score'] for candidate in candidates),
+                'candidates': candidates,
+                'time': time.perf_counter() - cv_start_time,
+            }
+        # 以 (最佳) 參數在整個訓練集上重新訓練
+        clf = DecisionTreeClassifier(random_state=42, **params)
+        clf.fit(features[train_positions], y_encoded[train_positions])
+        y_pred_encoded = clf.predict(features)
+    fit_time = time.perf_counter() - start_time
 
-    # --- 5. 進行預測並計算準確率 ---
-    y_pred_encoded = clf.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred_encoded)
+    # --- 5. 計算準確率 ---
+    accuracy = accuracy_score(y_encoded[test_positions], y_pred_encoded[test_positions])
 
     # --- 6. 準備回傳資料給前端 ---
-    # 由於特徵資料經過 One-Hot Encoding，我們需要將預測結果合併回原始資料
-    # 首先確保 X_test 的索引與原始 df 匹配
-    original_indices = df.index
-    train_indices = X_train.index
-    test_indices = X_test.index
-
-    # 建立一個空 DataFrame 來存放所有結果
-    combined_results_df = df.copy()
-    combined_results_df['is_train'] = False
-    combined_results_df.loc[train_indices, 'is_train'] = True
+    is_train = np.zeros(len(df), dtype=bool)
+    is_train[train_positions] = True
+    combined_results_df = df.assign(is_train=is_train, predicted_class=y_labels.take(y_pred_encoded))
 
-    # 將編碼後的預測結果轉換回原始標籤
-    combined_results_df['predicted_class'] = '' # 初始化欄位
-    combined_results_df.loc[train_indices, 'predicted_class'] = [y_labels[i] for i in clf.predict(X_train)]
-    combined_results_df.loc[test_indices, 'predicted_class'] = [y_labels[i] for i in y_pred_encoded]
+    # 計算整體預測結果分佈，方便 chart.js 繪圖；以全部資料列計算，回傳的資料列可能只是抽樣
+    class_counts = pd.Series(np.bincount(y_pred_encoded, minlength=len(y_labels)), index=y_labels)
+    class_counts = class_counts[class_counts > 0].sort_values(ascending=False, kind='stable')
+    # JSON 的鍵必須是字串 (類別可能是整數)
+    class_distribution = {str(label): int(count) for label, count in class_counts.items()}
 
-    # 計算整體預測結果分佈，方便 chart.js 繪圖
-    class_distribution = pd.Series(combined_results_df['predicted_class']).value_counts().to_dict()
-
-    return {
+    result = {
         'accuracy': accuracy,
-        'results_table_data': combined_results_df.to_dict('records'),
-        'class_distribution': class_distribution
+        'results_df': combined_results_df,
+        'class_distribution': class_distribution,
+        'classifier': classifier,
+        'fit_time': fit_time,
     }
+    if knn_info:
+        result['knn'] = knn_info
+    if cv_info:
+        result['cv'] = cv_info
+    if neighbors is not None:
+        result['neighbors'] = neighbors
+    return result
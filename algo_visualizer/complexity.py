@@ -0,0 +1,207 @@
+# complexity.py
+#
+# 各排序演算法的理論複雜度 (ALGORITHM_COMPLEXITY)，以及以實際量測判斷時間複雜度：
+# 先判斷輸入資料屬於哪一種分佈，再用同分佈、不同大小的輸入執行演算法 (metrics only)，
+# 把操作次數分別對 n、n log n、n² 做擬合，誤差最小者即為量測到的成長階數。
+
+import math
+from functools import lru_cache
+
+from algorithms import SORT_ALGORITHMS, run_sort
+from benchmarks.distributions import make_input
+
+# 用來擬合的輸入大小，涵蓋 8 倍的範圍已足以區分三種成長階數
+SAMPLE_SIZES = (32, 64, 128, 256)
+
+GROWTH_MODELS = {
+    'O(n)': lambda n: n,
+    'O(n log n)': lambda n: n * math.log2(n),
+    'O(n²)': lambda n: n * n,
+}
+
+
+# 演算法複雜度資訊
+ALGORITHM_COMPLEXITY = {
+    'bubble': {
+        'time': {
+            'best': 'O(n)',
+            'average': 'O(n²)',
+            'worst': 'O(n²)'
+        },
+        'space': 'O(1)'
+    },
+    'insertion': {
+        'time': {
+            'best': 'O(n)',
+            'average': 'O(n²)',
+            'worst': 'O(n²)'
+        },
+        'space': 'O(1)'
+    },
+    'selection': {
+        'time': {
+            'best': 'O(n²)',
+            'average': 'O(n²)',
+            'worst': 'O(n²)'
+        },
+        'space': 'O(1)'
+    },
+    'quick': {
+        'time': {
+            'best': 'O(n log n)',
+            'average': 'O(n log n)',
+            'worst': 'O(n²)'
+        },
+        'space': 'O(log n) to O(n)'
+    },
+    'merge': {
+        'time': {
+            'best': 'O(n log n)',
+            'average': 'O(n log n)',
+            'worst': 'O(n log n)'
+        },
+        'space': 'O(n)'
+    },
+    'heap': {
+        'time': {
+            'best': 'O(n log n)',
+            'average': 'O(n log n)',
+            'worst': 'O(n log n)'
+        },
+        'space': 'O(1)'
+    }
+}
+
+
+# 各情況的中文名稱
+CASE_LABELS = {'best': '最佳', 'average': '平均', 'worst': '最差'}
+
+# 已排序的輸入優先對應最佳情況，逆序優先對應最差情況，其餘視為平均情況
+PREFERRED_CASE = {'sorted': 'best', 'reversed': 'worst'}
+
+
+def get_complexity_type(algorithm_name, fit):
+    """
+    根據量測到的成長階數 (measure_complexity 的結果)，
+    對照 ALGORITHM_COMPLEXITY 判斷是最佳、平均或最差情況
+    """
+    cases = ALGORITHM_COMPLEXITY.get(algorithm_name, {}).get('time', {})
+    matched = [case for case in ('best', 'average', 'worst') if cases.get(case) == fit['growth']]
+
+    if not matched:
+        return '無法判斷'
+    # 三種情況的複雜度都相同 (例如選擇、合併、堆積排序)，沒有最佳或最差之分
+    if len(matched) == 3:
+        return CASE_LABELS['average']
+    if len(matched) == 1:
+        return CASE_LABELS[matched[0]]
+
+    preferred = PREFERRED_CASE.get(fit['distribution'], 'average')
+    if preferred in matched:
+        return CASE_LABELS[preferred]
+    return '/'.join(CASE_LABELS[case] for case in matched)
+
+
+def detect_distribution(numbers):
+    """
+    判斷輸入資料的分佈，回傳 benchmarks.distributions.DISTRIBUTIONS 其中之一。
+    """
+    n = len(numbers)
+    if n < 2:
+        return 'sorted'
+
+    ascending = sum(1 for a, b in zip(numbers, numbers[1:]) if a <= b)
+    if ascending == n - 1:
+        return 'sorted'
+    if all(a >= b for a, b in zip(numbers, numbers[1:])):
+        return 'reversed'
+    if n >= 8 and len(set(numbers)) <= n // 4:
+        return 'few_unique'
+    if ascending >= 0.9 * (n - 1):
+        return 'nearly_sorted'
+    return 'random'
+
+
+def fit_growth(sizes, counts):
+    """
+    將操作次數分別擬合 c·f(n)，回傳誤差最小的成長階數與常數。
+
+    在對數尺度上擬合 (log count = log c + log f(n))，使各個大小的權重相同；
+    誤差為殘差的平方和。
+
+    Returns:
+        tuple: (成長階數, 常數 c, {成長階數: 誤差})
+    """
+    errors = {}
+    constants = {}
+    for name, model in GROWTH_MODELS.items():
+        residuals = [math.log(count) - math.log(model(n)) for n, count in zip(sizes, counts)]
+        log_c = sum(residuals) / len(residuals)
+        constants[name] = math.exp(log_c)
+        errors[name] = sum((r - log_c) ** 2 for r in residuals)
+
+    growth = min(errors, key=errors.get)
+    return growth, constants[growth], errors
+
+
+@lru_cache(maxsize=None)
+def _fit_algorithm(algorithm_name, distribution, options):
+    step_func = SORT_ALGORITHMS[algorithm_name]
+    counts = []
+    for n in SAMPLE_SIZES:
+        _, _, comparisons, swaps, _ = run_sort(step_func, make_input(distribution, n), False, **dict(options))
+        # 任何排序至少要看過每個元素一次；計數低於 n 時 (例如插入排序遇到已排序資料) 以 n 計
+        counts.append(max(comparisons + swaps, n))
+
+    growth, constant, errors = fit_growth(SAMPLE_SIZES, counts)
+    return {
+        'growth': growth,
+        'constant': constant,
+        'distribution': distribution,
+        'sizes': list(SAMPLE_SIZES),
+        'counts': counts,
+        'errors': errors,
+    }
+
+
+def measure_complexity(algorithm_name, numbers, options=None):
+    """
+    量測演算法在與 numbers 同分佈的輸入下的成長階數。
+
+    結果依 (演算法, 分佈, 選項) 快取，同一組合只會量測一次。
+
+    Args:
+        algorithm_name (str): SORT_ALGORITHMS 的鍵
+        numbers (list): 使用者的輸入，用來判斷分佈
+        options (dict): 傳給演算法的額外選項 (例如快速排序的 pivot)
+
+    Returns:
+        dict: 包含 growth (例如 'O(n²)')、constant、distribution、sizes、counts 的字典
+    """
+    distribution = detect_distribution(numbers)
+    fit = _fit_algorithm(algorithm_name, distribution, tuple(sorted((options or {}).items())))
+    return dict(fit)
+
+
+def estimate_operations(fit, n):
+    """以擬合結果 (measure_complexity 的回傳值) 推估大小為 n 時的操作次數"""
+    if n < 2:
+        return n
+    return int(fit['constant'] * GROWTH_MODELS[fit['growth']](n))
+
+
+def max_input_size(algorithm_name, operations, case='average'):
+    """
+    依 ALGORITHM_COMPLEXITY 的成長階數，回傳操作次數不超過 operations 的最大輸入大小。
+
+    例如 O(n²) 的演算法在 operations 為 10^6 時上限約為 1000。
+    """
+    model = GROWTH_MODELS[ALGORITHM_COMPLEXITY[algorithm_name]['time'][case]]
+    lo, hi = 1, max(1, int(operations))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if model(mid) <= operations:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
@@ -0,0 +1,352 @@
+# datasets.py
+#
+# 上傳資料集的登錄區：檔案只在第一次上傳時解析，之後以欄為單位存放在磁碟上，
+# 再次分析時以記憶體映射 (mmap) 讀回，不必重新上傳與解析。
+# 讀取時分段進行並縮小型別 (int32、float32、低基數字串轉為 category)，大檔案的尖峰記憶體也不會太高。
+#
+# 每個資料集是一個以內容雜湊值 (SHA-256) 命名的目錄：
+#     meta.json    欄位名稱、型別、列數等資訊
+#     c<i>.npy     第 i 欄；數值欄直接存放，category 與字串欄存放整數代碼，類別清單記在 meta.json
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  只用來判斷 pandas 能否讀取 Parquet / Feather
+except ImportError:  # pyarrow 為選用套件，沒有安裝時只支援文字格式
+    pyarrow = None
+
+DATASET_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+TEXT_EXTENSIONS = ('.csv', '.txt', '.json', '.jsonl')
+ARROW_EXTENSIONS = ('.parquet', '.feather')
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + (ARROW_EXTENSIONS if pyarrow is not None else ())
+
+# CSV 與 JSON Lines 每次讀取的列數；每一段讀進來就先縮小型別，尖峰記憶體約為縮小後的資料加上一段
+CHUNK_ROWS = 100000
+# 上傳檔案每次寫入暫存檔的大小
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# 不重複值比例不超過此值的字串欄轉為 category
+CATEGORY_MAX_RATIO = 0.5
+# 沒有被取用的上傳暫存檔保留秒數
+UPLOAD_TTL = 3600
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+FLOAT32_MAX = np.finfo(np.float32).max
+
+
+def unsupported_format_message():
+    names = '、'.join(ext[1:].upper() for ext in SUPPORTED_EXTENSIONS)
+    return f'不支援的檔案格式，目前只支援 {names} 檔案'
+
+
+# ==================================
+# -------------讀取檔案---------------
+# ==================================
+
+def compact_frame(df):
+    """
+    縮小每一欄的型別：整數轉為 int32、浮點數轉為 float32 (數值超出範圍時保留原型別)，
+    字串欄轉為 category。直接修改並回傳 df。
+    """
+    for name, column in df.items():
+        kind = column.dtype.kind
+        if isinstance(column.dtype, pd.CategoricalDtype) or column.empty:
+            continue
+        if kind in 'iu':
+            if INT32_MIN <= column.min() and column.max() <= INT32_MAX:
+                df[name] = column.astype(np.int32)
+        elif kind == 'f':
+            if column.dtype.itemsize > 4 and not (column.abs() > FLOAT32_MAX).any():
+                df[name] = column.astype(np.float32)
+        elif pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+            try:
+                df[name] = column.astype('category')
+            except TypeError:  # 含有無法雜湊的值 (例如 JSON 的巢狀物件)
+                pass
+    return df
+
+
+def combine_chunks(chunks):
+    """
+    合併分段讀取的結果。
+
+    各段的 category 欄先統一類別清單，合併後才能維持 category 型別；
+    合併時被提升的型別 (例如 int32 與 float32) 再縮小一次，不重複值太多的字串欄還原為字串。
+    """
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) > 1:
+        for name in chunks[0].columns:
+            columns = [chunk[name] for chunk in chunks]
+            if all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+                categories = pd.Index(np.concatenate([column.cat.categories.to_numpy(object)
+                                                      for column in columns])).unique()
+                for chunk in chunks:
+                    chunk[name] = chunk[name].cat.set_categories(categories)
+    df = compact_frame(pd.concat(chunks, ignore_index=True))
+
+    for name, column in df.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.cat.remove_unused_categories()
+            if len(column.cat.categories) > CATEGORY_MAX_RATIO * len(column):
+                column = column.astype(column.cat.categories.dtype)
+            df[name] = column
+    return df
+
+
+def read_table(path, filename):
+    """
+    依副檔名讀取檔案為型別縮小後的 DataFrame。
+
+    CSV/TXT 與 JSON Lines 直接從檔案分段讀取，不會先載入整個檔案；
+    一般的 JSON 無法分段，整份讀取後再縮小型別。
+    """
+    ext = os.path.splitext(filename.lower())[1]
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(unsupported_format_message())
+
+    if ext in ('.csv', '.txt'):
+        with pd.read_csv(path, chunksize=CHUNK_ROWS, encoding='utf-8') as reader:
+            return combine_chunks([compact_frame(chunk) for chunk in reader])
+    if ext == '.jsonl':
+        with pd.read_json(path, lines=True, chunksize=CHUNK_ROWS, encoding='utf-8') as reader:
+            return combine_chunks([compact_frame(chunk) for chunk in reader])
+    if ext == '.json':
+        df = pd.read_json(path, encoding='utf-8')
+    elif ext == '.parquet':
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_feather(path)
+    return combine_chunks([compact_frame(df)])
+
+
+# ==================================
+# -----------存放與讀回---------------
+# ==================================
+
+def write_dataset(df, path, filename, parent=None, appended_rows=0):
+    """
+    把 DataFrame 以欄為單位寫入 path 目錄，回傳 meta。
+    由附加資料列產生時，parent 為父資料集的編號，appended_rows 為附加的列數 (附加在最後)。
+
+    先寫到暫存目錄再改名，同時寫入同一個資料集的工作不會看到寫到一半的內容。
+    """
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    os.makedirs(tmp_path)
+    columns = []
+    for i, (name, column) in enumerate(df.items()):
+        info = {'name': str(name), 'file': f'c{i}.npy', 'dtype': str(column.dtype)}
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.codes.to_numpy(np.int32)
+            info['kind'] = 'category'
+            info['categories'] = [str(v) for v in column.cat.categories]
+        elif column.dtype.kind in 'biufcmM':
+            values = column.to_numpy()
+            info['kind'] = 'numeric'
+        else:
+            # 字串 (或混合型別) 欄：存放整數代碼，缺值為 -1
+            codes, uniques = pd.factorize(column)
+            values = codes.astype(np.int32)
+            info['kind'] = 'codes'
+            info['categories'] = [str(v) for v in uniques]
+        np.save(os.path.join(tmp_path, info['file']), values, allow_pickle=False)
+        columns.append(info)
+
+    meta = {
+        'filename': filename,
+        'rows': len(df),
+        'columns': columns,
+        'created': time.time(),
+    }
+    if parent:
+        meta['parent'] = parent
+        meta['appended_rows'] = appended_rows
+    with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # 另一個工作已經寫好同一個資料集
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return meta
+
+
+def read_meta(path):
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_dataset(path):
+    """以記憶體映射讀回資料集，回傳 DataFrame"""
+    meta = read_meta(path)
+    # 更新使用時間，空間不足時優先淘汰最久未使用的資料集
+    os.utime(os.path.join(path, 'meta.json'))
+    data = {}
+    for info in meta['columns']:
+        values = np.load(os.path.join(path, info['file']), mmap_mode='r', allow_pickle=False)
+        if info['kind'] == 'category':
+            data[info['name']] = pd.Categorical.from_codes(values, info['categories'])
+        elif info['kind'] == 'codes':
+            categories = np.array(info['categories'] + [np.nan], dtype=object)
+            # 代碼 -1 (缺值) 正好對應到最後的 NaN
+            data[info['name']] = pd.Series(categories.take(values), dtype=object).astype(info['dtype'])
+        else:
+            data[info['name']] = values
+    return pd.DataFrame(data)
+
+
+def ingest(upload_path, filename, path):
+    """解析上傳的暫存檔並存入 path (已經存在時直接讀取 meta)，完成後刪除暫存檔"""
+    try:
+        if os.path.isdir(path):
+            return read_meta(path)
+        return write_dataset(read_table(upload_path, filename), path, filename)
+    finally:
+        discard_upload(upload_path)
+
+
+def append_rows(parent_path, upload_path, filename, path):
+    """
+    把上傳的資料列附加到父資料集之後，存成新的資料集 path；完成後刪除暫存檔。
+
+    附加的資料必須與父資料集有相同的欄位。
+    """
+    try:
+        if os.path.isdir(path):
+            return read_meta(path)
+        parent = load_dataset(parent_path)
+        added = read_table(upload_path, filename)
+        if [str(name) for name in added.columns] != [str(name) for name in parent.columns]:
+            raise ValueError('附加資料的欄位與原資料集不同')
+        df = combine_chunks([parent, added])
+        return write_dataset(df, path, read_meta(parent_path)['filename'],
+                             parent=os.path.basename(parent_path), appended_rows=len(added))
+    finally:
+        discard_upload(upload_path)
+
+
+def parent_path(path):
+    """父資料集的目錄；不是由附加資料列產生、或父資料集已被刪除時回傳 None"""
+    parent = read_meta(path).get('parent')
+    if parent is None:
+        return None
+    path = os.path.join(os.path.dirname(path), parent)
+    return path if os.path.isdir(path) else None
+
+
+def discard_upload(upload_path):
+    try:
+        os.remove(upload_path)
+    except OSError:
+        pass
+
+
+# ==================================
+# -------------登錄區----------------
+# ==================================
+
+class DatasetRegistry:
+    """
+    管理 root 目錄下的資料集。
+
+    Args:
+        root (str): 存放資料集的目錄
+        max_bytes (int): 所有資料集的總大小上限，超過時淘汰最久未使用的資料集
+    """
+
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, dataset_id):
+        """資料集的目錄；編號格式不正確時丟出 ValueError"""
+        if not DATASET_ID_PATTERN.match(dataset_id or ''):
+            raise ValueError('無效的資料集編號')
+        return os.path.join(self.root, dataset_id)
+
+    def save_upload(self, stream, filename):
+        """
+        把上傳的檔案分段寫入暫存檔，同時計算資料集編號，回傳 (資料集編號, 暫存檔路徑)。
+
+        編號是副檔名與檔案內容的 SHA-256 (同樣的內容以不同格式解析，結果可能不同)。
+        整個檔案不會同時放在記憶體中；暫存檔交給 ingest 解析後刪除。
+        """
+        ext = os.path.splitext(filename.lower())[1]
+        upload_dir = os.path.join(self.root, '.uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        upload_path = os.path.join(upload_dir, uuid.uuid4().hex + ext)
+
+        digest = hashlib.sha256(ext.encode('utf-8') + b'\0')
+        with open(upload_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        return digest.hexdigest(), upload_path
+
+    def child_id(self, parent_id, upload_id):
+        """父資料集附加一份上傳資料後的資料集編號"""
+        return hashlib.sha256(f'{parent_id}:{upload_id}'.encode('utf-8')).hexdigest()
+
+    def exists(self, dataset_id):
+        return os.path.isdir(self.path(dataset_id))
+
+    def info(self, dataset_id):
+        """資料集的 meta；不存在時回傳 None"""
+        path = self.path(dataset_id)
+        if not os.path.isdir(path):
+            return None
+        return {'dataset_id': dataset_id, **read_meta(path), 'bytes': _dir_size(path)}
+
+    def list(self):
+        return [self.info(entry) for entry in self._ids()]
+
+    def delete(self, dataset_id):
+        path = self.path(dataset_id)
+        if not os.path.isdir(path):
+            return False
+        shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def prune(self, keep=None):
+        """總大小超過上限時，從最久未使用的開始刪除 (keep 指定的資料集除外)；一併清除過期的上傳暫存檔"""
+        upload_dir = os.path.join(self.root, '.uploads')
+        if os.path.isdir(upload_dir):
+            for entry in os.scandir(upload_dir):
+                if entry.stat().st_mtime < time.time() - UPLOAD_TTL:
+                    discard_upload(entry.path)
+
+        entries = []
+        for dataset_id in self._ids():
+            path = os.path.join(self.root, dataset_id)
+            try:
+                last_used = os.path.getmtime(os.path.join(path, 'meta.json'))
+            except OSError:
+                continue
+            entries.append((last_used, dataset_id, _dir_size(path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, dataset_id, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if dataset_id != keep:
+                shutil.rmtree(os.path.join(self.root, dataset_id), ignore_errors=True)
+                total -= size
+
+    def _ids(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [entry for entry in os.listdir(self.root) if DATASET_ID_PATTERN.match(entry)]
+
+
+def _dir_size(path):
+    """目錄中所有檔案的大小，包含工作階段 (session/) 等子目錄"""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
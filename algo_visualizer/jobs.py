@@ -0,0 +1,151 @@
+# jobs.py
+#
+# /analyze 的非同步工作：POST 立即回傳工作編號，分析在行程池中執行，
+# 用戶端以 GET 輪詢狀態、目前階段 (parse / scale / fit / serialize) 與結果。
+# 結果以 gzip 壓縮的本文存放在有上限的 ResponseCache 中，
+# 同一份檔案與參數的分析會沿用既有的工作，不會重新計算。
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import workers
+from workers import ANALYZE_STAGES
+
+
+class AnalysisJob:
+    """一次分析工作；status 為 'queued'、'running'、'done' 或 'error'"""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key  # 分析內容的快取鍵，結果以此存放
+        self.status = 'queued'
+        self.stage = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._progress = None  # Manager().dict()，工作行程寫入目前階段
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """等待工作結束，逾時回傳 False"""
+        return self._done.wait(timeout)
+
+    def refresh(self):
+        """從工作行程回報的進度更新狀態"""
+        if self._progress is not None and self.status in ('queued', 'running'):
+            try:
+                stage = self._progress.get('stage')
+            except Exception:  # Manager 已關閉
+                stage = None
+            if stage:
+                self.status = 'running'
+                self.stage = stage
+
+    def to_dict(self):
+        self.refresh()
+        if self.status == 'done':
+            progress = 1.0
+        elif self.stage in ANALYZE_STAGES:
+            # 以已完成的階段數估算進度
+            progress = ANALYZE_STAGES.index(self.stage) / len(ANALYZE_STAGES)
+        else:
+            progress = 0.0
+        info = {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': progress,
+            'created': self.created,
+            'finished': self.finished,
+        }
+        if self.error:
+            info['error'] = self.error
+        return info
+
+
+class JobStore:
+    """
+    追蹤分析工作並存放結果。
+
+    Args:
+        results (ResponseCache): 存放完成工作的 gzip 本文，以 job.key 為鍵；淘汰後需重新計算
+        max_jobs (int): 保留的工作紀錄數上限，超過時移除最舊的已結束工作
+    """
+
+    def __init__(self, results, max_jobs=256):
+        self.results = results
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # job id -> AnalysisJob
+        self._by_key = {}  # job.key -> 最新的 AnalysisJob
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def result(self, job):
+        """完成工作的 gzip 本文；結果已被淘汰時回傳 None"""
+        return self.results.get(job.key)
+
+    def submit(self, key, *args):
+        """
+        送出一次分析 (參數同 workers.analyze_job，progress 與 n_jobs 除外)，回傳 (AnalysisJob, 是否為新的工作)。
+
+        同一個 key 已有執行中的工作、或結果仍在快取中時，直接回傳該工作。
+        行程池已滿時丟出 workers.Overloaded。
+        """
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None and job.id in self._jobs:
+                if job.status in ('queued', 'running'):
+                    return job, False
+                if job.status == 'done' and key in self.results:
+                    return job, False
+
+            job = AnalysisJob(key)
+            job._progress = workers.shared_dict()
+            future = workers.submit_parallel(workers.analyze_job, *args, job._progress)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            self._trim()
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return job, True
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'jobs': counts, 'results': self.results.stats()}
+
+    def _finish(self, job, future):
+        try:
+            body_gz = future.result()
+        except Exception as e:
+            job.status = 'error'
+            job.error = f'分析過程發生錯誤: {e}' if str(e) else '工作已取消'
+        else:
+            if self.results.put(job.key, body_gz):
+                job.status = 'done'
+                job.stage = 'serialize'
+            else:
+                job.status = 'error'
+                job.error = '分析結果過大，無法保存'
+        job.finished = time.time()
+        job._progress = None
+        job._done.set()
+
+    def _trim(self):
+        """工作紀錄超過上限時，從最舊的開始移除已結束的工作"""
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            job = self._jobs[job_id]
+            if job.status in ('done', 'error'):
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+                excess -= 1
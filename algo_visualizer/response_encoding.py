@@ -0,0 +1,151 @@
+# response_encoding.py
+#
+# 回應的內容協商：依 Accept-Encoding 選擇 brotli / gzip 壓縮，
+# 以及把排序動畫步驟打包成 int32 陣列的二進位格式 (Accept: application/x-sort-steps)。
+
+import gzip
+import json
+import struct
+import sys
+from array import array
+
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件，沒有安裝時只提供 gzip
+    brotli = None
+
+# 小於此大小的本文壓縮效益不大，直接回傳
+MIN_COMPRESS_BYTES = 1024
+
+BINARY_STEPS_MIMETYPE = 'application/x-sort-steps'
+BINARY_MAGIC = b'AVB1'
+
+# 動畫步驟中可變長度的欄位：'pairs' 為 [[a, b], ...]，'flat' 為 [a, b, ...]
+STEP_LIST_FIELDS = (
+    ('writes', 'pairs'),
+    ('compared', 'flat'),
+    ('swapped', 'flat'),
+    ('sorted_indices', 'pairs'),
+    ('active', 'pairs'),
+    ('array', 'flat'),  # 關鍵影格的完整陣列快照
+)
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def choose_encoding(prefer_gzip=False):
+    """
+    依請求的 Accept-Encoding 選擇壓縮方式，回傳 'br'、'gzip' 或 None。
+
+    prefer_gzip 為 True 時 (例如本文已經是 gzip 壓縮好的快取)，只要用戶端接受 gzip 就優先使用。
+    """
+    accepted = request.accept_encodings
+    if prefer_gzip and 'gzip' in accepted:
+        return 'gzip'
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def encoded_response(body, mimetype):
+    """依內容協商壓縮本文並建立回應"""
+    encoding = choose_encoding() if len(body) >= MIN_COMPRESS_BYTES else None
+    response = Response(compress(body, encoding), mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def gzip_body_response(body_gz, mimetype):
+    """
+    回傳已經 gzip 壓縮的本文 (例如快取中的回應)。
+
+    用戶端接受 gzip 時原封不動送出；否則解壓縮後再依協商結果處理。
+    """
+    if choose_encoding(prefer_gzip=True) == 'gzip':
+        response = Response(body_gz, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    return encoded_response(gzip.decompress(body_gz), mimetype)
+
+
+def json_response(payload):
+    """與 jsonify 相同的序列化方式，但依內容協商壓縮"""
+    return encoded_response(current_app.json.dumps(payload).encode('utf-8'), 'application/json')
+
+
+def wants_binary_steps():
+    """用戶端是否要求二進位的動畫步驟格式"""
+    best = request.accept_mimetypes.best_match([BINARY_STEPS_MIMETYPE, 'application/json'])
+    return best == BINARY_STEPS_MIMETYPE and request.accept_mimetypes[BINARY_STEPS_MIMETYPE] > 0
+
+
+def can_pack_binary(numbers):
+    """二進位格式只能表示 int32 範圍內的整數"""
+    return all(isinstance(v, int) and not isinstance(v, bool) and INT32_MIN <= v <= INT32_MAX for v in numbers)
+
+
+def pack_sort_binary(result_json):
+    """
+    把 /sort 的回應打包成二進位格式，輸入需先通過 can_pack_binary。
+
+    格式 (little-endian)：
+        'AVB1' | uint32 標頭長度 | JSON 標頭 (補齊到 4 的倍數) | int32 陣列區
+    JSON 標頭包含回應中陣列以外的欄位，以及 arrays: {名稱: [起始位置, 長度]} (以 int32 為單位)。
+    陣列包含 original_data、sorted_data、keyframes、每一步的 pivot (沒有則為 -1)，
+    以及 STEP_LIST_FIELDS 每個欄位的 <欄位>_offsets (長度為步驟數 + 1) 與 <欄位>_values。
+    """
+    steps = result_json['animation_steps']
+    arrays = {
+        'original_data': array('i', result_json['original_data']),
+        'sorted_data': array('i', result_json['sorted_data']),
+        'pivot': array('i', (step.get('pivot', -1) for step in steps)),
+        'keyframes': array('i', result_json['keyframes']),
+    }
+    for field, kind in STEP_LIST_FIELDS:
+        offsets = array('i', [0])
+        values = array('i')
+        for step in steps:
+            items = step.get(field)
+            if items:
+                if kind == 'pairs':
+                    for pair in items:
+                        values.extend(pair)
+                else:
+                    values.extend(items)
+            offsets.append(len(values))
+        arrays[field + '_offsets'] = offsets
+        arrays[field + '_values'] = values
+
+    header = {key: value for key, value in result_json.items()
+              if key not in ('animation_steps', 'original_data', 'sorted_data', 'keyframes')}
+    header['steps'] = len(steps)
+    header['arrays'] = {}
+    position = 0
+    for name, values in arrays.items():
+        header['arrays'][name] = [position, len(values)]
+        position += len(values)
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 4)
+
+    parts = [BINARY_MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+    for values in arrays.values():
+        if sys.byteorder == 'big':
+            values.byteswap()
+        parts.append(values.tobytes())
+    return b''.join(parts)
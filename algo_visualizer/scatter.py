@@ -0,0 +1,223 @@
+# scatter.py
+#
+# 分群與分類結果的回應格式：以欄為單位 (每欄一個陣列) 回傳，不為每一列建立一個 dict。
+# 資料列超過 LOD_THRESHOLD 時啟用 LOD (level of detail)，只回傳足夠繪圖的資料：
+#     'sample'   依群集 (或預測類別) 分層抽樣，最多 LOD_MAX_POINTS 列
+#     'density'  兩個繪圖軸上的 2-D 分箱密度 (每群各自分箱)，另附少量抽樣的資料列供表格顯示
+# 各群的中心點一律以全部資料計算。
+
+import numpy as np
+import pandas as pd
+
+LOD_MODES = ('auto', 'sample', 'density', 'none')
+LOD_THRESHOLD = 20000
+LOD_MAX_POINTS = 10000
+DENSITY_BINS = 64
+DENSITY_TABLE_ROWS = 1000
+
+
+# float32 的有效位數：7 位以內的十進位數轉為 float32 後，捨入到 7 位有效數字即可還原
+FLOAT32_DIGITS = 7
+
+
+def float32_to_float64(values):
+    """
+    float32 陣列轉為 float64，並依數值大小捨入到 FLOAT32_DIGITS 位有效數字，
+    例如 5.1 不會變成 5.099999904632568。全部以向量運算完成，不逐一格式化成字串。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    nonzero = np.isfinite(values) & (values != 0)
+    x = values[nonzero]
+    decimals = FLOAT32_DIGITS - 1 - np.floor(np.log10(np.abs(x)))
+    # 大數以整數步長相乘，避免除以 10 的負次方帶入誤差
+    scale = 10.0 ** np.abs(decimals)
+    values[nonzero] = np.where(decimals >= 0, np.round(x * scale) / scale, np.round(x / scale) * scale)
+    return values
+
+
+def column_values(column):
+    """
+    一欄轉為可 JSON 序列化的 list；缺值轉為 None。
+
+    float32 欄以 float32_to_float64 轉回 float64。
+    """
+    if column.dtype == np.float32:
+        column = pd.Series(float32_to_float64(column.to_numpy()), index=column.index, name=column.name)
+    if column.dtype.kind in 'biu':
+        return column.tolist()
+    if column.dtype.kind == 'f':
+        values = column.tolist()
+        missing = np.flatnonzero(column.isna().to_numpy())
+        for i in missing:
+            values[i] = None
+        return values
+    column = column.astype(object)
+    return column.where(column.notna(), None).tolist()
+
+
+def neighbor_values(column, neighbors):
+    """每一列的鄰居在一個軸上的座標 (巢狀 list)；float32 的處理與 column_values 相同"""
+    values = column.to_numpy()[neighbors]
+    if values.dtype == np.float32:
+        return float32_to_float64(values).tolist()
+    return values.astype(np.float64).tolist()
+
+
+def frame_columns(df):
+    """DataFrame 轉為 {'columns': [欄位名稱], 'data': {欄位: [值, ...]}}"""
+    return {
+        'columns': [str(name) for name in df.columns],
+        'data': {str(name): column_values(column) for name, column in df.items()},
+    }
+
+
+def scatter_axes(df, exclude):
+    """散佈圖的 x、y 軸：前兩個數值欄 (排除 exclude 與布林欄)；不足兩個時回傳 None"""
+    numeric = [name for name, column in df.items()
+               if name not in exclude and column.dtype.kind in 'iuf']
+    return numeric[:2] if len(numeric) >= 2 else None
+
+
+def stratified_sample(groups, max_points, seed=42):
+    """
+    依群組分層抽樣，回傳排序後的列位置。
+
+    每個群組依比例分配名額 (至少一列)，小群組不會在抽樣後消失。
+    """
+    codes, uniques = pd.factorize(groups)
+    counts = np.bincount(codes, minlength=len(uniques))
+    quota = np.minimum(counts, np.maximum(1, np.round(counts * (max_points / len(codes)))).astype(np.int64))
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(codes))
+    # 依群組排序 (穩定排序保留隨機順序)，每個群組取前 quota 列
+    order = order[np.argsort(codes[order], kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(len(order)) - starts[codes[order]]
+    return np.sort(order[rank < quota[codes[order]]])
+
+
+def group_centroids(df, group, axes):
+    """每個群組在 x、y 軸上的平均值與列數 (以全部資料計算)"""
+    grouped = df.groupby(group, observed=True, sort=True)[axes]
+    means = grouped.mean()
+    return {
+        'group': column_values(means.index.to_series()),
+        'x': means[axes[0]].astype(np.float64).tolist(),
+        'y': means[axes[1]].astype(np.float64).tolist(),
+        'count': grouped.size().tolist(),
+    }
+
+
+def density_bins(df, group, axes, bins=DENSITY_BINS):
+    """
+    x、y 軸上的 2-D 分箱密度，每個群組各自分箱 (共用同一組邊界)。
+
+    只回傳有資料的箱子：{'group', 'x', 'y' (箱子中心), 'count'} 各為一個陣列。
+    """
+    x = df[axes[0]].to_numpy(dtype=np.float64)
+    y = df[axes[1]].to_numpy(dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    codes, uniques = pd.factorize(df[group])
+    x, y, codes = x[finite], y[finite], codes[finite]
+
+    x_edges = np.histogram_bin_edges(x, bins=bins)
+    y_edges = np.histogram_bin_edges(y, bins=bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+
+    result = {'group': [], 'x': [], 'y': [], 'count': []}
+    for code, value in enumerate(uniques):
+        mask = codes == code
+        counts, _, _ = np.histogram2d(x[mask], y[mask], bins=[x_edges, y_edges])
+        xi, yi = np.nonzero(counts)
+        result['group'].extend([value] * len(xi))
+        result['x'].extend(x_centers[xi].tolist())
+        result['y'].extend(y_centers[yi].tolist())
+        result['count'].extend(counts[xi, yi].astype(np.int64).tolist())
+    result['group'] = column_values(pd.Series(result['group'], dtype=object))
+    result['x_step'] = float(x_edges[1] - x_edges[0])
+    result['y_step'] = float(y_edges[1] - y_edges[0])
+    return result
+
+
+def animation_frames(frames, axes, positions=None):
+    """
+    K-Means 的動畫影格 (clustering.InstrumentedKMeans.frames_) 轉為回應內容。
+
+    每個影格為各群中心點在 x、y 軸上的座標、inertia、改變群集的列數 (全部資料)，
+    以及回傳的資料列中改變群集者：'rows' 為在回傳資料列中的位置，'labels' 為新的群集。
+
+    Args:
+        positions (np.ndarray): 回傳的資料列在 df 中的位置 (遞增)，回傳全部資料列時為 None
+    """
+    x = frames['columns'].index(axes[0])
+    y = frames['columns'].index(axes[1])
+    payload = {
+        'count': len(frames['changed']),
+        'centers_x': frames['centers'][:, :, x].tolist(),
+        'centers_y': frames['centers'][:, :, y].tolist(),
+        'inertia': [float(value) for value in frames['inertia']],
+        'changed': [int(value) for value in frames['changed']],
+        'rows': [],
+        'labels': [],
+    }
+    for changed, labels in frames['deltas']:
+        if positions is not None:
+            # 只保留回傳的資料列，並換成在回傳資料列中的位置
+            index = np.minimum(np.searchsorted(positions, changed), len(positions) - 1)
+            kept = positions[index] == changed
+            changed, labels = index[kept], labels[kept]
+        payload['rows'].append(changed.tolist())
+        payload['labels'].append(labels.tolist())
+    return payload
+
+
+def results_payload(df, group, exclude, lod='auto', threshold=LOD_THRESHOLD, max_points=LOD_MAX_POINTS,
+                    neighbors=None, frames=None):
+    """
+    分群或分類結果的回應內容。
+
+    Args:
+        df (pd.DataFrame): 結果資料 (含 group 欄)
+        group (str): 群組欄位 ('cluster' 或 'predicted_class')
+        exclude (list): 不作為繪圖軸的欄位
+        lod (str): LOD_MODES 之一；'auto' 在超過 threshold 列時使用 'sample'，'none' 一律回傳全部資料列
+        neighbors (np.ndarray): 每一列的鄰居 (df 中的列位置，形狀為 列數 × k)，可省略
+        frames (dict): K-Means 的動畫影格 (clustering.InstrumentedKMeans.frames_)，可省略
+
+    Returns:
+        dict: 欄式的資料列 (columns、data)，以及 total_rows、rows、group、axes、lod、centroids，
+              'density' 模式另有 density；有 neighbors 時另有回傳的每一列的鄰居在 x、y 軸上的座標；
+              有 frames 時另有 frames (見 animation_frames)
+    """
+    total_rows = len(df)
+    axes = scatter_axes(df, exclude)
+    if lod == 'auto':
+        lod = 'sample' if total_rows > threshold else 'none'
+
+    payload = {'total_rows': total_rows, 'group': group, 'axes': axes, 'lod': None if lod == 'none' else lod}
+    if axes:
+        payload['centroids'] = group_centroids(df, group, axes)
+
+    positions = None
+    if lod == 'density' and axes:
+        payload['density'] = density_bins(df, group, axes)
+        positions = stratified_sample(df[group], min(max_points, DENSITY_TABLE_ROWS))
+    elif lod != 'none' and total_rows > max_points:
+        positions = stratified_sample(df[group], max_points)
+    rows = df if positions is None else df.iloc[positions]
+
+    if neighbors is not None and axes:
+        selected = neighbors if positions is None else neighbors[positions]
+        payload['neighbors'] = {
+            'x': neighbor_values(df[axes[0]], selected),
+            'y': neighbor_values(df[axes[1]], selected),
+        }
+
+    if frames is not None and axes and all(axis in frames['columns'] for axis in axes):
+        payload['frames'] = animation_frames(frames, axes, positions)
+
+    payload['rows'] = len(rows)
+    payload.update(frame_columns(rows))
+    return payload
@@ -0,0 +1,164 @@
+# sessions.py
+#
+# 每個資料集的分群工作階段 (session)：保存標準化後的矩陣與上一次的中心點，
+# 改變 k 或附加資料列後重新分群時，不必重新標準化，並以上一次的中心點作為起點 (warm start)。
+#
+# 工作階段存放在資料集目錄下的 session/，任何一個工作行程都可以用記憶體映射讀取：
+#     scaler.json          標準化使用的欄位、平均值、標準差與列數，以及保存過中心點的 k
+#     scaled.npy           標準化後的矩陣 (float32)
+#     centers_<k>.npy      最近一次 k 群的中心點
+#     counts_<k>.npy       最近一次 k 群的各群列數
+# 附加資料列產生的新資料集 (datasets.append_rows) 沿用父資料集的標準化參數與中心點。
+#
+# K 鄰居分類的空間索引 (NeighborIndexStore) 存放在資料集目錄下的 knn/，每個目標欄位一個檔案：
+#     <目標欄位的雜湊值>.pkl   特徵欄位、標準化參數與建好的 KD-tree / ball-tree
+
+import hashlib
+import json
+import os
+import pickle
+import uuid
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+
+class ClusteringSession:
+    """
+    一個資料集的分群工作階段。
+
+    Args:
+        path (str): 工作階段目錄
+        parent (ClusteringSession): 父資料集的工作階段 (附加資料列前的資料)，可省略
+    """
+
+    def __init__(self, path, parent=None):
+        self.path = path
+        self.parent = parent
+
+    def scaled_matrix(self, numeric_df):
+        """
+        回傳 (標準化後的矩陣, 附加的列數)。
+
+        已保存且欄位與列數相符時直接以記憶體映射讀取；
+        父資料集有保存時只標準化附加的資料列 (沿用父資料集的平均值與標準差)；
+        否則重新標準化並保存。
+        """
+        columns = [str(name) for name in numeric_df.columns]
+        rows = len(numeric_df)
+        info = self._info()
+        if info and info['columns'] == columns and info['rows'] == rows:
+            return np.load(os.path.join(self.path, 'scaled.npy'), mmap_mode='r'), 0
+
+        parent_info = self.parent._info() if self.parent else None
+        appended = 0
+        if parent_info and parent_info['columns'] == columns and parent_info['rows'] < rows:
+            mean = np.asarray(parent_info['mean'], dtype=np.float32)
+            scale = np.asarray(parent_info['scale'], dtype=np.float32)
+            previous = np.load(os.path.join(self.parent.path, 'scaled.npy'), mmap_mode='r')
+            added = (numeric_df.iloc[parent_info['rows']:].to_numpy(dtype=np.float32) - mean) / scale
+            scaled = np.concatenate([previous, added.astype(np.float32)])
+            appended = rows - parent_info['rows']
+        else:
+            scaler = StandardScaler()
+            scaled = scaler.fit_transform(numeric_df.to_numpy(dtype=np.float32)).astype(np.float32, copy=False)
+            mean, scale = scaler.mean_, scaler.scale_
+
+        os.makedirs(self.path, exist_ok=True)
+        self._save_array('scaled.npy', scaled)
+        self._write_info({
+            'columns': columns,
+            'rows': rows,
+            'mean': [float(v) for v in mean],
+            'scale': [float(v) for v in scale],
+            'fitted_k': [],
+        })
+        return scaled, appended
+
+    def scaling(self):
+        """標準化使用的 (平均值, 標準差)，需先呼叫 scaled_matrix"""
+        info = self._info()
+        return np.asarray(info['mean']), np.asarray(info['scale'])
+
+    def centers(self, k):
+        """k 群保存過的 (中心點, 各群列數)；沒有時回傳 None"""
+        info = self._info()
+        if not info or k not in info['fitted_k']:
+            return None
+        return (np.load(os.path.join(self.path, f'centers_{k}.npy')),
+                np.load(os.path.join(self.path, f'counts_{k}.npy')))
+
+    def nearest_centers(self, k):
+        """保存過的 k 中最接近 k 的 (k, 中心點, 各群列數)；同樣接近時取較大的 k，都沒有時回傳 None"""
+        info = self._info()
+        if not info or not info['fitted_k']:
+            return None
+        nearest = min(info['fitted_k'], key=lambda fitted: (abs(fitted - k), -fitted))
+        return (nearest, *self.centers(nearest))
+
+    def save_fit(self, k, centers, labels):
+        """保存這次 k 群的中心點與各群列數"""
+        info = self._info()
+        if not info:
+            return
+        self._save_array(f'centers_{k}.npy', np.asarray(centers, dtype=np.float32))
+        self._save_array(f'counts_{k}.npy', np.bincount(labels, minlength=k).astype(np.int64))
+        if k not in info['fitted_k']:
+            info['fitted_k'].append(k)
+            self._write_info(info)
+
+    def _info(self):
+        try:
+            with open(os.path.join(self.path, 'scaler.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_info(self, info):
+        tmp_path = os.path.join(self.path, f'scaler.json.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, os.path.join(self.path, 'scaler.json'))
+
+    def _save_array(self, name, values):
+        # 先寫暫存檔再取代，同時執行的工作不會讀到寫到一半的檔案
+        tmp_path = os.path.join(self.path, f'{uuid.uuid4().hex}.tmp.npy')
+        np.save(tmp_path, values, allow_pickle=False)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+
+class NeighborIndexStore:
+    """
+    一個資料集的 K 鄰居空間索引，依目標欄位保存。
+
+    索引以訓練集 (固定的分割) 建立，同一個資料集與目標欄位只需建立一次，
+    之後改變 k 或重新分類都直接讀取。
+
+    Args:
+        path (str): 索引目錄
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, target, columns):
+        """目標欄位保存過且特徵欄位相同時回傳 {'index', 'mean', 'scale', 'columns'}，否則回傳 None"""
+        try:
+            with open(self._file(target), 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        return saved if saved['columns'] == columns else None
+
+    def save(self, target, columns, index, mean, scale):
+        """保存目標欄位的索引與標準化參數"""
+        os.makedirs(self.path, exist_ok=True)
+        # 先寫暫存檔再取代，同時執行的工作不會讀到寫到一半的檔案
+        tmp_path = os.path.join(self.path, f'{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'columns': columns, 'index': index, 'mean': mean, 'scale': scale}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._file(target))
+
+    def _file(self, target):
+        return os.path.join(self.path, hashlib.sha256(target.encode('utf-8')).hexdigest()[:32] + '.pkl')
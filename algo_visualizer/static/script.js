@@ -16,13 +16,24 @@ const playBtn = document.getElementById('playBtn');
 const pauseBtn = document.getElementById('pauseBtn');
 const resetBtn = document.getElementById('resetBtn');
 const speedSlider = document.getElementById('speedSlider');
+const stepSlider = document.getElementById('stepSlider');
+const stepLabel = document.getElementById('stepLabel');
 const resultDiv = document.getElementById('result');
 
 let currentNumbers = []; // 用於保存當前輸入的數字
-let animationSteps = []; // 儲存後端回傳的每一步陣列狀態
+let animationSteps = []; // 儲存後端回傳的每一步動畫差量
+let animationFrame = []; // 目前畫面上的陣列狀態，由差量逐步重建
 let animationSpeed = 500; // 毫秒
 let animationIndex = 0;
 let animationInterval = null;
+let animationStreamDone = true; // 串流中的步驟是否已全部收到
+let animationKeyframes = []; // 關鍵影格 (帶有完整陣列快照) 的步驟編號，遞增排列
+
+// 輸入筆數達到此值時，改以二進位格式 (int32 陣列) 下載動畫步驟
+const BINARY_STEPS_THRESHOLD = 1000;
+const BINARY_STEPS_MIMETYPE = 'application/x-sort-steps';
+// 大量資料時的影格預算：瀏覽器只需要播放幾千步，其餘比較步驟由後端合併
+const MAX_ANIMATION_FRAMES = 5000;
 
 // 監聽每個導覽按鈕的點擊事件
 navButtons.forEach(button => {
@@ -111,41 +122,177 @@ async function sendDataToBackend(data, algorithmName) {
         algorithmButtons.forEach(btn => btn.disabled = true); // 禁用按鈕
         numInputs.forEach(input => input.disabled = true); // 禁用輸入
 
+        // 資料量大時改用二進位格式一次下載全部步驟，傳輸量與解析時間都比 JSON 小
+        if (data.length >= BINARY_STEPS_THRESHOLD) {
+            await fetchBinarySteps(data, algorithmName);
+            return;
+        }
+
         const response = await fetch('/sort', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ numbers: data, algorithm: algorithmName })
+            body: JSON.stringify({ numbers: data, algorithm: algorithmName, stream: true })
         });
 
         if (!response.ok) {
             throw new Error('伺服器處理失敗');
         }
 
-        const result = await response.json();
-        
-        // 保存動畫步驟和顯示結果資訊
-        animationSteps = result.animation_steps;
-        displayResultInfo(result, algorithmName);
-        
-        // 啟用動畫控制按鈕
-        playBtn.disabled = false;
-        resetBtn.disabled = false;
-        pauseBtn.disabled = true;
+        // 串流模式：一邊接收 NDJSON 一邊累積動畫步驟，收到第一行就能開始播放
+        animationSteps = [];
+        animationKeyframes = [];
+        animationStreamDone = false;
+        await readNdjsonStream(response, (message) => {
+            if (message.event === 'start') {
+                // 步驟為差量格式，從原始資料開始套用
+                animationFrame = [...message.original_data];
+                // 啟用動畫控制按鈕
+                playBtn.disabled = false;
+                resetBtn.disabled = false;
+                pauseBtn.disabled = true;
+            } else if (message.event === 'result') {
+                displayResultInfo(message, algorithmName);
+            } else if (message.event === 'error') {
+                throw new Error(message.error);
+            } else {
+                if (message.array) {
+                    animationKeyframes.push(animationSteps.length);
+                }
+                animationSteps.push(message);
+                updateStepSlider();
+            }
+        });
 
     } catch (error) {
         resultDiv.innerHTML = `<p style="color: red;">發生錯誤：${error.message}</p>`;
     } finally {
+        animationStreamDone = true;
         algorithmButtons.forEach(btn => btn.disabled = false); // 重新啟用按鈕
         numInputs.forEach(input => input.disabled = false); // 重新啟用輸入
     }
 }
 
+// --- 以二進位格式下載動畫步驟 ---
+async function fetchBinarySteps(data, algorithmName) {
+    const response = await fetch('/sort', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': `${BINARY_STEPS_MIMETYPE}, application/json;q=0.5`,
+        },
+        body: JSON.stringify({ numbers: data, algorithm: algorithmName, max_frames: MAX_ANIMATION_FRAMES })
+    });
+
+    if (!response.ok) {
+        throw new Error('伺服器處理失敗');
+    }
+
+    // 輸入不是整數時，伺服器會改回傳 JSON
+    let result;
+    if (response.headers.get('Content-Type').startsWith(BINARY_STEPS_MIMETYPE)) {
+        result = decodeSortBinary(await response.arrayBuffer());
+    } else {
+        result = await response.json();
+    }
+
+    animationFrame = [...result.original_data];
+    animationSteps = result.animation_steps;
+    animationKeyframes = result.keyframes;
+    animationStreamDone = true;
+    updateStepSlider();
+    playBtn.disabled = false;
+    resetBtn.disabled = false;
+    pauseBtn.disabled = true;
+    displayResultInfo(result, algorithmName);
+}
+
+// --- 解碼二進位格式的排序結果 ---
+// 格式：'AVB1' | uint32 標頭長度 | JSON 標頭 | int32 陣列區 (little-endian)，詳見 response_encoding.py
+function decodeSortBinary(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'AVB1') {
+        throw new Error('無法辨識的資料格式');
+    }
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+
+    // 標頭已補齊到 4 的倍數，陣列區可以直接建立 Int32Array 視圖，不必複製
+    const base = 8 + headerLength;
+    const arrays = {};
+    Object.entries(header.arrays).forEach(([name, [offset, length]]) => {
+        arrays[name] = new Int32Array(buffer, base + offset * 4, length);
+    });
+
+    return {
+        ...header,
+        original_data: Array.from(arrays.original_data),
+        sorted_data: Array.from(arrays.sorted_data),
+        animation_steps: binaryStepList(header.steps, arrays),
+        keyframes: arrays.keyframes,
+    };
+}
+
+// 以 at(i) 取得第 i 步，需要時才從 Int32Array 組出步驟物件 (與 JSON 步驟格式相同)
+function binaryStepList(length, arrays) {
+    const slice = (field, i) => arrays[`${field}_values`].subarray(arrays[`${field}_offsets`][i], arrays[`${field}_offsets`][i + 1]);
+    const pairs = (values) => {
+        const result = [];
+        for (let k = 0; k < values.length; k += 2) result.push([values[k], values[k + 1]]);
+        return result;
+    };
+
+    return {
+        length,
+        at(i) {
+            const step = {};
+            const writes = slice('writes', i);
+            if (writes.length) step.writes = pairs(writes);
+            const compared = slice('compared', i);
+            if (compared.length) step.compared = Array.from(compared);
+            const swapped = slice('swapped', i);
+            if (swapped.length) step.swapped = Array.from(swapped);
+            const sortedIndices = slice('sorted_indices', i);
+            if (sortedIndices.length) step.sorted_indices = pairs(sortedIndices);
+            const active = slice('active', i);
+            if (active.length) step.active = pairs(active);
+            const snapshot = slice('array', i);
+            if (snapshot.length) step.array = Array.from(snapshot);
+            if (arrays.pivot[i] >= 0) step.pivot = arrays.pivot[i];
+            return step;
+        },
+    };
+}
+
+// --- 逐行解析 NDJSON 串流 ---
+async function readNdjsonStream(response, onMessage) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop(); // 最後一段可能還不完整，留到下一次
+        lines.forEach(line => {
+            if (line) onMessage(JSON.parse(line));
+        });
+    }
+    if (buffer) onMessage(JSON.parse(buffer));
+}
+
 // --- 顯示結果資訊 ---
 function displayResultInfo(result, algorithmName) {
     const complexityInfo = ALGORITHM_COMPLEXITY[algorithmName];
-    const actualTimeComplexity = complexityInfo.time[result.time_complexity_type] || complexityInfo.time.average;
+    // 後端以同分佈的輸入實際量測成長階數；沒有量測結果時才使用平均情況
+    const actualTimeComplexity = result.time_complexity_fit
+        ? `${result.time_complexity_fit.growth}，實測`
+        : complexityInfo.time.average;
 
     resultDiv.innerHTML = `
         <h2>${algorithmName.toUpperCase()} 排序結果</h2>
@@ -169,6 +316,10 @@ function displayResultInfo(result, algorithmName) {
 playBtn.addEventListener('click', playAnimation);
 pauseBtn.addEventListener('click', pauseAnimation);
 resetBtn.addEventListener('click', resetAnimation);
+stepSlider.addEventListener('input', (e) => {
+    pauseAnimation();
+    seekTo(parseInt(e.target.value, 10));
+});
 speedSlider.addEventListener('input', (e) => {
     animationSpeed = 5000 - e.target.value; // 滑桿值越大，速度越快
     if (animationInterval) { // 如果動畫正在播放，重新設定速度
@@ -186,8 +337,11 @@ function playAnimation() {
 
     animationInterval = setInterval(() => {
         if (animationIndex < animationSteps.length) {
-            applyStep(animationSteps[animationIndex]);
+            applyStep(animationSteps.at(animationIndex)); // 陣列或二進位格式的步驟列表都支援 at()
             animationIndex++;
+            updateStepSlider();
+        } else if (!animationStreamDone) {
+            // 步驟還在串流中，等待下一批資料
         } else {
             pauseAnimation();
             markSorted(); // 所有條狀圖標記為已排序
@@ -208,6 +362,8 @@ function resetAnimation() {
     pauseAnimation();
     animationIndex = 0;
     initializeBars(currentNumbers); // 恢復到初始狀態
+    animationFrame = [...currentNumbers];
+    updateStepSlider();
     playBtn.disabled = false;
     pauseBtn.disabled = true;
     resultDiv.innerHTML = ''; // 清空結果區塊
@@ -217,15 +373,87 @@ function resetAnimation() {
 
 function applyStep(step) {
     const bars = document.querySelectorAll('.bar');
-    const newOrder = step.array; // 獲取新順序的陣列
 
+    // 套用這一步的寫入差量，只更新有變動的條狀圖
+    if (step.writes) {
+        step.writes.forEach(([index, value]) => {
+            animationFrame[index] = value;
+            bars[index].style.height = `${value * 2}px`;
+            bars[index].textContent = value;
+        });
+    }
+
+    highlightStep(step, bars);
+}
+
+// --- 跳到指定位置 (已套用 position 個步驟) ---
+// 從 position 之前最近的關鍵影格開始，只需套用不超過關鍵影格間隔的差量
+function seekTo(position) {
+    position = Math.max(0, Math.min(position, animationSteps.length));
+    const bars = document.querySelectorAll('.bar');
+    const last = position - 1; // 最後一個已套用的步驟
+
+    const keyframe = findKeyframe(last);
+    let next;
+    if (keyframe >= 0) {
+        animationFrame = [...animationSteps.at(keyframe).array];
+        next = keyframe + 1;
+    } else {
+        animationFrame = [...currentNumbers];
+        next = 0;
+    }
+    for (let i = next; i <= last; i++) {
+        const step = animationSteps.at(i);
+        if (step.writes) {
+            step.writes.forEach(([index, value]) => { animationFrame[index] = value; });
+        }
+    }
+
+    animationFrame.forEach((value, index) => {
+        bars[index].style.height = `${value * 2}px`;
+        bars[index].textContent = value;
+    });
+    if (last >= 0) {
+        highlightStep(animationSteps.at(last), bars);
+    } else {
+        bars.forEach(bar => bar.classList.remove('compared', 'swapped', 'sorted', 'pivot', 'active'));
+    }
+
+    animationIndex = position;
+    completionMessage.classList.remove('show');
+    updateStepSlider();
+}
+
+// 二分搜尋不超過 index 的最後一個關鍵影格；沒有時回傳 -1
+function findKeyframe(index) {
+    let lo = 0;
+    let hi = animationKeyframes.length - 1;
+    let found = -1;
+    while (lo <= hi) {
+        const mid = (lo + hi) >> 1;
+        if (animationKeyframes[mid] <= index) {
+            found = animationKeyframes[mid];
+            lo = mid + 1;
+        } else {
+            hi = mid - 1;
+        }
+    }
+    return found;
+}
+
+function updateStepSlider() {
+    stepSlider.max = animationSteps.length;
+    stepSlider.value = animationIndex;
+    stepSlider.disabled = animationSteps.length === 0;
+    stepLabel.textContent = `步驟 ${animationIndex} / ${animationSteps.length}`;
+}
+
+// 依步驟標示比較、交換、基準點、活躍與已排序的條狀圖
+function highlightStep(step, bars) {
     // 重置所有條狀圖的顏色
     bars.forEach(bar => bar.classList.remove('compared', 'swapped', 'sorted', 'pivot', 'active'));
 
-    newOrder.forEach((value, originalIndex) => {
-        const bar = bars[originalIndex]; // 根據原始順序獲取 bar 元素
-        bar.style.height = `${value * 2}px`;
-        bar.textContent = value;
+    bars.forEach((bar, originalIndex) => {
         // 根據 step 中的指標來設定顏色
         if (step.compared && (step.compared[0] === originalIndex || step.compared[1] === originalIndex)) {
             bar.classList.add('compared');
@@ -236,19 +464,26 @@ function applyStep(step) {
         if (step.pivot === originalIndex) {
              bar.classList.add('pivot');
         }
-        if (step.active && step.active.includes(originalIndex)) {
-            bar.classList.add('active');
-        }
     });
 
-    // 標記已排序的元素
+    // 活躍與已排序的元素以區間 [[lo, hi], ...] 表示
+    if (step.active) {
+        forEachInRanges(step.active, bars, bar => bar.classList.add('active'));
+    }
     if (step.sorted_indices) {
-        step.sorted_indices.forEach(idx => {
-            bars[idx].classList.add('sorted');
-        });
+        forEachInRanges(step.sorted_indices, bars, bar => bar.classList.add('sorted'));
     }
 }
 
+// 走訪區間列表 [[lo, hi], ...] (含兩端) 內的每個條狀圖，超出範圍的索引直接略過
+function forEachInRanges(ranges, bars, callback) {
+    ranges.forEach(([lo, hi]) => {
+        for (let idx = Math.max(lo, 0); idx <= Math.min(hi, bars.length - 1); idx++) {
+            callback(bars[idx]);
+        }
+    });
+}
+
 function markSorted() {
     const bars = document.querySelectorAll('.bar');
     bars.forEach(bar => bar.classList.add('sorted'));
@@ -881,9 +1116,21 @@ const accuracyInfo = document.querySelector('.accuracy-info');
 const classificationSettings = document.getElementById('classification-settings');
 const clusteringSettings = document.getElementById('clustering-settings');
 const targetFieldInput = document.getElementById('target-field');
+const classifierSelect = document.getElementById('classifier');
+const neighborCountInput = document.getElementById('neighbor-count');
+const showNeighborsCheckbox = document.getElementById('show-neighbors');
+const tuneTreeCheckbox = document.getElementById('tune-tree');
 const clusterCountInput = document.getElementById('cluster-count');
+const clusterEngineSelect = document.getElementById('cluster-engine');
+const clusterAutoKCheckbox = document.getElementById('cluster-auto-k');
+const analysisStatus = document.querySelector('.analysis-status');
+
+// 預覽時最多讀取的檔案大小與列數；完整的檔案由伺服器分段讀取
+const PREVIEW_MAX_BYTES = 1024 * 1024;
+const PREVIEW_MAX_ROWS = 1000;
 
 let selectedFile = null;
+let selectedDatasetId = null; // 已上傳到伺服器的資料集編號，同一個檔案只上傳一次
 let selectedAnalysisType = 'clustering'; // 預設為 '分群'
 let myChart = null;
 let targetFieldName = 'target_class'; // 預設值
@@ -929,6 +1176,7 @@ document.addEventListener('DOMContentLoaded', () => {
     
     function handleFile(file) {
         selectedFile = file;
+        selectedDatasetId = null;
         fileDropArea.innerHTML = `<p>已選擇檔案：${file.name}</p>`;
         console.log('檔案已成功選取:', file.name);
 
@@ -941,7 +1189,10 @@ document.addEventListener('DOMContentLoaded', () => {
             const content = e.target.result;
             
             // 根據檔案類型選擇不同的解析方法
-            if (fileName.endsWith('.json')) {
+            if (fileName.endsWith('.json') && file.size > PREVIEW_MAX_BYTES) {
+                // 一般的 JSON 無法只解析開頭，檔案太大時不預覽
+                dataPreview.innerHTML = '<p>檔案較大，不提供預覽，可直接執行分析。</p>';
+            } else if (fileName.endsWith('.json')) {
                 try {
                     const parsedData = JSON.parse(content);
                     renderTablePreview(parsedData);
@@ -949,9 +1200,21 @@ document.addEventListener('DOMContentLoaded', () => {
                     console.error('解析 JSON 檔案失敗:', error);
                     dataPreview.innerHTML = '<p>無法預覽此檔案，請確保它是有效的 JSON 格式。</p>';
                 }
+            } else if (fileName.endsWith('.jsonl')) {
+                const rows = content.split('\n').filter(line => line.trim());
+                if (file.size > PREVIEW_MAX_BYTES) {
+                    rows.pop(); // 只讀取了開頭，最後一行可能不完整
+                }
+                try {
+                    renderTablePreview(rows.map(line => JSON.parse(line)));
+                } catch (error) {
+                    console.error('解析 JSON Lines 檔案失敗:', error);
+                    dataPreview.innerHTML = '<p>無法預覽此檔案，請確保它是有效的 JSON Lines 格式。</p>';
+                }
             } else if (fileName.endsWith('.csv') || fileName.endsWith('.txt')) {
-                // 使用 PapaParse 解析 CSV 檔案
+                // 使用 PapaParse 解析 CSV 檔案；大檔案只預覽開頭的部分
                 Papa.parse(content, {
+                    preview: file.size > PREVIEW_MAX_BYTES ? PREVIEW_MAX_ROWS : 0,
                     header: true, // 將第一行作為欄位標題
                     dynamicTyping: true, // 自動轉換資料型態 (數字、布林值等)
                     complete: function(results) {
@@ -966,14 +1229,17 @@ document.addEventListener('DOMContentLoaded', () => {
                         dataPreview.innerHTML = '<p>無法預覽此檔案，CSV 檔案格式可能有誤。</p>';
                     }
                 });
+            } else if (fileName.endsWith('.parquet') || fileName.endsWith('.feather')) {
+                // 二進位的欄式格式由伺服器讀取
+                dataPreview.innerHTML = '<p>此格式不提供預覽，可直接執行分析。</p>';
             } else {
                 // 處理其他檔案格式
                 dataPreview.innerHTML = '<p>不支援此檔案格式，目前只支援 JSON 或 CSV 檔案。</p>';
             }
         };
 
-        // 以文字形式讀取檔案
-        reader.readAsText(file);
+        // 以文字形式讀取檔案；大檔案只讀取開頭的部分供預覽
+        reader.readAsText(file.size > PREVIEW_MAX_BYTES ? file.slice(0, PREVIEW_MAX_BYTES) : file);
     }
 });
 
@@ -1005,6 +1271,19 @@ clusteringBtn.addEventListener('click', () => {
     console.log('選擇了分群模式');
 });
 
+// 只有 K 鄰居需要設定鄰居數量
+classifierSelect.addEventListener('change', () => {
+    const isKnn = classifierSelect.value === 'knn';
+    neighborCountInput.disabled = !isKnn;
+    showNeighborsCheckbox.disabled = !isKnn;
+    tuneTreeCheckbox.disabled = isKnn;
+});
+
+// 自動選擇群集數時不需要手動輸入
+clusterAutoKCheckbox.addEventListener('change', () => {
+    clusterCountInput.disabled = clusterAutoKCheckbox.checked;
+});
+
 // 監聽「執行分析」按鈕
 executeBtn.addEventListener('click', async () => {
     if (!selectedFile) {
@@ -1013,30 +1292,43 @@ executeBtn.addEventListener('click', async () => {
     }
 
     const formData = new FormData();
-    formData.append('file', selectedFile);
     formData.append('type', selectedAnalysisType);
 
     if (selectedAnalysisType === 'classification') {
         // 在 FormData 中加入使用者設定的目標欄位名稱
         targetFieldName = targetFieldInput.value;
         formData.append('target_field', targetFieldName);
+        formData.append('classifier', classifierSelect.value);
+        if (classifierSelect.value === 'knn') {
+            formData.append('n_neighbors', neighborCountInput.value);
+            // 要求伺服器回傳每一列的鄰居，點選資料點時標示
+            formData.append('neighbors', showNeighborsCheckbox.checked ? 'true' : 'false');
+        } else if (tuneTreeCheckbox.checked) {
+            // 決策樹以交叉驗證選擇參數
+            formData.append('tune', 'true');
+        }
     } else if (selectedAnalysisType === 'clustering') {
         // 在 FormData 中加入使用者設定的集群數量
-        clusterCount = clusterCountInput.value;
+        // 勾選自動選擇時，由伺服器以 silhouette 分數決定群集數
+        clusterCount = clusterAutoKCheckbox.checked ? 'auto' : clusterCountInput.value;
         formData.append('cluster_count', clusterCount);
+        formData.append('engine', clusterEngineSelect.value);
     }
 
     try {
-        const response = await fetch('/analyze', {
-            method: 'POST',
-            body: formData,
-        });
-
-        if (!response.ok) {
-            throw new Error(`HTTP 錯誤! 狀態碼: ${response.status}`);
+        let result;
+        try {
+            formData.set('dataset_id', await uploadSelectedFile());
+            result = await runAnalysisJob(formData);
+        } catch (error) {
+            if (error.status !== 404) {
+                throw error;
+            }
+            // 資料集已被伺服器淘汰，重新上傳一次
+            selectedDatasetId = null;
+            formData.set('dataset_id', await uploadSelectedFile());
+            result = await runAnalysisJob(formData);
         }
-
-        const result = await response.json();
         console.log('分析結果:', result);
 
         // 渲染分析結果與表格
@@ -1044,11 +1336,74 @@ executeBtn.addEventListener('click', async () => {
 
     } catch (error) {
         console.error('分析失敗:', error);
+        analysisStatus.textContent = '';
         analysisResults.innerHTML = `<p>分析失敗: 不適合用這個方法!</p>`;
         accuracyInfo.style.display = 'none';
     }
 });
 
+// 分析工作的輪詢間隔 (毫秒) 與各階段的顯示名稱
+const ANALYSIS_POLL_INTERVAL = 500;
+const ANALYSIS_STAGE_LABELS = {
+    parse: '讀取檔案',
+    scale: '資料前處理',
+    fit: '訓練模型',
+    serialize: '整理結果',
+};
+
+// 上傳目前選擇的檔案 (只有第一次)，回傳資料集編號
+async function uploadSelectedFile() {
+    if (selectedDatasetId) {
+        return selectedDatasetId;
+    }
+    const formData = new FormData();
+    formData.append('file', selectedFile);
+    analysisStatus.textContent = '上傳檔案中...';
+
+    const response = await fetch('/datasets', {
+        method: 'POST',
+        body: formData,
+    });
+    if (!response.ok) {
+        throw new Error(`HTTP 錯誤! 狀態碼: ${response.status}`);
+    }
+    const dataset = await response.json();
+    selectedDatasetId = dataset.dataset_id;
+    return selectedDatasetId;
+}
+
+// 送出非同步的分析工作並輪詢，直到完成後回傳分析結果
+async function runAnalysisJob(formData) {
+    let response = await fetch('/analyze/jobs', {
+        method: 'POST',
+        body: formData,
+    });
+
+    while (true) {
+        if (!response.ok) {
+            const error = new Error(`HTTP 錯誤! 狀態碼: ${response.status}`);
+            error.status = response.status;
+            throw error;
+        }
+        const job = await response.json();
+
+        if (job.status === 'done') {
+            analysisStatus.textContent = '';
+            return job.result;
+        }
+        if (job.status === 'error' || job.status === 'expired') {
+            analysisStatus.textContent = '';
+            throw new Error(job.error || '分析結果已過期');
+        }
+
+        const stage = ANALYSIS_STAGE_LABELS[job.stage] || '排隊中';
+        analysisStatus.textContent = `分析中：${stage} (${Math.round(job.progress * 100)}%)`;
+
+        await new Promise(resolve => setTimeout(resolve, ANALYSIS_POLL_INTERVAL));
+        response = await fetch(`/analyze/jobs/${job.job_id}`);
+    }
+}
+
 // 【新函數】渲染資料預覽表格
 function renderTablePreview(data) {
     // 檢查舊的 DataTables 實例是否存在並銷毀它，以避免重複初始化錯誤
@@ -1110,24 +1465,161 @@ function renderAnalysisResults(result) {
     if(result.analysis_type === 'classification'){
         dataPreviewContainer.innerHTML = ''; // 清空預覽區域，準備渲染新表格
     }
+
+    // 伺服器以欄為單位回傳結果，轉回一列一個物件供表格與圖表使用
+    const rows = columnsToRows(result.results);
     
     // 【新增】顯示準確率
     if (result.analysis_type === 'classification') {
         accuracyInfo.style.display = 'block';
         accuracyInfo.innerHTML = `模型準確率：<strong>${(result.accuracy * 100).toFixed(2)}%</strong> (於測試集)`;
-        renderTablePreview(result.results_table);
+        // 預測分佈以全部資料列計算，抽樣時也是完整的數字
+        const distribution = Object.entries(result.class_distribution || {})
+            .map(([label, count]) => `${label} ${count}`).join('、');
+        if (distribution) {
+            accuracyInfo.innerHTML += `<br>預測分佈：${distribution}`;
+        }
+        if (result.knn) {
+            // K 鄰居的索引 (是否沿用已建立的索引) 與查詢時間
+            const knn = result.knn;
+            accuracyInfo.innerHTML += `<br>K 鄰居 (k = ${knn.n_neighbors}，${knn.algorithm})：` +
+                `索引 ${knn.index_cached ? '沿用' : '建立'} ${(knn.index_time * 1000).toFixed(1)} ms，` +
+                `查詢 ${(knn.query_time * 1000).toFixed(1)} ms`;
+        } else {
+            accuracyInfo.innerHTML += `<br>決策樹訓練 ${(result.fit_time * 1000).toFixed(1)} ms`;
+        }
+        if (result.cv) {
+            // 交叉驗證選出的參數與最佳一組參數每個 fold 的分數
+            const cv = result.cv;
+            const params = Object.entries(cv.best_params).map(([name, value]) => `${name}=${value ?? '不限'}`).join('，');
+            const best = cv.candidates.find(candidate => candidate.mean_score === cv.best_score);
+            const folds = best.folds.map(fold => `${(fold.score * 100).toFixed(1)}%`).join(' / ');
+            accuracyInfo.innerHTML += `<br>${cv.folds} 折交叉驗證 (${cv.candidates.length} 組參數，${cv.time.toFixed(2)} 秒)：` +
+                `${params}，平均 <strong>${(best.mean_score * 100).toFixed(2)}%</strong> ± ${(best.std_score * 100).toFixed(2)}%` +
+                `<br>各 fold：${folds}`;
+        }
     } else {
-        accuracyInfo.style.display = 'none';
-        renderTablePreview(result.results_table);
+        // 顯示分群引擎與訓練統計
+        accuracyInfo.style.display = 'block';
+        accuracyInfo.innerHTML = `${result.n_clusters} 群 (${result.engine})：inertia <strong>${result.inertia.toFixed(2)}</strong>，` +
+            `迭代 ${result.iterations} 次，訓練 ${(result.fit_time * 1000).toFixed(1)} ms`;
+        if (result.k_selection) {
+            const selection = result.k_selection;
+            const best = selection.k_values.indexOf(selection.chosen_k);
+            accuracyInfo.innerHTML += `<br>自動選擇 k = ${selection.chosen_k} ` +
+                `(silhouette ${selection.silhouette[best].toFixed(3)}，手肘法建議 k = ${selection.elbow_k})`;
+        }
     }
-    
-    // 渲染表格 (傳入後端回傳的完整表格資料)
-    if(result.analysis_type === 'classification'){
-        renderTablePreview(result.results_table_data);
+    if (result.results.lod) {
+        // 資料列很多時伺服器只回傳抽樣 (或分箱密度)
+        const mode = result.results.lod === 'density' ? '分箱密度' : '分層抽樣';
+        accuracyInfo.innerHTML += `<br>共 ${result.results.total_rows} 列，顯示 ${result.results.rows} 列 (${mode})`;
     }
     
+    // 渲染表格 (傳入後端回傳的表格資料)
+    renderTablePreview(rows);
+    
     // 渲染圖表
-    renderChart(result);
+    renderChart(result, rows);
+}
+
+// 欄式的結果 {columns, data: {欄位: [值, ...]}} 轉為 [{欄位: 值}, ...]
+function columnsToRows(results) {
+    const rows = new Array(results.rows);
+    for (let i = 0; i < results.rows; i++) {
+        const row = {};
+        for (const name of results.columns) {
+            row[name] = results.data[name][i];
+        }
+        rows[i] = row;
+    }
+    return rows;
+}
+
+// 分群散佈圖的資料集：每個群集一個，最後是中心點
+function clusterDatasets(groupedData, centersX, centersY, density) {
+    const datasets = Object.keys(groupedData).map(cluster => {
+        return {
+            label: `群集 ${cluster}`,
+            backgroundColor: colorPalette[cluster % colorPalette.length],
+            borderColor: colorPalette[cluster % colorPalette.length],
+            data: groupedData[cluster],
+            pointStyle: 'circle',
+            radius: density ? (context => context.raw.r) : 5
+        };
+    });
+    datasets.push({
+        label: '中心點',
+        backgroundColor: '#e74c3c',
+        borderColor: '#e74c3c',
+        data: centersX.map((x, i) => ({ x: x, y: centersY[i] })),
+        pointStyle: 'crossRot',
+        radius: 10,
+        pointHoverRadius: 12
+    });
+    return datasets;
+}
+
+// 播放 K-Means 的迭代影格：每個影格套用這次改變群集的資料列，並移動中心點
+const CLUSTER_FRAME_MS = 600;
+let clusterFramesTimer = null;
+
+function stopClusteringFrames() {
+    if (clusterFramesTimer) {
+        clearInterval(clusterFramesTimer);
+        clusterFramesTimer = null;
+    }
+}
+
+function playClusteringFrames(frames, rows, xKey, yKey) {
+    stopClusteringFrames();
+    const labels = new Array(rows.length);
+    let frame = 0;
+
+    const showFrame = () => {
+        // 第一個影格包含全部資料列的起始群集，之後只有改變群集的資料列
+        frames.rows[frame].forEach((row, i) => {
+            labels[row] = frames.labels[frame][i];
+        });
+        const groupedData = {};
+        rows.forEach((row, i) => {
+            if (!groupedData[labels[i]]) {
+                groupedData[labels[i]] = [];
+            }
+            groupedData[labels[i]].push({ x: row[xKey], y: row[yKey] });
+        });
+        myChart.data.datasets = clusterDatasets(groupedData, frames.centers_x[frame], frames.centers_y[frame], null);
+        myChart.options.plugins.title.text = `K-Means 第 ${frame + 1} / ${frames.count} 個影格：` +
+            `${frames.changed[frame]} 列改變群集，inertia ${frames.inertia[frame].toFixed(2)}`;
+        myChart.update('none');
+
+        frame++;
+        if (frame === frames.count) {
+            stopClusteringFrames();
+        }
+    };
+    showFrame();
+    if (frame < frames.count) {
+        clusterFramesTimer = setInterval(showFrame, CLUSTER_FRAME_MS);
+    }
+}
+
+// 分箱密度轉為各群組的散佈點，點的大小依箱子中的列數調整
+function densityPoints(density) {
+    const maxCount = Math.max(...density.count);
+    const grouped = {};
+    density.group.forEach((group, i) => {
+        if (!grouped[group]) {
+            grouped[group] = [];
+        }
+        grouped[group].push({
+            x: density.x[i],
+            y: density.y[i],
+            r: 2 + 8 * Math.sqrt(density.count[i] / maxCount),
+            count: density.count[i],
+        });
+    });
+    return grouped;
 }
 
 // 自定義顏色集，類似 Seaborn 的 'viridis'
@@ -1136,82 +1628,50 @@ const colorPalette = [
 ];
 
 // 【修改】渲染圖表函式
-function renderChart(result) {
+function renderChart(result, dataForChart) {
     const ctx = document.getElementById('myChart').getContext('2d');
     
     // 銷毀舊的圖表實例以避免重複
     if (myChart) {
         myChart.destroy();
     }
+    stopClusteringFrames();
     
-    // 統一資料來源變數
-    const dataForChart = result.analysis_type === 'clustering' ? result.results_table : result.results_table_data;
-
     // 檢查資料是否可用，如果沒有資料則直接返回
     if (!dataForChart || dataForChart.length === 0) {
         analysisResults.innerHTML = '<p>沒有可繪製圖表的資料。</p>';
         return;
     }
 
-    // 動態取得數值型特徵
-    const numericKeys = Object.keys(dataForChart[0]).filter(key => {
-        // 排除分群或分類產生的額外欄位，並確保是數值型資料
-        const excludedKeys = result.analysis_type === 'clustering' ? ['cluster'] : ['is_train', 'predicted_class'];
-        return !excludedKeys.includes(key) && typeof dataForChart[0][key] === 'number';
-    });
-
-    if (numericKeys.length < 2) {
+    // 散佈圖的兩個軸由伺服器決定 (前兩個數值型特徵)
+    if (!result.results.axes) {
         analysisResults.innerHTML = '<p>資料中至少需要兩個數值欄位才能繪製散佈圖。</p>';
         return;
     }
 
-    const xKey = numericKeys[0];
-    const yKey = numericKeys[1];
+    const [xKey, yKey] = result.results.axes;
+    // 分箱密度模式下以箱子取代個別資料列
+    const density = result.results.density ? densityPoints(result.results.density) : null;
 
     if (result.analysis_type === 'clustering') {
         // 分群模式下的圖表邏輯
-        const groupedData = {};
-        const centroidsData = {};
+        let groupedData = {};
 
-        dataForChart.forEach(row => {
-            const cluster = row.cluster;
-            if (!groupedData[cluster]) {
-                groupedData[cluster] = [];
-                centroidsData[cluster] = { xSum: 0, ySum: 0, count: 0 };
-            }
-            groupedData[cluster].push({ x: row[xKey], y: row[yKey] });
-            centroidsData[cluster].xSum += row[xKey];
-            centroidsData[cluster].ySum += row[yKey];
-            centroidsData[cluster].count++;
-        });
+        if (density) {
+            groupedData = density;
+        } else {
+            dataForChart.forEach(row => {
+                const cluster = row.cluster;
+                if (!groupedData[cluster]) {
+                    groupedData[cluster] = [];
+                }
+                groupedData[cluster].push({ x: row[xKey], y: row[yKey] });
+            });
+        }
 
-        const datasets = Object.keys(groupedData).map((cluster, index) => {
-            return {
-                label: `群集 ${cluster}`,
-                backgroundColor: colorPalette[cluster % colorPalette.length],
-                borderColor: colorPalette[cluster % colorPalette.length],
-                data: groupedData[cluster],
-                pointStyle: 'circle',
-                radius: 5
-            };
-        });
-        
-        const centroidsDataset = {
-            label: '中心點',
-            backgroundColor: '#e74c3c',
-            borderColor: '#e74c3c',
-            data: Object.keys(centroidsData).map(cluster => {
-                const centroid = centroidsData[cluster];
-                return {
-                    x: centroid.xSum / centroid.count,
-                    y: centroid.ySum / centroid.count
-                };
-            }),
-            pointStyle: 'crossRot',
-            radius: 10,
-            pointHoverRadius: 12
-        };
-        datasets.push(centroidsDataset);
+        // 中心點由伺服器以全部資料計算，抽樣時仍然準確
+        const centroids = result.results.centroids;
+        const datasets = clusterDatasets(groupedData, centroids.x, centroids.y, density);
 
         myChart = new Chart(ctx, {
             type: 'scatter',
@@ -1233,6 +1693,9 @@ function renderChart(result) {
                                 if (context.parsed.x !== null && context.parsed.y !== null) {
                                     label += `(${context.parsed.x.toFixed(2)}, ${context.parsed.y.toFixed(2)})`;
                                 }
+                                if (context.raw.count !== undefined) {
+                                    label += ` ${context.raw.count} 列`;
+                                }
                                 return label;
                             }
                         }
@@ -1264,18 +1727,31 @@ function renderChart(result) {
                 }
             }
         });
+        // 'animated' 引擎回傳每次迭代的影格，可以播放中心點移動的過程
+        if (result.results.frames && !density) {
+            const playButton = document.createElement('button');
+            playButton.className = 'frames-play-btn';
+            playButton.textContent = `播放迭代過程 (${result.results.frames.count} 個影格)`;
+            playButton.addEventListener('click', () => playClusteringFrames(result.results.frames, dataForChart, xKey, yKey));
+            accuracyInfo.appendChild(playButton);
+        }
     } else if (result.analysis_type === 'classification') {
         // 分類模式下的圖表邏輯
-        const groupedData = {};
-        const distinctClasses = [...new Set(dataForChart.map(row => row.predicted_class))].sort();
+        let groupedData = {};
+        const distinctClasses = result.results.centroids.group.slice().sort();
 
-        dataForChart.forEach(row => {
-            const predictedClass = row.predicted_class;
-            if (!groupedData[predictedClass]) {
-                groupedData[predictedClass] = [];
-            }
-            groupedData[predictedClass].push({ x: row[xKey], y: row[yKey] });
-        });
+        if (density) {
+            groupedData = density;
+        } else {
+            dataForChart.forEach((row, position) => {
+                const predictedClass = row.predicted_class;
+                if (!groupedData[predictedClass]) {
+                    groupedData[predictedClass] = [];
+                }
+                // row 為回傳資料列的位置，用來查詢該列的鄰居
+                groupedData[predictedClass].push({ x: row[xKey], y: row[yKey], row: position });
+            });
+        }
 
         const datasets = distinctClasses.map((className, index) => {
             return {
@@ -1284,20 +1760,46 @@ function renderChart(result) {
                 borderColor: colorPalette[index % colorPalette.length],
                 data: groupedData[className] || [],
                 pointStyle: 'circle',
-                radius: 5
+                radius: density ? (context => context.raw.r) : 5
             };
         });
 
+        // 點選資料點時標示它的 k 個鄰居 (伺服器有回傳鄰居時)
+        const neighbors = result.results.neighbors;
+        const neighborsDataset = {
+            label: '鄰居',
+            backgroundColor: 'rgba(0, 0, 0, 0)',
+            borderColor: '#e74c3c',
+            borderWidth: 2,
+            data: [],
+            pointStyle: 'circle',
+            radius: 8
+        };
+        if (neighbors && !density) {
+            datasets.push(neighborsDataset);
+        }
+
         myChart = new Chart(ctx, {
             type: 'scatter',
             data: { datasets: datasets },
             options: {
                 responsive: true,
                 maintainAspectRatio: false,
+                onClick: (event, elements) => {
+                    if (!neighbors || density || elements.length === 0) {
+                        return;
+                    }
+                    const point = datasets[elements[0].datasetIndex].data[elements[0].index];
+                    if (point.row === undefined) {
+                        return;
+                    }
+                    neighborsDataset.data = neighbors.x[point.row].map((x, i) => ({ x: x, y: neighbors.y[point.row][i] }));
+                    myChart.update();
+                },
                 plugins: {
                     title: {
                         display: true,
-                        text: '決策樹分類結果散佈圖',
+                        text: result.classifier === 'knn' ? 'K 鄰居分類結果散佈圖' : '決策樹分類結果散佈圖',
                         font: { size: 16 }
                     },
                     tooltip: {
@@ -1308,6 +1810,9 @@ function renderChart(result) {
                                 if (context.parsed.x !== null && context.parsed.y !== null) {
                                     label += `(${context.parsed.x.toFixed(2)}, ${context.parsed.y.toFixed(2)})`;
                                 }
+                                if (context.raw.count !== undefined) {
+                                    label += ` ${context.raw.count} 列`;
+                                }
                                 return label;
                             }
                         }
@@ -0,0 +1,23 @@
+# 測試直接匯入 algo_visualizer 下的模組 (與 app.py 相同的平面匯入)
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+    yield app_module
+    # 關閉 /race 建立的行程池
+    import workers
+    workers.shutdown()
+
+
+@pytest.fixture
+def client(app_module, tmp_path, monkeypatch):
+    # 資料集存放在暫存目錄，不寫入 instance/
+    monkeypatch.setattr(app_module, 'dataset_registry', app_module.DatasetRegistry(str(tmp_path / 'datasets')))
+    return app_module.app.test_client()
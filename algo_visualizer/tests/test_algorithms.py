@@ -0,0 +1,221 @@
+# algorithms.py 的排序結果與動畫步驟 (寫入差量、區間列表)
+
+import random
+
+import pytest
+
+import algorithms
+
+STEP_FUNCS = {
+    'bubble': algorithms.bubble_sort_steps,
+    'insertion': algorithms.insertion_sort_steps,
+    'selection': algorithms.selection_sort_steps,
+    'quick': algorithms.quick_sort_steps,
+    'merge': algorithms.merge_sort_steps,
+    'heap': algorithms.heap_sort_steps,
+}
+
+SORTS = {
+    'bubble': algorithms.bubble_sort,
+    'insertion': algorithms.insertion_sort,
+    'selection': algorithms.selection_sort,
+    'quick': algorithms.quick_sort,
+    'merge': algorithms.merge_sort,
+    'heap': algorithms.heap_sort,
+}
+
+INPUTS = [
+    [],
+    [7],
+    [5, 3, 4, 1, 2],
+    [3, 1, 3, 2, 1, 2],
+    list(range(16)),
+    list(range(16, 0, -1)),
+    [random.Random(0).randint(-50, 50) for _ in range(60)],
+]
+
+
+def replay(original, steps):
+    """從原始陣列依序套用每一步的寫入，回傳每一步之後的完整陣列"""
+    arr = list(original)
+    frames = []
+    for step in steps:
+        for k, value in step.get('writes', []):
+            arr[k] = value
+        frames.append(list(arr))
+    return frames
+
+
+def expand(intervals):
+    """把區間列表展開成索引集合"""
+    return {k for lo, hi in intervals for k in range(lo, hi + 1)}
+
+
+class SnapshotRecorder(algorithms.StepRecorder):
+    """另外保存每一步當下的完整陣列，作為重播結果的對照"""
+
+    def __init__(self, arr, *args, **kwargs):
+        super().__init__(arr, *args, **kwargs)
+        self.frames = []
+        SnapshotRecorder.last = self
+
+    def step(self, *args, **kwargs):
+        step = super().step(*args, **kwargs)
+        self.frames.append(list(self.arr))
+        return step
+
+
+@pytest.mark.parametrize('name', SORTS)
+@pytest.mark.parametrize('data', INPUTS)
+def test_replaying_writes_rebuilds_every_frame(monkeypatch, name, data):
+    monkeypatch.setattr(algorithms, 'StepRecorder', SnapshotRecorder)
+    sorted_data, _, _, _, steps = SORTS[name](data)
+    assert sorted_data == sorted(data)
+    assert len(steps) == len(SnapshotRecorder.last.frames)
+    assert replay(data, steps) == SnapshotRecorder.last.frames
+
+
+@pytest.mark.parametrize('name', SORTS)
+def test_iter_sort_yields_the_same_steps(name):
+    data = INPUTS[-1]
+    sorted_data, _, comparisons, swaps, steps = SORTS[name](data)
+    recorder = algorithms.StepRecorder(list(data))
+    assert list(algorithms.iter_sort(STEP_FUNCS[name], recorder)) == steps
+    assert (recorder.arr, recorder.comparisons, recorder.swaps) == (sorted_data, comparisons, swaps)
+
+
+@pytest.mark.parametrize('name', SORTS)
+def test_marker_intervals_are_well_formed(name):
+    data = INPUTS[-1]
+    steps = SORTS[name](data)[4]
+    for step in steps:
+        for lo, hi in step.get('sorted_indices', []):
+            assert 0 <= lo <= hi < len(data)
+        for lo, hi in step.get('active', []):
+            assert 0 <= lo <= hi
+    assert expand(steps[-1]['sorted_indices']) == set(range(len(data)))
+
+
+# 這幾種排序標記為已排序的位置都已是最終的值
+@pytest.mark.parametrize('name', ['bubble', 'selection', 'quick', 'heap'])
+def test_sorted_intervals_hold_final_values(name):
+    data = INPUTS[-1]
+    expected = sorted(data)
+    steps = SORTS[name](data)[4]
+    for frame, step in zip(replay(data, steps), steps):
+        for k in expand(step.get('sorted_indices', [])):
+            assert frame[k] == expected[k]
+
+
+def test_sorted_tracker_merges_adjacent_indices():
+    tracker = algorithms.SortedTracker(10)
+    assert tracker.intervals() == []
+    for k in (3, 5, 8):
+        assert tracker.add(k)
+    snapshot = tracker.intervals()
+    assert snapshot == [[3, 3], [5, 5], [8, 8]]
+    assert tracker.intervals() is snapshot
+    assert tracker.add(4)
+    assert not tracker.add(4)
+    tracker.add_range(6, 7)
+    assert tracker.intervals() == [[3, 8]]
+    # 已送出的快照不會被之後的標記改寫
+    assert snapshot == [[3, 3], [5, 5], [8, 8]]
+    assert 4 in tracker and 2 not in tracker
+
+
+def test_sorted_tracker_matches_a_set():
+    rng = random.Random(1)
+    tracker = algorithms.SortedTracker(200)
+    marked = set()
+    for _ in range(300):
+        k = rng.randrange(200)
+        assert tracker.add(k) == (k not in marked)
+        marked.add(k)
+        intervals = tracker.intervals()
+        assert expand(intervals) == marked
+        # 區間依序排列，且互不相鄰 (相鄰的已合併)
+        assert all(a[1] + 1 < b[0] for a, b in zip(intervals, intervals[1:]))
+
+
+@pytest.mark.parametrize('name', SORTS)
+@pytest.mark.parametrize('data', INPUTS)
+def test_metrics_only_matches_recorded_counts(name, data):
+    recorded_data, _, comparisons, swaps, _ = SORTS[name](data)
+    sorted_data, _, metrics_comparisons, metrics_swaps, steps = SORTS[name](data, record=False)
+    assert steps == []
+    assert (sorted_data, metrics_comparisons, metrics_swaps) == (recorded_data, comparisons, swaps)
+
+
+# 全部相同的值讓 Lomuto 分割每次都極度不平均，introsort 會改用堆積排序
+@pytest.mark.parametrize('pivot', algorithms.PIVOT_STRATEGIES)
+@pytest.mark.parametrize('data', INPUTS + [[4] * 100])
+def test_quick_sort_pivot_strategies(pivot, data):
+    random.seed(0)
+    sorted_data, _, comparisons, swaps, steps = algorithms.quick_sort(data, pivot=pivot)
+    assert sorted_data == sorted(data)
+    assert replay(data, steps)[-1] == sorted_data
+    random.seed(0)
+    metrics_data, _, metrics_comparisons, metrics_swaps, _ = algorithms.quick_sort(data, record=False, pivot=pivot)
+    assert (metrics_data, metrics_comparisons, metrics_swaps) == (sorted_data, comparisons, swaps)
+
+
+def test_quick_sort_rejects_unknown_pivot():
+    with pytest.raises(ValueError):
+        algorithms.quick_sort([2, 1], pivot='first')
+    with pytest.raises(ValueError):
+        algorithms.quick_sort([2, 1], record=False, pivot='first')
+
+
+@pytest.mark.parametrize('name', SORTS)
+@pytest.mark.parametrize('interval', [1, 7, None])
+def test_keyframes_match_replayed_frames(name, interval):
+    data = INPUTS[-1]
+    recorder = algorithms.StepRecorder(list(data), keyframe_interval=interval)
+    steps = list(algorithms.iter_sort(STEP_FUNCS[name], recorder))
+    frames = replay(data, steps)
+    k = recorder.keyframe_interval
+    assert k == (interval or algorithms.default_keyframe_interval(len(data)))
+    assert recorder.keyframes == list(range(0, len(steps), k))
+    assert [i for i, step in enumerate(steps) if 'array' in step] == recorder.keyframes
+    for i in recorder.keyframes:
+        assert steps[i]['array'] == frames[i]
+
+    # 跳到任一步：從前一個關鍵影格開始，最多套用 K - 1 步的差量
+    for target in range(len(steps)):
+        start = target // k * k
+        arr = list(steps[start]['array'])
+        for step in steps[start + 1:target + 1]:
+            for index, value in step.get('writes', []):
+                arr[index] = value
+        assert arr == frames[target]
+
+
+@pytest.mark.parametrize('name', SORTS)
+@pytest.mark.parametrize('max_frames', [5, 40])
+@pytest.mark.parametrize('expected_steps', [None, 100, 10 ** 6])
+def test_budget_recorder_bounds_frames(name, max_frames, expected_steps):
+    data = [random.Random(1).randint(0, 999) for _ in range(200)]
+    recorder = algorithms.make_recorder(data, max_frames=max_frames, expected_steps=expected_steps)
+    steps = algorithms.collect_steps(STEP_FUNCS[name], recorder)
+    assert recorder.arr == sorted(data)
+    # 預算每用完一次減半，最後只剩 1 時每保留一步 stride 就加倍，
+    # 因此影格數不超過 2 * max_frames 再加上 log2(原始步驟數) 左右
+    raw_steps = len(steps) + recorder.dropped
+    assert 0 < len(steps) <= 2 * max_frames + raw_steps.bit_length() + 1
+    assert len(steps) < raw_steps
+    # 被捨棄步驟的寫入併入後面的步驟，重播到最後仍是排序後的陣列
+    assert replay(data, steps)[-1] == sorted(data)
+    # 計數不受影格預算影響
+    _, _, expected_comparisons, expected_swaps, _ = algorithms.run_sort(STEP_FUNCS[name], data)
+    assert (recorder.comparisons, recorder.swaps) == (expected_comparisons, expected_swaps)
+
+
+@pytest.mark.parametrize('name', SORTS)
+@pytest.mark.parametrize('record', [True, False])
+def test_limit_cancel_stops_the_sort(name, record):
+    recorder = algorithms.make_recorder(INPUTS[-1], record)
+    recorder.limit(cancel=lambda: True)
+    with pytest.raises(algorithms.BudgetExceeded) as excinfo:
+        algorithms.collect_steps(STEP_FUNCS[name], recorder)
+    assert excinfo.value.reason == 'cancelled'
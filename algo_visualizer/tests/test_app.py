@@ -0,0 +1,131 @@
+# app.py 的基本路由 (Flask test client)
+
+import io
+import time
+
+import pytest
+
+import workers
+
+CSV = b'a,b,target_class\n' + b''.join(
+    f'{i % 7},{(i * 3) % 11},{"x" if i % 2 else "y"}\n'.encode() for i in range(60))
+
+
+def wait_for_job(client, location, timeout=60):
+    deadline = time.time() + timeout
+    while True:
+        response = client.get(location)
+        assert response.status_code in (200, 202), response.get_json()
+        info = response.get_json()
+        if info['status'] in ('done', 'error', 'expired') or time.time() > deadline:
+            return info
+        time.sleep(0.1)
+
+
+def test_sort_returns_sorted_steps(client):
+    response = client.post('/sort', json={'numbers': [5, 3, 4, 1, 2], 'algorithm': 'bubble'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['sorted_data'] == [1, 2, 3, 4, 5]
+    assert data['animation_steps']
+    assert workers.stats()['in_use'] == 0
+
+
+def test_analyze_job_clustering(client):
+    response = client.post('/analyze/jobs', data={
+        'file': (io.BytesIO(CSV), 'data.csv'), 'type': 'clustering', 'cluster_count': '2',
+    }, content_type='multipart/form-data')
+    assert response.status_code in (200, 202), response.get_json()
+    info = wait_for_job(client, response.headers['Location'])
+    assert info['status'] == 'done', info
+    assert info['result']['n_clusters'] == 2
+    assert info['result']['results']['total_rows'] == 60
+
+
+def test_analyze_job_classification(client):
+    response = client.post('/analyze/jobs', data={
+        'file': (io.BytesIO(CSV), 'data.csv'), 'type': 'classification', 'target_field': 'target_class',
+    }, content_type='multipart/form-data')
+    assert response.status_code in (200, 202), response.get_json()
+    info = wait_for_job(client, response.headers['Location'])
+    assert info['status'] == 'done', info
+    assert 0 <= info['result']['accuracy'] <= 1
+    # 預測分佈涵蓋全部資料列
+    assert sum(info['result']['class_distribution'].values()) == 60
+    assert set(info['result']['class_distribution']) <= {'x', 'y'}
+
+
+def test_sort_metrics_only(client):
+    response = client.post('/sort', json={'numbers': [3, 1, 2], 'record': False})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['comparisons'] == 3
+    assert 'animation_steps' not in data
+
+
+@pytest.mark.parametrize('route', ['/sort', '/race'])
+def test_rejects_non_boolean_record(client, route):
+    response = client.post(route, json={'numbers': [3, 1, 2], 'algorithms': ['bubble'], 'record': 'false'})
+    assert response.status_code == 400
+
+
+def test_sort_stream_error_releases_slot(client):
+    slots = workers.stats()['workers'] + workers.stats()['queue_limit']
+    for _ in range(slots + 1):
+        response = client.post('/sort', json={'numbers': [3, 'a', 1], 'stream': True, 'max_frames': 10})
+        assert response.status_code == 400
+    assert workers.stats()['in_use'] == 0
+    assert client.post('/sort', json={'numbers': [2, 1]}).status_code == 200
+
+
+def test_race_submit_error_releases_slots(app_module, monkeypatch):
+    class BrokenPool:
+        def submit(self, *args):
+            raise RuntimeError('pool is broken')
+
+    workers.get_pool()
+    monkeypatch.setattr(workers, 'get_pool', lambda: BrokenPool())
+    with pytest.raises(RuntimeError):
+        workers.start_race(['bubble', 'quick'], [3, 1, 2], {}, timeout=1.0)
+    assert workers.stats()['in_use'] == 0
+
+
+def test_race_uses_the_recorded_step_ceiling(app_module, client):
+    # 保留所有步驟 (max_frames 為 null) 時與 /sort 一樣使用較嚴格的上限
+    n = app_module.max_input_size('bubble', app_module.app.config['SORT_MAX_RECORDED_STEPS']) + 1
+    response = client.post('/race', json={'numbers': list(range(n)), 'algorithms': ['bubble'], 'max_frames': None})
+    assert response.status_code == 413
+    response = client.post('/race', json={'numbers': list(range(n)), 'algorithms': ['bubble'], 'record': False})
+    assert response.status_code != 413
+
+
+def test_analyze_auto_cluster_count(client):
+    response = client.post('/analyze', data={
+        'file': (io.BytesIO(CSV), 'data.csv'), 'type': 'clustering', 'cluster_count': 'auto', 'k_max': '4',
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert result['k_selection']['k_values'] == [2, 3, 4]
+    assert result['n_clusters'] in (2, 3, 4)
+
+
+def test_analyze_knn_classification(client):
+    response = client.post('/analyze', data={
+        'file': (io.BytesIO(CSV), 'data.csv'), 'type': 'classification', 'target_field': 'target_class',
+        'classifier': 'knn', 'n_neighbors': '3', 'neighbors': 'true',
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert result['knn']['n_neighbors'] == 3
+    assert len(result['results']['neighbors']['x'][0]) == 3
+
+
+def test_analyze_tree_tuning(client):
+    response = client.post('/analyze', data={
+        'file': (io.BytesIO(CSV), 'data.csv'), 'type': 'classification', 'target_field': 'target_class',
+        'tune': 'true', 'cv_folds': '3',
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    cv = response.get_json()['cv']
+    assert cv['folds'] == 3
+    assert all(len(candidate['folds']) == 3 for candidate in cv['candidates'])
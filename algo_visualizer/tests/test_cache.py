@@ -0,0 +1,62 @@
+# cache.py 的 LRU 回應快取
+
+import gzip
+import json
+
+from cache import GzipAccumulator, ResponseCache, compress_json, make_key
+
+
+def test_evicts_least_recently_used_over_size_cap():
+    cache = ResponseCache(max_bytes=30, ttl=60, max_entry_bytes=30)
+    cache.put('a', b'x' * 10)
+    cache.put('b', b'x' * 10)
+    cache.put('c', b'x' * 10)
+    assert cache.get('a') == b'x' * 10  # a 成為最近使用的項目
+    cache.put('d', b'x' * 10)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None and cache.get('d') is not None
+    assert cache.current_bytes == 30
+    assert cache.stats()['evictions'] == 1
+
+
+def test_rejects_entries_over_entry_cap():
+    cache = ResponseCache(max_bytes=100)
+    assert cache.max_entry_bytes == 25
+    assert not cache.put('big', b'x' * 26)
+    assert cache.get('big') is None
+    assert cache.put('small', b'x' * 25)
+    assert cache.current_bytes == 25
+
+
+def test_replacing_a_key_keeps_size_accounting():
+    cache = ResponseCache(max_bytes=100, max_entry_bytes=100)
+    cache.put('a', b'x' * 40)
+    cache.put('a', b'x' * 10)
+    assert cache.current_bytes == 10
+    assert cache.stats()['entries'] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(max_bytes=100, ttl=-1)
+    cache.put('a', b'body')
+    assert cache.get('a') is None
+    assert cache.current_bytes == 0
+    assert cache.stats()['misses'] == 1
+
+
+def test_make_key_depends_on_every_part():
+    assert make_key('bubble', [1, 2], {'pivot': 'last'}) == make_key('bubble', [1, 2], {'pivot': 'last'})
+    assert make_key('bubble', [1, 2]) != make_key('bubble', [2, 1])
+
+
+def test_gzip_accumulator_gives_up_over_limit():
+    small = GzipAccumulator(limit=1024)
+    chunks = [small.add('{"a":1}\n'), small.add('{"b":2}\n'), small.finish()]
+    assert gzip.decompress(small.result()) == b'{"a":1}\n{"b":2}\n'
+    # 串流送出的片段本身就是完整的 gzip 本文
+    assert b''.join(chunks) == small.result()
+    large = GzipAccumulator(limit=64)
+    large.add(json.dumps(list(range(5000))))
+    large.finish()
+    assert large.result() is None
+    assert json.loads(gzip.decompress(compress_json({'a': [1, 2]}))) == {'a': [1, 2]}
@@ -0,0 +1,122 @@
+# clustering.py 的分群引擎與標籤指定
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import clustering
+
+
+def blobs(n_per_blob=300, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0, 0, 0], [10, 10, 0], [0, 10, 10]], dtype=float)
+    points = np.concatenate([center + rng.normal(size=(n_per_blob, 3)) for center in centers])
+    return pd.DataFrame(points, columns=['x', 'y', 'z'])
+
+
+def test_assign_clusters_matches_brute_force():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(1000, 4))
+    centers = rng.normal(size=(5, 4))
+    labels, inertia = clustering.assign_clusters(X, centers, chunk_rows=97)
+
+    distances = ((X[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    np.testing.assert_array_equal(labels, distances.argmin(axis=1))
+    assert inertia == pytest.approx(distances.min(axis=1).sum())
+
+
+@pytest.mark.parametrize('engine', ['full', 'minibatch', 'sample', 'animated'])
+def test_engines_separate_blobs(engine, monkeypatch):
+    # 縮小取樣數，讓 'sample' 真的只以部分資料訓練
+    monkeypatch.setattr(clustering, 'SAMPLE_SIZE', 200)
+    df = blobs()
+    result = clustering.perform_clustering(df, n_clusters=3, engine=engine)
+    assert result['engine'] == engine
+    labels = result['results_df']['cluster'].to_numpy()
+    # 每一團的點都被分到同一群，且三團各自一群
+    groups = [set(labels[i * 300:(i + 1) * 300]) for i in range(3)]
+    assert all(len(group) == 1 for group in groups)
+    assert len(set.union(*groups)) == 3
+
+
+def test_auto_engine_depends_on_size(monkeypatch):
+    monkeypatch.setattr(clustering, 'AUTO_FULL_MAX_ROWS', 500)
+    assert clustering.perform_clustering(blobs(100), engine='auto')['engine'] == 'full'
+    assert clustering.perform_clustering(blobs(), engine='auto')['engine'] == 'minibatch'
+
+
+def test_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        clustering.perform_clustering(blobs(10), engine='gpu')
+
+
+def test_instrumented_kmeans_matches_sklearn_and_replays():
+    from sklearn.cluster import KMeans
+
+    X = blobs(200).to_numpy()
+    init = X[[0, 1, 2]]
+    model = clustering.InstrumentedKMeans(3, init=init, chunk_rows=97).fit(X)
+    reference = KMeans(3, init=init, n_init=1, algorithm='lloyd').fit(X)
+    np.testing.assert_allclose(model.cluster_centers_, reference.cluster_centers_, atol=1e-6)
+    np.testing.assert_array_equal(model.labels_, reference.labels_)
+
+    # 依序套用每個影格改變群集的列，得到最後的標籤
+    frames = model.frames_
+    labels = np.full(len(X), -1)
+    for positions, new_labels in frames['deltas']:
+        labels[positions] = new_labels
+    np.testing.assert_array_equal(labels, model.labels_)
+    assert frames['changed'][0] == len(X)
+    assert len(frames['centers']) == len(frames['deltas']) == len(frames['inertia'])
+
+
+def test_classification_distribution_counts_every_row():
+    df = blobs(50)
+    df['label'] = np.repeat([1, 2, 3], 50)
+    result = clustering.perform_classification(df, 'label')
+    distribution = result['class_distribution']
+    assert set(distribution) <= {'1', '2', '3'}
+    assert sum(distribution.values()) == 150
+    assert list(distribution.values()) == sorted(distribution.values(), reverse=True)
+    predicted = result['results_df']['predicted_class'].value_counts()
+    assert distribution == {str(label): int(count) for label, count in predicted.items()}
+
+
+def test_vote_neighbors_breaks_ties_by_smaller_label():
+    neighbor_labels = np.array([[2, 1, 2], [3, 1, 1], [2, 0, 1]])
+    assert clustering.vote_neighbors(neighbor_labels).tolist() == [2, 1, 0]
+
+
+def test_knn_matches_sklearn_and_reuses_index(tmp_path):
+    from sklearn.neighbors import KNeighborsClassifier
+    from sessions import NeighborIndexStore
+
+    rng = np.random.default_rng(1)
+    features = rng.normal(size=(300, 4))
+    train_positions = np.arange(0, 300, 2)
+    y_train = (features[train_positions, 0] > 0).astype(np.int64)
+    store = NeighborIndexStore(str(tmp_path))
+    key = ('label', ['a', 'b', 'c', 'd'])
+    y_pred, neighbors, info = clustering.knn_predict(features, train_positions, y_train, 5, True, store, key)
+
+    train = features[train_positions]
+    scale = train.std(axis=0)
+    model = KNeighborsClassifier(n_neighbors=5).fit((train - train.mean(axis=0)) / scale, y_train)
+    assert y_pred.tolist() == model.predict((features - train.mean(axis=0)) / scale).tolist()
+    assert neighbors.shape == (300, 5) and np.isin(neighbors, train_positions).all()
+    assert not info['index_cached']
+
+    again, _, info = clustering.knn_predict(features, train_positions, y_train, 3, index_store=store, store_key=key)
+    assert info['index_cached'] and info['n_neighbors'] == 3
+    assert len(again) == 300
+
+
+def test_tune_tree_scores_every_candidate_on_every_fold():
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(200, 3)).astype(np.float32)
+    y = (X[:, 0] > 0).astype(np.int64)
+    grid = {'max_depth': [1, 5], 'min_samples_leaf': [1, 20]}
+    results, best = clustering.tune_tree(X, y, folds=4, param_grid=grid)
+    assert [result['params'] for result in results] == list(clustering.ParameterGrid(grid))
+    assert all(len(result['folds']) == 4 for result in results)
+    assert best == max(results, key=lambda result: result['mean_score'])['params']
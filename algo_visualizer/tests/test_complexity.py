@@ -0,0 +1,46 @@
+# complexity.py 的分佈判斷與成長階數擬合
+
+import math
+import random
+
+import pytest
+
+from complexity import GROWTH_MODELS, detect_distribution, fit_growth, measure_complexity
+
+SIZES = (32, 64, 128, 256)
+
+
+@pytest.mark.parametrize('growth, curve', [
+    ('O(n)', lambda n: 3 * n),
+    ('O(n log n)', lambda n: 0.5 * n * math.log2(n)),
+    ('O(n²)', lambda n: n * n / 2),
+])
+def test_fit_growth_recovers_known_curves(growth, curve):
+    fitted, constant, errors = fit_growth(SIZES, [curve(n) for n in SIZES])
+    assert fitted == growth
+    assert errors[growth] == pytest.approx(0, abs=1e-12)
+    assert constant * GROWTH_MODELS[growth](SIZES[-1]) == pytest.approx(curve(SIZES[-1]))
+
+
+def test_fit_growth_ignores_lower_order_terms():
+    assert fit_growth(SIZES, [n * n / 2 + 5 * n for n in SIZES])[0] == 'O(n²)'
+    assert fit_growth(SIZES, [n * math.log2(n) + 2 * n for n in SIZES])[0] == 'O(n log n)'
+
+
+def test_detect_distribution():
+    nearly_sorted = list(range(40))
+    nearly_sorted[10], nearly_sorted[11] = nearly_sorted[11], nearly_sorted[10]
+    assert detect_distribution([]) == 'sorted'
+    assert detect_distribution(list(range(20))) == 'sorted'
+    assert detect_distribution(list(range(20, 0, -1))) == 'reversed'
+    assert detect_distribution([1, 2] * 10) == 'few_unique'
+    assert detect_distribution(nearly_sorted) == 'nearly_sorted'
+    assert detect_distribution(random.Random(0).sample(range(100), 40)) == 'random'
+
+
+def test_measure_complexity_of_sorts():
+    data = random.Random(0).sample(range(1000), 100)
+    assert measure_complexity('bubble', data)['growth'] == 'O(n²)'
+    assert measure_complexity('merge', data)['growth'] == 'O(n log n)'
+    assert measure_complexity('insertion', sorted(data))['growth'] == 'O(n)'
+    assert measure_complexity('quick', sorted(data), {'pivot': 'last'})['growth'] == 'O(n²)'
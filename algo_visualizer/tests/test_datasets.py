@@ -0,0 +1,100 @@
+# datasets.py 的讀取、型別縮小與欄式存放
+
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import datasets
+from datasets import DatasetRegistry, ingest, load_dataset, read_table, write_dataset
+
+CSV = (b'id,score,label,name,big,flag\n'
+       + b''.join(f'{i},{i / 4},{"ab"[i % 2] if i % 5 else ""},n{i},{i * 10 ** 10},{i % 3 == 0}\n'.encode()
+                  for i in range(20)))
+
+
+def write_file(tmp_path, raw, filename):
+    path = tmp_path / filename
+    path.write_bytes(raw)
+    return str(path)
+
+
+def test_read_table_downcasts_columns(tmp_path):
+    df = read_table(write_file(tmp_path, CSV, 'data.csv'), 'data.csv')
+    assert df['id'].dtype == np.int32
+    assert df['score'].dtype == np.float32
+    # 低基數的字串欄轉為 category，缺值保留
+    assert isinstance(df['label'].dtype, pd.CategoricalDtype)
+    assert df['label'].isna().sum() == 4
+    # 每一列都不同的字串欄維持字串，超出 int32 的整數維持 int64
+    assert not isinstance(df['name'].dtype, pd.CategoricalDtype)
+    assert df['big'].dtype == np.int64
+    assert df['flag'].dtype == bool
+
+
+def test_chunked_read_matches_whole_read(tmp_path, monkeypatch):
+    path = write_file(tmp_path, CSV, 'data.csv')
+    whole = read_table(path, 'data.csv')
+    monkeypatch.setattr(datasets, 'CHUNK_ROWS', 3)
+    chunked = read_table(path, 'data.csv')
+    pd.testing.assert_frame_equal(chunked, whole)
+
+
+def test_npy_round_trip_keeps_downcast_dtypes(tmp_path):
+    df = read_table(write_file(tmp_path, CSV, 'data.csv'), 'data.csv')
+    path = str(tmp_path / 'ds')
+    meta = write_dataset(df, path, 'data.csv')
+    assert meta['rows'] == 20
+    assert [info['kind'] for info in meta['columns']] == ['numeric', 'numeric', 'category', 'codes', 'numeric',
+                                                          'numeric']
+    assert np.load(os.path.join(path, 'c0.npy')).dtype == np.int32
+
+    loaded = load_dataset(path)
+    pd.testing.assert_frame_equal(loaded, df)
+
+
+def test_read_table_rejects_unknown_extension(tmp_path):
+    with pytest.raises(ValueError):
+        read_table(write_file(tmp_path, b'x', 'data.xlsx'), 'data.xlsx')
+
+
+def test_save_upload_and_ingest(tmp_path):
+    registry = DatasetRegistry(str(tmp_path / 'datasets'))
+    dataset_id, upload_path = registry.save_upload(io.BytesIO(CSV), 'a.csv')
+    # 編號只取決於副檔名與內容
+    assert registry.save_upload(io.BytesIO(CSV), 'b.CSV')[0] == dataset_id
+    assert registry.save_upload(io.BytesIO(CSV), 'a.txt')[0] != dataset_id
+    with open(upload_path, 'rb') as f:
+        assert f.read() == CSV
+
+    meta = ingest(upload_path, 'a.csv', registry.path(dataset_id))
+    assert not os.path.exists(upload_path)
+    assert registry.info(dataset_id)['rows'] == meta['rows'] == 20
+
+    # 已存在時不會重新解析 (內容不是合法的 CSV 也不影響)，暫存檔一樣刪除
+    _, other_path = registry.save_upload(io.BytesIO(b'not,a\ncsv'), 'a.csv')
+    assert ingest(other_path, 'a.csv', registry.path(dataset_id)) == meta
+    assert not os.path.exists(other_path)
+
+
+def test_registry_rejects_bad_ids(tmp_path):
+    registry = DatasetRegistry(str(tmp_path))
+    with pytest.raises(ValueError):
+        registry.path('../etc')
+
+
+def test_registry_prunes_least_recently_used(tmp_path):
+    registry = DatasetRegistry(str(tmp_path), max_bytes=0)
+    ids = []
+    for i in range(3):
+        dataset_id, upload_path = registry.save_upload(io.BytesIO(CSV + f'{i + 20},0,a,x,0,True\n'.encode()), 'a.csv')
+        ingest(upload_path, 'a.csv', registry.path(dataset_id))
+        os.utime(os.path.join(registry.path(dataset_id), 'meta.json'), (i, i))
+        ids.append(dataset_id)
+
+    registry.prune(keep=ids[0])
+    assert [registry.exists(dataset_id) for dataset_id in ids] == [True, False, False]
+    assert registry.delete(ids[0])
+    assert registry.list() == []
@@ -0,0 +1,87 @@
+# response_encoding.py 的二進位步驟格式 (AVB1)
+
+import json
+import random
+import struct
+from array import array
+
+import pytest
+
+import algorithms
+from response_encoding import BINARY_MAGIC, BINARY_STEPS_MIMETYPE, can_pack_binary, pack_sort_binary
+
+
+def unpack_sort_binary(body):
+    """依 static/script.js 的 decodeSortBinary 解開二進位格式，步驟中的空列表與缺少的欄位相同"""
+    assert body[:4] == BINARY_MAGIC
+    (header_length,) = struct.unpack('<I', body[4:8])
+    header = json.loads(body[8:8 + header_length])
+    assert header_length % 4 == 0
+    values = array('i')
+    values.frombytes(body[8 + header_length:])
+    arrays = {name: values[offset:offset + length].tolist() for name, (offset, length) in header['arrays'].items()}
+
+    def items(field, i):
+        offsets = arrays[field + '_offsets']
+        return arrays[field + '_values'][offsets[i]:offsets[i + 1]]
+
+    steps = []
+    for i in range(header['steps']):
+        step = {}
+        for field in ('writes', 'sorted_indices', 'active'):
+            flat = items(field, i)
+            if flat:
+                step[field] = [flat[k:k + 2] for k in range(0, len(flat), 2)]
+        for field in ('compared', 'swapped', 'array'):
+            if items(field, i):
+                step[field] = items(field, i)
+        if arrays['pivot'][i] >= 0:
+            step['pivot'] = arrays['pivot'][i]
+        steps.append(step)
+
+    result = {key: value for key, value in header.items() if key not in ('arrays', 'steps')}
+    result.update(original_data=arrays['original_data'], sorted_data=arrays['sorted_data'],
+                  keyframes=arrays['keyframes'], animation_steps=steps)
+    return result
+
+
+def without_empty_lists(steps):
+    return [{key: value for key, value in step.items() if value != []} for step in steps]
+
+
+@pytest.mark.parametrize('name', algorithms.SORT_ALGORITHMS)
+def test_pack_sort_binary_round_trip(name):
+    data = [random.Random(0).randint(-2 ** 31, 2 ** 31 - 1) for _ in range(40)]
+    recorder = algorithms.StepRecorder(list(data), keyframe_interval=8)
+    steps = list(algorithms.iter_sort(algorithms.SORT_ALGORITHMS[name], recorder))
+    result = {
+        'original_data': data,
+        'sorted_data': recorder.arr,
+        'time_taken': recorder.exe_time,
+        'comparisons': recorder.comparisons,
+        'swaps': recorder.swaps,
+        'keyframe_interval': recorder.keyframe_interval,
+        'keyframes': recorder.keyframes,
+        'animation_steps': steps,
+    }
+    assert can_pack_binary(data)
+    decoded = unpack_sort_binary(pack_sort_binary(result))
+    assert decoded == {**result, 'animation_steps': without_empty_lists(steps)}
+
+
+def test_can_pack_binary_only_int32():
+    assert can_pack_binary([0, -2 ** 31, 2 ** 31 - 1])
+    assert not can_pack_binary([2 ** 31])
+    assert not can_pack_binary([1.5])
+    assert not can_pack_binary([True])
+
+
+def test_sort_negotiates_binary_steps(client):
+    numbers = [5, 3, 4, 1, 2]
+    json_result = client.post('/sort', json={'numbers': numbers, 'algorithm': 'quick'}).get_json()
+    response = client.post('/sort', json={'numbers': numbers, 'algorithm': 'quick'},
+                           headers={'Accept': BINARY_STEPS_MIMETYPE})
+    assert response.mimetype == BINARY_STEPS_MIMETYPE
+    decoded = unpack_sort_binary(response.get_data())
+    assert decoded['sorted_data'] == [1, 2, 3, 4, 5]
+    assert decoded['animation_steps'] == without_empty_lists(json_result['animation_steps'])
@@ -0,0 +1,45 @@
+# scatter.py 的欄式結果與 LOD 抽樣
+
+import numpy as np
+import pandas as pd
+
+from scatter import column_values, float32_to_float64, results_payload, stratified_sample
+
+
+def test_float32_to_float64_recovers_short_decimals():
+    values = np.array([5.1, 0.0, -3.3, 1e-7, 123456.7, 1.5e20, np.nan, np.inf], dtype=np.float32)
+    converted = float32_to_float64(values)
+    assert converted.dtype == np.float64
+    assert converted[:6].tolist() == [5.1, 0.0, -3.3, 1e-7, 123456.7, 1.5e20]
+    assert np.isnan(converted[6]) and converted[7] == np.inf
+
+
+def test_column_values_maps_missing_to_none():
+    assert column_values(pd.Series([1.5, np.nan], dtype=np.float32)) == [1.5, None]
+    assert column_values(pd.Series([1, 2], dtype=np.int32)) == [1, 2]
+    assert column_values(pd.Series(['a', None], dtype='category')) == ['a', None]
+
+
+def test_stratified_sample_keeps_small_groups():
+    groups = pd.Series(['big'] * 1000 + ['small'] * 3)
+    rows = stratified_sample(groups, 100)
+    assert np.all(np.diff(rows) > 0)
+    assert 95 <= len(rows) <= 105
+    assert set(groups.iloc[rows]) == {'big', 'small'}
+
+
+def test_results_payload_lod_modes():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'x': rng.normal(size=500), 'y': rng.normal(size=500), 'cluster': rng.integers(0, 3, 500)})
+
+    full = results_payload(df, 'cluster', ['cluster'], threshold=1000)
+    assert full['lod'] is None and full['rows'] == 500
+    assert full['axes'] == ['x', 'y']
+    assert sum(full['centroids']['count']) == 500
+
+    sample = results_payload(df, 'cluster', ['cluster'], threshold=100, max_points=50)
+    assert sample['lod'] == 'sample' and sample['rows'] == len(sample['data']['x']) <= 55
+    assert sample['total_rows'] == 500
+
+    density = results_payload(df, 'cluster', ['cluster'], lod='density', max_points=50)
+    assert sum(density['density']['count']) == 500
@@ -0,0 +1,82 @@
+# sessions.py 的分群工作階段：沿用標準化結果、warm start 與附加資料列
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clustering import perform_clustering
+from sessions import ClusteringSession
+
+
+def blobs(n_per_blob=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0, 0], [8, 8], [0, 8], [8, 0]], dtype=float)
+    points = np.concatenate([center + rng.normal(size=(n_per_blob, 2)) for center in centers])
+    return pd.DataFrame(points[rng.permutation(len(points))], columns=['x', 'y'])
+
+
+def test_scaled_matrix_is_saved_and_reused(tmp_path):
+    df = blobs()
+    session = ClusteringSession(str(tmp_path / 'session'))
+    scaled, appended = session.scaled_matrix(df)
+    assert appended == 0
+    assert scaled.dtype == np.float32
+    np.testing.assert_allclose(scaled.mean(axis=0), 0, atol=1e-5)
+
+    reused, appended = ClusteringSession(str(tmp_path / 'session')).scaled_matrix(df)
+    assert appended == 0
+    assert isinstance(reused, np.memmap)
+    np.testing.assert_array_equal(reused, scaled)
+
+
+def test_appended_rows_use_parent_scaling(tmp_path):
+    df = blobs()
+    parent = ClusteringSession(str(tmp_path / 'parent'))
+    previous, _ = parent.scaled_matrix(df.iloc[:600])
+
+    child = ClusteringSession(str(tmp_path / 'child'), parent)
+    scaled, appended = child.scaled_matrix(df)
+    assert appended == 200
+    np.testing.assert_array_equal(scaled[:600], previous)
+    # 新資料列以父資料集的平均值與標準差標準化，而不是重新計算
+    mean, std = df.iloc[:600].mean().to_numpy(), df.iloc[:600].std(ddof=0).to_numpy()
+    np.testing.assert_allclose(scaled[600:], (df.iloc[600:].to_numpy() - mean) / std, rtol=1e-4, atol=1e-5)
+
+
+def test_nearest_centers(tmp_path):
+    session = ClusteringSession(str(tmp_path / 'session'))
+    assert session.nearest_centers(3) is None
+    session.scaled_matrix(blobs())
+    session.save_fit(2, np.zeros((2, 2)), np.array([0, 1, 1]))
+    session.save_fit(4, np.zeros((4, 2)), np.array([0, 1, 2, 3]))
+    k, centers, counts = session.nearest_centers(3)
+    assert k == 4 and centers.shape == (4, 2)
+    assert counts.tolist() == [1, 1, 1, 1]
+    assert session.centers(3) is None
+
+
+def test_warm_start_from_previous_fit(tmp_path):
+    session = ClusteringSession(str(tmp_path / 'session'))
+    first = perform_clustering(blobs(), n_clusters=4, engine='full', session=session)
+    assert first['warm_start'] is None
+
+    again = perform_clustering(blobs(), n_clusters=4, engine='full', session=session)
+    assert again['warm_start'] == 'same_k'
+    assert again['iterations'] <= first['iterations']
+    assert again['inertia'] == pytest.approx(first['inertia'], rel=1e-3)
+
+    assert perform_clustering(blobs(), n_clusters=5, engine='full', session=session)['warm_start'] == 'grown'
+    assert perform_clustering(blobs(), n_clusters=3, engine='full', session=session)['warm_start'] == 'shrunk'
+
+
+def test_append_updates_centers_without_refitting(tmp_path):
+    df = blobs()
+    parent = ClusteringSession(str(tmp_path / 'parent'))
+    fitted = perform_clustering(df.iloc[:600].copy(), n_clusters=4, engine='full', session=parent)
+
+    child = ClusteringSession(str(tmp_path / 'child'), parent)
+    result = perform_clustering(df.copy(), n_clusters=4, engine='full', session=child)
+    assert result['warm_start'] == 'appended'
+    # 前面的資料列仍在同一群
+    np.testing.assert_array_equal(result['results_df']['cluster'].to_numpy()[:600],
+                                  fitted['results_df']['cluster'].to_numpy())
@@ -0,0 +1,81 @@
+# workers.py 的 /race 工作：在目前的行程中直接呼叫 run_job
+
+import threading
+import time
+
+import pytest
+
+import workers
+
+DATA = list(range(300, 0, -1))
+
+
+class FlagAfter:
+    """前 n 次 is_set() 回傳 False，之後回傳 True，模擬排序進行中才被取消"""
+
+    def __init__(self, n):
+        self.calls = 0
+        self.n = n
+
+    def is_set(self):
+        self.calls += 1
+        return self.calls > self.n
+
+
+@pytest.mark.parametrize('record', [True, False])
+def test_run_job_sorts(record):
+    result = workers.run_job('merge', DATA, {}, record, None, None, 10.0, threading.Event())
+    assert result['status'] == 'ok'
+    assert result['sorted_data'] == sorted(DATA)
+    assert ('animation_steps' in result) == record
+
+
+def test_run_job_cancelled_before_start():
+    event = threading.Event()
+    event.set()
+    assert workers.run_job('bubble', DATA, {}, True, None, None, 10.0, event) == {'algorithm': 'bubble', 'status': 'cancelled'}
+
+
+@pytest.mark.parametrize('record', [True, False])
+@pytest.mark.parametrize('name', ['bubble', 'quick', 'heap'])
+def test_run_job_cancelled_while_sorting(name, record):
+    # 只計數的模式沒有步驟產生器，取消旗標由 recorder 的定期檢查處理
+    flag = FlagAfter(1)
+    result = workers.run_job(name, DATA, {}, record, None, None, 10.0, flag)
+    assert result['status'] == 'cancelled'
+    assert flag.calls == 2
+    assert 'sorted_data' not in result
+
+
+@pytest.mark.parametrize('record', [True, False])
+def test_run_job_timeout(record):
+    result = workers.run_job('bubble', DATA, {}, record, None, None, 1e-9, threading.Event())
+    assert result['status'] == 'timeout'
+
+
+@pytest.mark.parametrize('record', [True, False])
+def test_run_job_step_ceiling(record):
+    result = workers.run_job('bubble', DATA, {}, record, None, 1000, 10.0, threading.Event())
+    assert result['status'] == 'steps'
+
+
+def test_submit_parallel_uses_idle_workers(monkeypatch):
+    # max(0, n_jobs) 直接回傳 submit_parallel 附加的 n_jobs
+    seen = []
+    monkeypatch.setattr(workers, '_job_parallelism', None)
+    future = workers.submit_parallel(max, 0)
+    seen.append(future.result())
+    # 已佔用的名額不算閒置；有上限時不超過上限
+    workers.acquire(workers.stats()['workers'])
+    try:
+        seen.append(workers.submit_parallel(max, 0).result())
+    finally:
+        workers.release(workers.stats()['workers'])
+    monkeypatch.setattr(workers, '_job_parallelism', 1)
+    seen.append(workers.submit_parallel(max, 0).result())
+    assert seen == [workers.stats()['workers'], 1, 1]
+    for _ in range(100):
+        if workers.stats()['in_use'] == 0:
+            break
+        time.sleep(0.01)
+    assert workers.stats()['in_use'] == 0
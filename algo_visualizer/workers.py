@@ -0,0 +1,413 @@
+# workers.py
+#
+# CPU 密集的工作 (排序、分群與分類) 交給有上限的行程池 (process pool) 執行，不佔用處理請求的執行緒。
+# 執行中加上等待中的工作數有上限，滿了就拒絕新的請求 (Overloaded，對應 HTTP 429)；
+# 排序工作另有步驟數與時間上限 (algorithms.BudgetExceeded)，失控的排序會自行中止。
+#
+# /race 也使用同一個行程池，在同一組輸入上同時比較多種演算法：
+# 每個工作都有期限，並由 recorder 定期檢查共用的取消旗標；總延遲取決於最慢的演算法，而不是總和。
+
+import gzip
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, CancelledError, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from multiprocessing import Manager
+
+from algorithms import SORT_ALGORITHMS, BudgetExceeded, make_recorder, collect_steps
+from complexity import ALGORITHM_COMPLEXITY, measure_complexity, estimate_operations, get_complexity_type
+from cache import compress_json
+from response_encoding import pack_sort_binary
+from clustering import perform_clustering, perform_classification
+from datasets import ingest, load_dataset, parent_path
+from sessions import ClusteringSession, NeighborIndexStore
+from scatter import results_payload
+
+# 工作本身會在期限到時中止；主行程多等這麼多秒後仍沒有結果，才視為逾時
+RESULT_GRACE = 2.0
+
+
+class Overloaded(Exception):
+    """行程池與等待佇列都已滿"""
+
+
+# ==================================
+# -------------工作內容--------------
+# ==================================
+# 以下函式在工作行程中執行，參數與回傳值都必須可以 pickle。
+
+def prepare_recorder(algorithm_name, numbers, options, record, keyframe_interval=None, max_frames=None):
+    """建立 recorder；有影格預算時以量測到的成長階數預估原始步驟數，決定每隔幾步保留一個影格"""
+    expected_steps = None
+    if record and max_frames:
+        expected_steps = estimate_operations(measure_complexity(algorithm_name, numbers, options), len(numbers))
+    return make_recorder(numbers, record, keyframe_interval, max_frames, expected_steps)
+
+
+def sort_job(algorithm_name, numbers, options, record, keyframe_interval, max_frames, binary, max_steps, timeout):
+    """
+    執行一次 /sort：排序、量測複雜度並序列化成 gzip 壓縮的回應本文。
+
+    在工作行程中就完成序列化，主行程只需要轉送 (與快取) 壓縮後的位元組。
+    超過 max_steps 或 timeout 時丟出 BudgetExceeded。
+    """
+    recorder = prepare_recorder(algorithm_name, numbers, options, record, keyframe_interval, max_frames)
+    recorder.limit(max_steps, timeout)
+    animation_steps = collect_steps(SORT_ALGORITHMS[algorithm_name], recorder, **options)
+
+    # 以同分佈的輸入實際量測成長階數，而不是只看這一次的比較次數
+    complexity_fit = measure_complexity(algorithm_name, numbers, options)
+    result_json = {
+        'time_taken': recorder.exe_time,
+        'time_complexity_type': get_complexity_type(algorithm_name, complexity_fit),
+        'time_complexity_fit': complexity_fit,
+        'space_complexity': ALGORITHM_COMPLEXITY.get(algorithm_name, {}).get('space'),
+        'comparisons': recorder.comparisons,
+        'swaps': recorder.swaps,
+    }
+    if not record:
+        # 量測用的輸入可能非常大，不回傳原始與排序後的陣列
+        result_json = {'n': len(numbers), **result_json}
+    else:
+        result_json = {
+            'original_data': numbers,
+            'sorted_data': recorder.arr,
+            **result_json,
+            'animation_steps': animation_steps,
+            # 關鍵影格索引：帶有完整陣列快照的步驟編號，前端據此跳到任意一步
+            'keyframe_interval': recorder.keyframe_interval,
+            'keyframes': recorder.keyframes,
+        }
+        if max_frames:
+            result_json['max_frames'] = max_frames
+            result_json['dropped_steps'] = recorder.dropped
+
+    if binary:
+        return gzip.compress(pack_sort_binary(result_json), compresslevel=6)
+    return compress_json(result_json)
+
+
+# /analyze 的各階段，依序回報給輪詢工作狀態的用戶端
+ANALYZE_STAGES = ('parse', 'scale', 'fit', 'serialize')
+
+
+def analyze_job(dataset_path, upload_path, filename, analysis_type, options, lod='auto', progress=None, n_jobs=1):
+    """
+    執行一次 /analyze：讀取資料集、分群或分類，並序列化成 gzip 壓縮的回應本文。
+
+    Args:
+        dataset_path (str): 資料集目錄 (datasets.DatasetRegistry.path)
+        upload_path (str): 上傳檔案的暫存檔，資料集還沒有存放時先解析並存入；使用既有資料集時為 None
+        options (dict): 分群為 perform_clustering 的參數 (n_clusters、engine、max_iter、tol、k_max)；
+                        分類為 {'target_field': 目標欄位} 加上 perform_classification 的參數
+                        (classifier、n_neighbors、return_neighbors、tune、cv_folds)
+        lod (str): 結果資料列的 LOD 模式 (scatter.LOD_MODES)
+        progress: Manager().dict()，進入各階段時把 'stage' 設為 ANALYZE_STAGES 之一，可省略
+        n_jobs (int): 工作內部平行計算的行程數 (由 submit_parallel 決定)
+    """
+    def report(stage):
+        if progress is not None:
+            progress['stage'] = stage
+
+    report('parse')
+    if upload_path is not None:
+        ingest(upload_path, filename, dataset_path)
+    df = load_dataset(dataset_path)
+
+    if analysis_type == 'clustering':
+        # 同一個資料集的分群共用一個工作階段：沿用標準化結果，並以上一次的中心點為起點
+        parent = parent_path(dataset_path)
+        session = ClusteringSession(os.path.join(dataset_path, 'session'),
+                                    ClusteringSession(os.path.join(parent, 'session')) if parent else None)
+        result = perform_clustering(df, session=session, n_jobs=n_jobs, progress=report, **options)
+        report('serialize')
+        return compress_json({
+            'analysis_type': 'clustering',
+            # 欄式的結果資料列，資料列很多時只回傳抽樣或分箱密度
+            # 'animated' 引擎另附每次迭代的動畫影格
+            'results': results_payload(result.pop('results_df'), 'cluster', ['cluster'], lod,
+                                       frames=result.pop('frames', None)),
+            # 實際使用的引擎、群集數、訓練時間 (秒)、inertia、迭代次數與 warm start 的來源
+            **result,
+        })
+
+    # K 鄰居的空間索引依資料集保存，同一個資料集只建立一次
+    options = dict(options)
+    target_field = options.pop('target_field')
+    index_store = NeighborIndexStore(os.path.join(dataset_path, 'knn'))
+    result_data = perform_classification(df, target_field, index_store=index_store, n_jobs=n_jobs, progress=report,
+                                         **options)
+    report('serialize')
+    response = {
+        'analysis_type': 'classification',
+        # 這裡直接傳回浮點數，由前端負責格式化，這樣更靈活
+        'accuracy': result_data['accuracy'],
+        # 各預測類別的列數 (全部資料列)
+        'class_distribution': result_data['class_distribution'],
+        # 與分群的回傳資料結構保持一致，方便前端處理
+        'results': results_payload(result_data['results_df'], 'predicted_class',
+                                   ['is_train', 'predicted_class', target_field], lod,
+                                   neighbors=result_data.get('neighbors')),
+        # 使用的分類器與訓練 (含預測) 時間 (秒)
+        'classifier': result_data['classifier'],
+        'fit_time': result_data['fit_time'],
+    }
+    # K 鄰居的索引資訊、交叉驗證調參的結果
+    for name in ('knn', 'cv'):
+        if name in result_data:
+            response[name] = result_data[name]
+    return compress_json(response)
+
+
+def run_job(algorithm_name, numbers, options, record, max_frames, max_steps, timeout, cancel_event):
+    """
+    /race 的單一演算法 (由行程池呼叫)。
+
+    Args:
+        max_steps (int): 步驟數上限，超過時中止
+        timeout (float): 從工作開始執行起算的期限 (秒)，超過時中止
+        cancel_event: Manager().Event()，被設定時中止
+
+    Returns:
+        dict: 該演算法的計數、時間與動畫步驟；中止時 status 為 'timeout'、'steps' 或 'cancelled'
+    """
+    if cancel_event.is_set():
+        return {'algorithm': algorithm_name, 'status': 'cancelled'}
+
+    recorder = prepare_recorder(algorithm_name, numbers, options, record, None, max_frames)
+    # 上限、期限與取消旗標都由 recorder 定期檢查，只計數的模式也一樣
+    recorder.limit(max_steps, timeout, cancel_event.is_set)
+
+    start_time = time.perf_counter()
+    try:
+        steps = collect_steps(SORT_ALGORITHMS[algorithm_name], recorder, **options)
+    except BudgetExceeded as e:
+        return {
+            'algorithm': algorithm_name,
+            'status': e.reason,
+            'elapsed': (time.perf_counter() - start_time) * 1000000,
+            'comparisons': recorder.comparisons,
+            'swaps': recorder.swaps,
+        }
+
+    result = {
+        'algorithm': algorithm_name,
+        'status': 'ok',
+        'sorted_data': recorder.arr,
+        'time_taken': recorder.exe_time,
+        'comparisons': recorder.comparisons,
+        'swaps': recorder.swaps,
+    }
+    if record:
+        result.update({
+            'animation_steps': steps,
+            'keyframe_interval': recorder.keyframe_interval,
+            'keyframes': recorder.keyframes,
+            'dropped_steps': getattr(recorder, 'dropped', 0),
+        })
+    return result
+
+
+# ==================================
+# -----------行程池與准入-------------
+# ==================================
+
+_pool = None
+_pool_size = 0
+_queue_limit = 8
+_job_parallelism = None
+_manager = None
+_slots_used = 0
+_races = {}  # race id -> Race，供取消使用
+_lock = threading.Lock()
+
+
+def configure(max_workers=None, queue_limit=8, job_parallelism=None):
+    """
+    設定行程數 (None 為 CPU 核心數)、等待佇列上限，以及每個分析工作內部平行使用的行程數上限
+    (None 為不設上限，見 submit_parallel)；行程池在第一次使用時才建立。
+    """
+    global _pool_size, _queue_limit, _job_parallelism
+    with _lock:
+        _pool_size = max_workers or os.cpu_count() or 1
+        _queue_limit = queue_limit
+        _job_parallelism = job_parallelism
+
+
+def get_pool():
+    global _pool, _pool_size, _manager
+    with _lock:
+        if _pool is None:
+            _pool_size = _pool_size or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(max_workers=_pool_size)
+            _manager = Manager()
+        return _pool
+
+
+def acquire(count=1):
+    """
+    取得 count 個執行名額，不足時丟出 Overloaded。
+    執行中加上等待中的工作數上限為行程數 + 佇列上限；用完以 release(count) 歸還。
+    """
+    global _slots_used
+    get_pool()
+    with _lock:
+        if _slots_used + count > _pool_size + _queue_limit:
+            raise Overloaded()
+        _slots_used += count
+
+
+def release(count=1):
+    global _slots_used
+    with _lock:
+        _slots_used -= count
+
+
+def submit(fn, *args):
+    """在准入控制下把工作送進行程池；名額在工作結束 (含取消) 時歸還"""
+    acquire()
+    try:
+        future = get_pool().submit(fn, *args)
+    except Exception:
+        release()
+        raise
+    future.add_done_callback(lambda _: release())
+    return future
+
+
+def submit_parallel(fn, *args):
+    """
+    與 submit 相同，但工作內部可以再平行計算 (joblib 的 n_jobs)，n_jobs 附加為 fn 的最後一個參數。
+
+    n_jobs 取送出當下閒置的行程數 (不超過 job_parallelism 的上限，至少為 1)，
+    並以 n_jobs 個名額計入准入控制，直到工作結束；行程池忙碌時工作就只用自己的行程。
+    """
+    global _slots_used
+    get_pool()
+    with _lock:
+        if _slots_used + 1 > _pool_size + _queue_limit:
+            raise Overloaded()
+        n_jobs = max(1, min(_pool_size - _slots_used, _job_parallelism or _pool_size))
+        _slots_used += n_jobs
+    try:
+        future = get_pool().submit(fn, *args, n_jobs)
+    except Exception:
+        release(n_jobs)
+        raise
+    future.add_done_callback(lambda _: release(n_jobs))
+    return future
+
+
+def shared_dict():
+    """建立可在工作行程中寫入、主行程讀取的字典 (例如回報進度)"""
+    get_pool()
+    return _manager.dict()
+
+
+def stats():
+    with _lock:
+        return {
+            'workers': _pool_size,
+            'queue_limit': _queue_limit,
+            'job_parallelism': _job_parallelism,
+            'in_use': _slots_used,
+            'races': len(_races),
+        }
+
+
+class Race:
+    """一次 /race 請求：每個演算法一個 future，共用同一個取消旗標"""
+
+    def __init__(self, cancel_event, wait_timeout):
+        self.id = uuid.uuid4().hex
+        self.cancel_event = cancel_event
+        self.wait_timeout = wait_timeout  # 主行程等待全部結果的上限
+        self.futures = {}  # future -> 演算法名稱
+
+    def cancel(self):
+        """取消尚未開始的工作，並通知執行中的工作中止"""
+        self.cancel_event.set()
+        for future in self.futures:
+            future.cancel()
+
+    def results(self):
+        """
+        依完成順序產生各演算法的結果。
+
+        生成器被提早關閉 (例如用戶端中斷串流) 時會取消剩下的工作。
+        """
+        pending = set(self.futures)
+        try:
+            for future in as_completed(self.futures, timeout=self.wait_timeout):
+                pending.discard(future)
+                algorithm_name = self.futures[future]
+                try:
+                    yield future.result()
+                except CancelledError:
+                    yield {'algorithm': algorithm_name, 'status': 'cancelled'}
+                except Exception as e:
+                    yield {'algorithm': algorithm_name, 'status': 'error', 'error': str(e)}
+        except FuturesTimeoutError:
+            # 工作行程沒有在期限內回應 (例如還在佇列中)
+            for future in pending:
+                yield {'algorithm': self.futures[future], 'status': 'timeout'}
+        finally:
+            if pending:
+                self.cancel()
+            _races.pop(self.id, None)
+
+
+def start_race(algorithms, numbers, options, timeout, record=True, max_frames=None, max_steps=None):
+    """
+    把每個演算法送進行程池，立即回傳 Race；以 race.results() 取得結果。
+    名額不足以同時容納所有演算法時丟出 Overloaded。
+
+    Args:
+        algorithms (list): SORT_ALGORITHMS 的鍵
+        options (dict): {演算法: 額外選項}，例如 {'quick': {'pivot': 'median3'}}
+        timeout (float): 每個工作的期限 (秒)，從該工作開始執行時起算
+        max_steps (int): 每個工作的步驟數上限
+    """
+    acquire(len(algorithms))
+    submitted = 0
+    race = None
+    try:
+        pool = get_pool()
+        # 工作數多於行程數時要分批執行，主行程的等待上限以批數計算
+        batches = -(-len(algorithms) // _pool_size)
+        race = Race(_manager.Event(), timeout * batches + RESULT_GRACE)
+
+        for algorithm_name in algorithms:
+            future = pool.submit(run_job, algorithm_name, list(numbers), options.get(algorithm_name, {}),
+                                 record, max_frames, max_steps, timeout, race.cancel_event)
+            submitted += 1
+            future.add_done_callback(lambda _: release())
+            race.futures[future] = algorithm_name
+    except Exception:
+        # 已送出的工作在結束時各自歸還名額 (並要求它們中止)，其餘的名額在這裡歸還
+        if race is not None:
+            race.cancel_event.set()
+        release(len(algorithms) - submitted)
+        raise
+    _races[race.id] = race
+    return race
+
+
+def cancel_race(race_id):
+    """取消進行中的 race；找不到 (已結束或不存在) 時回傳 False"""
+    race = _races.get(race_id)
+    if race is None:
+        return False
+    race.cancel()
+    return True
+
+
+def shutdown():
+    global _pool, _manager
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _manager.shutdown()
+            _pool = _manager = None